@@ -1,84 +1,176 @@
 from flask import Flask 
 from config import Config
 from flask_sqlalchemy import SQLAlchemy
-from flask_migrate import Migrate
 from flask_login import LoginManager
+import importlib
 import logging
-from logging.handlers import SMTPHandler
 from logging.handlers import RotatingFileHandler
 import os
-app = Flask(__name__)
+import threading
+from app.engine import engine_options, tune_engine
+from app.replicas import ReplicaRouter, RoutingSession, replica_binds
+
+# The extensions are created here without an application and attached to one in create_app() with init_app(). That way importing the app package is cheap (no database engine, no log files, no routes), the same extension objects work for any number of apps (e.g. one per test with a different config), and a server like gunicorn can build the app once in its master process and fork workers from it (see gunicorn.conf.py).
+login = LoginManager()
+login.login_view = 'main.login'
+# for implementing features such as allowing access to a page ONLY when logged in, and redirecting to the login in view funtion if not , flask needs to know what is the view function that handles login. The above line is for that purpose. Views now live in the 'main' blueprint, hence the 'main.' prefix.
+login.blueprint_login_views['api'] = None
+# the JSON API answers 401 instead of redirecting to the login form (see app/api.py)
+db = SQLAlchemy(session_options={'class_': RoutingSession})
+# This line creates the Flask-SQLAlchemy extension; create_app() connects it to the app's database. db.session sends the SELECTs of read-only views to a read replica when there are any (see app/replicas.py).
+replicas = ReplicaRouter()
+# picks a read replica for each read-only request and keeps track of how far behind each one is (see app/replicas.py)
+
+# The rest of the extensions are only imported and created the first time something asks for them (`from app import presence`, or create_app(), which asks for all of them), so `import app` costs Flask, SQLAlchemy and Flask-Login and none of the feature modules, Alembic or the async driver. The same object is returned every time after that. tests/test_startup.py keeps it that way.
+_LAZY_EXTENSIONS = {
+    'migrate': ('flask_migrate', 'Migrate'),
+    # `flask db` migrations; importing Alembic alone takes longer than the rest of the package
+    'sql_instrumentation': ('app.instrumentation', 'SQLInstrumentation'),
+    # counts and times the SQL statements of every request and logs slow ones (see app/instrumentation.py)
+    'template_instrumentation': ('app.instrumentation', 'TemplateInstrumentation'),
+    # times every template a request renders and logs slow ones (see app/instrumentation.py)
+    'presence': ('app.presence', 'PresenceTracker'),
+    # keeps users' last_seen times in memory and writes them to the database in one batch per PRESENCE_FLUSH_INTERVAL (see app/presence.py)
+    'password_verifier': ('app.passwords', 'PasswordVerifier'),
+    # checks login passwords on a small dedicated thread pool so a burst of logins can't tie up every worker (see app/passwords.py)
+    'avatar_cache': ('app.avatars', 'AvatarCache'),
+    # rendered identicon PNGs, kept in memory and on disk (see app/avatars.py)
+    'fragment_cache': ('app.fragments', 'FragmentCache'),
+    # caches the HTML of each rendered post; templates use render_post(post) instead of including _post.html (see app/fragments.py)
+    'template_cache': ('app.templating', 'TemplateCache'),
+    # keeps compiled templates on disk so workers and restarts don't compile them again (see app/templating.py)
+    'search_index': ('app.search', 'SearchIndex'),
+    # full-text index of post bodies, kept in its own SQLite FTS5 file by default (see app/search.py)
+    'rate_limiter': ('app.ratelimit', 'RateLimiter'),
+    # token buckets behind the @rate_limit decorator on login and register (see app/ratelimit.py)
+    'post_ingester': ('app.ingest', 'PostIngester'),
+    # queues new posts and commits them in batches from one writer thread (see app/ingest.py)
+    'identity_cache': ('app.identity', 'IdentityCache'),
+    # recently seen logged-in users, so load_user() usually doesn't need a query (see app/identity.py)
+    'server_sessions': ('app.sessions', 'ServerSessions'),
+    # keeps session data in a local store instead of the cookie when SESSION_BACKEND is set (see app/sessions.py)
+    'taken_names': ('app.names', 'TakenNames'),
+    # Bloom filter of taken usernames and emails, so availability checks rarely need a query (see app/names.py)
+    'async_db': ('app.async_db', 'AsyncDatabase'),
+    # AsyncSession factory for the async views served through asgi.py; unused otherwise (see app/async_db.py)
+}
+_lazy_lock = threading.RLock()
+# reentrant: importing one extension's module can ask for another one (app/models.py wants identity_cache)
+
+
+def __getattr__(name):
+    # only called for names the module doesn't have yet (PEP 562)
+    if name not in _LAZY_EXTENSIONS:
+        raise AttributeError(f'module {__name__!r} has no attribute {name!r}')
+    with _lazy_lock:
+        if name not in globals():
+            module, class_name = _LAZY_EXTENSIONS[name]
+            extension = getattr(importlib.import_module(module), class_name)()
+            globals()[name] = extension
+            # stored after the import: importing app.presence sets the package's `presence` attribute to the module itself
+        return globals()[name]
+
+
+def create_app(config_class=Config):
+    app = Flask(__name__)
+    # The __name__ variable passed to the Flask class is a Python predefined variable, which is set to the name of the module in which it is used.
+    app.config.from_object(config_class)
+    from app import (migrate, sql_instrumentation, template_instrumentation, presence, password_verifier,
+                     avatar_cache, fragment_cache, template_cache, search_index, rate_limiter, post_ingester,
+                     identity_cache, server_sessions, taken_names, async_db)
+    from app import models
+    from app import counters
+    # registers the session hook that keeps User.post_count / last_post_at current (see app/counters.py)
+
+    app.config['SQLALCHEMY_ENGINE_OPTIONS'] = {**engine_options(app.config), **app.config['SQLALCHEMY_ENGINE_OPTIONS']}
+    # pool settings for server databases / lock timeout for SQLite, unless config.py overrides them (see app/engine.py)
+    app.config['SQLALCHEMY_BINDS'] = {**app.config['SQLALCHEMY_BINDS'], **replica_binds(app.config)}
+    # every read replica is one more bind, so it gets an engine (and the tuning below) like the main database
+    db.init_app(app)
+    with app.app_context():
+        for engine in db.engines.values():
+            tune_engine(engine, app.config)
+    # every new SQLite connection gets the WAL / synchronous / busy_timeout / mmap_size pragmas (the archive database too, if it is a separate one)
+    migrate.init_app(app, db)
+    login.init_app(app)
+    sql_instrumentation.init_app(app, db)
+    template_instrumentation.init_app(app)
+    presence.init_app(app)
+    password_verifier.init_app(app)
+    avatar_cache.init_app(app)
+    template_cache.init_app(app)
+    fragment_cache.init_app(app)
+    search_index.init_app(app)
+    rate_limiter.init_app(app)
+    post_ingester.init_app(app)
+    identity_cache.init_app(app)
+    server_sessions.init_app(app)
+    taken_names.init_app(app)
+    async_db.init_app(app)
+    replicas.init_app(app)
+
+    # the views are only imported here, when an app is actually built
+    from app.errors import bp as errors_bp
+    app.register_blueprint(errors_bp)
+    from app.routes import bp as main_bp
+    app.register_blueprint(main_bp)
+    from app.api import bp as api_bp
+    app.register_blueprint(api_bp)
+
+    if not app.debug and not app.testing:#check means this logging code only runs in production (when app.debug is False).
+        from app.log_pipeline import BackgroundQueueHandler, DigestMailHandler
+        handlers = []
+        if app.config['MAIL_SERVER']:
+            auth=None
+            if app.config['MAIL_USERNAME'] or app.config['MAIL_PASSWORD']:
+                auth=(app.config['MAIL_USERNAME'], app.config['MAIL_PASSWORD'])
+            secure =None
+            if app.config['MAIL_USE_TLS']:
+                secure=()
+            mail_handler = DigestMailHandler(mailhost=(app.config['MAIL_SERVER'], app.config['MAIL_PORT']),
+                fromaddr='no-reply@' + app.config['MAIL_SERVER'],
+                toaddrs=app.config['ADMINS'], subject='Microblog Failure',
+                credentials=auth, secure=secure,
+                interval=app.config['LOG_MAIL_DIGEST_INTERVAL'], max_errors=app.config['LOG_MAIL_MAX_ERRORS'])
+            mail_handler.setFormatter(logging.Formatter(
+                '%(asctime)s %(levelname)s: %(message)s [in %(pathname)s:%(lineno)d]'
+            ))
+            mail_handler.setLevel(logging.ERROR)
+            handlers.append(mail_handler)
+    #  But in essence, the code above creates a mail handler, sets its level so that it only reports errors and not warnings, informational or debugging messages. Unlike logging's SMTPHandler it doesn't send one email per error: identical errors are counted and sent together in a digest every LOG_MAIL_DIGEST_INTERVAL seconds (see app/log_pipeline.py).
+
+    # In Python’s logging module, a handler is something that decides where the log messages go.
+    # For example:
+    # Console output? Use StreamHandler
+    # File? Use FileHandler
+    # Rotating file? Use RotatingFileHandler
+    # Email? Use SMTPHandler (here: DigestMailHandler)
+    # Another thread? Use QueueHandler
+
+        if not os.path.exists('logs'):
+            os.mkdir('logs')
+        file_handler = RotatingFileHandler('logs/microblog.log', maxBytes=10240, backupCount=10)
+        # A tool that writes log messages to a file (microblog.log) and "rotates" (i.e when the log file meets the maxbytes storage, it makes another file and the old one is archived and max upto 10 old files are kept and rest are discarded) it when it gets too big,creating backups.After some activity, you’ll see microblog/logs/microblog.log (current logs) and backups like microblog.log.1 if the file exceeds 10KB.
+        file_handler.setFormatter(logging.Formatter(
+            '%(asctime)s %(levelname)s: %(message)s [in %(pathname)s:%(lineno)d]'
+        ))
+        # choosnig the format of logs.
+        file_handler.setLevel(logging.INFO)
+        # The logger decides what messages the app generates, and the handler decides what messages get written to the file. Setting both ensures only INFO and higher-level messages (e.g., WARNING, ERROR) are logged to microblog.log.
+        handlers.append(file_handler)
+        app.logger.addHandler(BackgroundQueueHandler(handlers))
+        # Flask provides a built-in “logger” (like a diary keeper) for your app to record events. app.logger is where you send messages to be logged.
+        # The file and mail handlers are not attached to app.logger directly: app.logger only gets a QueueHandler, which puts each message on a queue and returns immediately, and a background thread passes them on to the file and the mail server. A request that logs an error never waits for the disk or for SMTP.
+        # Why?:
+        # Connects the logging system to the file, so all app.logger messages (e.g., app.logger.info("Message")) go to microblog.log.
+        app.logger.setLevel(logging.INFO)
+        app.logger.info('Microblog startup')
+    #    app.logger.setLevel(logging.INFO): Sets the app’s logger to record INFO and higher-level messages, matching the file handler’s level.
+    #    app.logger.info('Microblog startup'): Writes a message to the log file when the app starts, marking the event. 
+
+    # Logger (app.logger): The Flask app’s “diary keeper” that collects all log messages (e.g., “app started” or “user logged in”). It decides which messages are important enough to process based on its level (e.g., INFO).
+
+    # Handler (file_handler): A tool that decides where to send log messages (e.g., to microblog.log). It also has a level to filter which messages it writes to the file.
+
+    return app
 
-app.config.from_object(Config)
-login = LoginManager(app)
-login.login_view = 'login'
-# for implementing features such as allowing access to a page ONLY when logged in, and redirecting to the login in view funtion if not , flask needs to know what is the view function that handles login. The above line is for that purpose. 
-db = SQLAlchemy(app)
-# This line initializes the Flask-SQLAlchemy extension and connects your Flask app to a database.
-migrate = Migrate(app, db)
-
-from app import routes , models, errors
-# this is the app variable defined in this script.
-# The script above creates the application object as an instance of class Flask imported from the flask package. The __name__ variable passed to the Flask class is a Python predefined variable, which is set to the name of the module in which it is used.
-
-if not app.debug:#check means this logging code only runs in production (when app.debug is False).
-    if app.config['MAIL_SERVER']:
-        auth=None
-        if app.config['MAIL_USERNAME'] or app.config['MAIL_PASSWORD']:
-            auth=(app.config['MAIL_USERNAME'], app.config['MAIL_PASSWORD'])
-        secure =None
-        if app.config['MAIL_USE_TLS']:
-            secure=()
-        mail_handler = SMTPHandler(mailhost=(app.config['MAIL_SERVER'], app.config['MAIL_PORT']),
-            fromaddr='no-reply@' + app.config['MAIL_SERVER'],
-            toaddrs=app.config['ADMINS'], subject='Microblog Failure',
-            credentials=auth, secure=secure)
-        mail_handler.setLevel(logging.ERROR)
-        app.logger.addHandler(mail_handler)
-#  But in essence, the code above creates a SMTPHandler instance, sets its level so that it only reports errors and not warnings, informational or debugging messages, and finally attaches it to the app.logger object from Flask.
-
-# In Python’s logging module, a handler is something that decides where the log messages go.
-# For example:
-# Console output? Use StreamHandler
-# File? Use FileHandler
-# Rotating file? Use RotatingFileHandler
-# Email? Use SMTPHandler
-
-    if not os.path.exists('logs'):
-        os.mkdir('logs')
-    file_handler = RotatingFileHandler('logs/microblog.log', maxBytes=10240, backupCount=10)
-    # A tool that writes log messages to a file (microblog.log) and "rotates" (i.e when the log file meets the maxbytes storage, it makes another file and the old one is archived and max upto 10 old files are kept and rest are discarded) it when it gets too big,creating backups.After some activity, you’ll see microblog/logs/microblog.log (current logs) and backups like microblog.log.1 if the file exceeds 10KB.
-    file_handler.setFormatter(logging.Formatter(
-        '%(asctime)s %(levelname)s: %(message)s [in %(pathname)s:%(lineno)d]'
-    ))
-    # choosnig the format of logs.
-    file_handler.setLevel(logging.INFO)
-    # The logger decides what messages the app generates, and the handler decides what messages get written to the file. Setting both ensures only INFO and higher-level messages (e.g., WARNING, ERROR) are logged to microblog.log.
-    app.logger.addHandler(file_handler)
-    # Flask provides a built-in “logger” (like a diary keeper) for your app to record events. app.logger is where you send messages to be logged.
-    # Attaches the RotatingFileHandler to app.logger, telling Flask to write log messages to microblog.log (in addition to any other handlers, like the email handler for errors).
-    # we create a rotating file source first (logs/microblog.log), specify its format, its level and then add it to the built in flask logger app.logger.
-    # Why?:
-    # Connects the logging system to the file, so all app.logger messages (e.g., app.logger.info("Message")) go to microblog.log.
-    app.logger.setLevel(logging.INFO)
-    app.logger.info('Microblog startup')
-#    app.logger.setLevel(logging.INFO): Sets the app’s logger to record INFO and higher-level messages, matching the file handler’s level.
-#    app.logger.info('Microblog startup'): Writes a message to the log file when the app starts, marking the event. 
-
-# Logger (app.logger): The Flask app’s “diary keeper” that collects all log messages (e.g., “app started” or “user logged in”). It decides which messages are important enough to process based on its level (e.g., INFO).
-
-# Handler (file_handler): A tool that decides where to send log messages (e.g., to microblog.log). It also has a level to filter which messages it writes to the file.
-
-
-
-
-
-
-
-
-
-
-
-
-
-from app import routes, models, errors
\ No newline at end of file
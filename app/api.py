@@ -0,0 +1,241 @@
+# Versioned JSON API (/api/v1), so clients don't have to scrape the HTML pages.
+# - GET /api/v1/users/<username>                a user's profile
+# - GET /api/v1/users/<username>/posts          a page of their posts, newest first
+# - GET /api/v1/users/<username>/posts/export   all of their posts (archived ones too) in one response
+# - GET /api/v1/feed                            a page of the logged-in user's home timeline
+# Every endpoint needs a logged-in session, like the pages do; without one the answer is a 401 with a
+# JSON body instead of a redirect to the login form.
+# - pages use the same keyset cursors as the HTML pages (app/feed.py): pass the returned next_cursor
+#   as ?cursor= to get the following page; ?limit= picks the page size (up to API_MAX_PAGE_SIZE)
+# - ?fields=id,body picks which fields each object has, to keep payloads small
+# - responses are generated piece by piece and sent as they are produced, so exporting a user with a
+#   million posts holds one batch of API_EXPORT_BATCH rows in memory, not a million objects
+# - bodies are compressed with brotli or gzip, whichever the client accepts (brotli only when the
+#   optional brotli package is installed)
+# - profiles, post pages and the feed are read from a read replica when there is one (see
+#   app/replicas.py); the export reads the primary, so it sees every post
+import json
+import zlib
+
+import sqlalchemy as sa
+from flask import Blueprint, Response, abort, current_app, jsonify, request, stream_with_context
+from flask_login import current_user, login_required
+from werkzeug.exceptions import HTTPException
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+from app import db
+from app.models import User, Post
+from app.feed import paginate, home_timeline, decode_cursor, newest_first, before_cursor
+from app.archive import archived_posts, user_archive
+from app.replicas import read_replica
+
+bp = Blueprint('api', __name__, url_prefix='/api/v1')
+
+
+def _iso(value):
+    # SQLite hands back naive datetimes; they are all UTC
+    if value is None:
+        return None
+    return value.isoformat() + '+00:00' if value.tzinfo is None else value.isoformat()
+
+
+# post fields, as positions in the (id, body, timestamp, author id, author username) tuples below
+POST_FIELDS = {
+    'id': lambda row: row[0],
+    'body': lambda row: row[1],
+    'timestamp': lambda row: _iso(row[2]),
+    'author_id': lambda row: row[3],
+    'author': lambda row: row[4],
+}
+
+USER_FIELDS = {
+    'id': lambda user: user.id,
+    'username': lambda user: user.username,
+    'about_me': lambda user: user.about_me,
+    'avatar': lambda user: user.avatar(128),
+    'last_seen': lambda user: _iso(user.last_seen),
+    'last_post_at': lambda user: _iso(user.last_post_at),
+    'post_count': lambda user: user.post_count,
+    'follower_count': lambda user: user.follower_count,
+    'following_count': lambda user: user.following_count(),
+}
+
+
+def _post_row(post):
+    return post.id, post.body, post.timestamp, post.user_id, post.author.username if post.author else None
+
+
+def selected_fields(available):
+    # the fields named in ?fields=, or all of them
+    names = [name.strip() for name in request.args.get('fields', '').split(',') if name.strip()]
+    unknown = [name for name in names if name not in available]
+    if unknown:
+        abort(400, description='Unknown field(s): {}. Available: {}.'.format(
+            ', '.join(unknown), ', '.join(available)))
+    return [(name, available[name]) for name in names or available]
+
+
+def _encoder(fields):
+    # turns a batch of objects into their JSON, comma-separated; one encoder call per batch rather than
+    # per object, which matters when exporting a million of them
+    dumps = json.JSONEncoder(ensure_ascii=False, separators=(',', ':')).encode
+    return lambda batch: dumps([{name: get(obj) for name, get in fields} for obj in batch])[1:-1]
+
+
+def page_limit():
+    limit = request.args.get('limit', current_app.config['API_PAGE_SIZE'], type=int)
+    return max(1, min(limit, current_app.config['API_MAX_PAGE_SIZE']))
+
+
+def _listing(batches, encode, next_cursor=None):
+    # {"items": [...], "next_cursor": ...}, one batch of items at a time
+    yield '{"items":['
+    separator = ''
+    for batch in batches:
+        if batch:
+            yield separator + encode(batch)
+            separator = ','
+    yield '],"next_cursor":' + json.dumps(next_cursor) + '}'
+
+
+def _buffered(parts):
+    # joins the many small strings into chunks of about API_STREAM_CHUNK bytes; every chunk handed to
+    # the server is a separate write to the socket
+    size = current_app.config['API_STREAM_CHUNK']
+    buffer = []
+    buffered = 0
+    for part in parts:
+        buffer.append(part)
+        buffered += len(part)
+        if buffered >= size:
+            yield ''.join(buffer).encode('utf-8')
+            buffer = []
+            buffered = 0
+    if buffer:
+        yield ''.join(buffer).encode('utf-8')
+
+
+def _content_encoding():
+    accepted = request.accept_encodings
+    if brotli is not None and accepted['br'] and accepted['br'] >= accepted['gzip']:
+        return 'br'
+    if accepted['gzip']:
+        return 'gzip'
+    return None
+
+
+def _compressed(chunks, encoding):
+    if encoding == 'br':
+        compressor = brotli.Compressor(quality=current_app.config['API_BROTLI_QUALITY'])
+        process, finish = compressor.process, compressor.finish
+    else:
+        compressor = zlib.compressobj(current_app.config['API_GZIP_LEVEL'], zlib.DEFLATED, 16 + zlib.MAX_WBITS)
+        # 16 + MAX_WBITS: a gzip header and trailer around the deflate stream
+        process, finish = compressor.compress, compressor.flush
+    for chunk in chunks:
+        out = process(chunk)
+        if out:
+            yield out
+    yield finish()
+
+
+def stream_json(parts):
+    # a streamed application/json response from an iterable of JSON text pieces
+    chunks = _buffered(parts)
+    encoding = _content_encoding()
+    if encoding:
+        chunks = _compressed(chunks, encoding)
+    response = Response(stream_with_context(chunks), mimetype='application/json')
+    # stream_with_context keeps the request (and its database session) alive until the last chunk is sent
+    if encoding:
+        response.headers['Content-Encoding'] = encoding
+    response.vary.add('Accept-Encoding')
+    return response
+
+
+def _user_or_404(username):
+    return db.first_or_404(sa.select(User).where(User.username == username))
+
+
+@bp.route('/users/<username>')
+@login_required
+@read_replica
+def get_user(username):
+    fields = selected_fields(USER_FIELDS)
+    user = _user_or_404(username)
+    return jsonify({name: get(user) for name, get in fields})
+
+
+@bp.route('/users/<username>/posts')
+@login_required
+@read_replica
+def get_user_posts(username):
+    encode = _encoder(selected_fields(POST_FIELDS))
+    user = _user_or_404(username)
+    page = paginate(user.posts.select(), decode_cursor(request.args.get('cursor')), page_limit(),
+                    archived=user_archive(user))
+    return stream_json(_listing([[_post_row(post) for post in page.items]], encode, page.next_cursor))
+
+
+def _all_posts(user):
+    # every post of the user as batches of plain rows, newest first: first the hot post table (a keyset
+    # scan of ix_post_user_id_timestamp, run on the session's connection so no ORM objects are built),
+    # then the archive tables
+    batch = current_app.config['API_EXPORT_BATCH']
+    username = user.username
+    query = sa.select(Post.id, Post.body, Post.timestamp, Post.user_id).where(Post.user_id == user.id)
+    cursor = None
+    while True:
+        rows = db.session.connection().execute(newest_first(
+            before_cursor(query, cursor) if cursor else query).limit(batch)).all()
+        yield [(*row, username) for row in rows]
+        if len(rows) < batch:
+            break
+        cursor = rows[-1].timestamp, rows[-1].id
+    if not user.archived_post_count:
+        return
+    cursor = None
+    while True:
+        posts = archived_posts(cursor, batch, user_id=user.id)
+        yield [(post.id, post.body, post.timestamp, post.user_id, username) for post in posts]
+        if len(posts) < batch:
+            break
+        cursor = posts[-1].timestamp, posts[-1].id
+
+
+@bp.route('/users/<username>/posts/export')
+@login_required
+def export_user_posts(username):
+    encode = _encoder(selected_fields(POST_FIELDS))
+    user = _user_or_404(username)
+    return stream_json(_listing(_all_posts(user), encode))
+
+
+@bp.route('/feed')
+@login_required
+@read_replica
+def get_feed():
+    encode = _encoder(selected_fields(POST_FIELDS))
+    page = home_timeline(current_user, decode_cursor(request.args.get('cursor')), page_limit())
+    return stream_json(_listing([[_post_row(post) for post in page.items]], encode, page.next_cursor))
+
+
+@bp.errorhandler(400)
+@bp.errorhandler(401)
+@bp.errorhandler(404)
+@bp.errorhandler(HTTPException)
+def api_error(error):
+    # errors raised by these views are answered in JSON rather than with the HTML pages from
+    # app/errors.py (the codes are listed one by one because Flask prefers the app's handler for a
+    # specific code over a blueprint's handler for HTTPException)
+    return jsonify(error=error.name, message=error.description), error.code
+
+
+@bp.errorhandler(500)
+def api_internal_error(error):
+    db.session.rollback()
+    return jsonify(error='Internal Server Error', message='Something went wrong on our side.'), 500
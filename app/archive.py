@@ -0,0 +1,163 @@
+# Time-partitioned post archive.
+# Everything that lists posts (home timeline, explore, profiles) reads the newest ones, but the post
+# table and its indexes keep growing with every post ever written. `flask archive run` moves posts
+# older than ARCHIVE_AFTER_DAYS out of the hot post table into one table per month
+# (post_archive_2024_01, post_archive_2024_02, ...), so the hot table only holds recent posts.
+# - the archive tables live in the main database, or in a separate one (e.g. a file on slower, cheaper
+#   storage) when ARCHIVE_DATABASE_URL is set; they are created here as needed, not by migrations
+#   (migrations/env.py ignores them)
+# - listings read the hot table first and only continue into the archive once it runs out, so the
+#   common "newest posts" pages never touch it (see paginate() in app/feed.py); archived rows come
+#   back as ArchivedPost objects, which have the attributes _post.html needs
+# - archived posts stay in the search index, and Post.search() loads them from here
+# - rows are moved with Core statements, so the session hooks don't run: User.post_count keeps
+#   counting archived posts and the search index is left alone. Their home timeline entries are
+#   dropped, so home timelines only reach back ARCHIVE_AFTER_DAYS.
+# - User.archived_post_count counts each author's archived posts. Most users never have one (the
+#   archive is mostly old posts of a few prolific accounts), and their profile listings skip the
+#   monthly tables altogether instead of querying every one of them to find nothing.
+# Each batch is copied (and committed) before it is deleted from the hot table, and a copy first
+# deletes any rows with the same ids, so an interrupted run can simply be started again.
+import re
+import time
+from collections import Counter
+from itertools import groupby
+
+import sqlalchemy as sa
+import sqlalchemy.orm as so
+
+from app import db
+from app.models import User, Post, TimelineEntry
+
+metadata = sa.MetaData()
+# kept apart from db.metadata so db.create_all() and the migrations don't know about these tables
+TABLE_NAME = re.compile(r'^post_archive_(\d{4})_(\d{2})$')
+_tables = {}
+_known = {'names': None, 'checked': 0.0}
+
+
+def engine():
+    return db.engines.get('archive', db.engine)
+
+
+def table_for(year, month):
+    name = f'post_archive_{year:04d}_{month:02d}'
+    if name not in _tables:
+        _tables[name] = sa.Table(
+            name, metadata,
+            sa.Column('id', sa.Integer, primary_key=True),
+            sa.Column('body', sa.String(140)),
+            sa.Column('timestamp', sa.DateTime),
+            sa.Column('user_id', sa.Integer),
+            sa.Index(f'ix_{name}_timestamp', 'timestamp', 'id'),
+            sa.Index(f'ix_{name}_user_id_timestamp', 'user_id', 'timestamp', 'id'))
+    return _tables[name]
+
+
+def tables(refresh=False):
+    # the archive tables that exist, newest month first. Looked up in the database at most once a
+    # minute per process, so tables created by `flask archive run` elsewhere are picked up.
+    if refresh or _known['names'] is None or time.monotonic() - _known['checked'] > 60:
+        _known['names'] = sorted((name for name in sa.inspect(engine()).get_table_names()
+                                  if TABLE_NAME.match(name)), reverse=True)
+        _known['checked'] = time.monotonic()
+    return [table_for(*map(int, TABLE_NAME.match(name).groups())) for name in _known['names']]
+
+
+class ArchivedPost:
+    # a read-only stand-in for Post, for rows that come from an archive table
+    __slots__ = ('id', 'body', 'timestamp', 'user_id', 'author')
+
+    def __init__(self, id, body, timestamp, user_id, author=None):
+        self.id = id
+        self.body = body
+        self.timestamp = timestamp
+        self.user_id = user_id
+        self.author = author
+
+
+def _with_authors(rows):
+    posts = [ArchivedPost(*row) for row in rows]
+    user_ids = {post.user_id for post in posts}
+    if user_ids:
+        authors = {user.id: user for user in db.session.scalars(
+            sa.select(User).where(User.id.in_(user_ids)).options(
+                so.load_only(User.id, User.username, User.avatar_digest, User.profile_version)))}
+        for post in posts:
+            post.author = authors.get(post.user_id)
+    return posts
+
+
+def archived_posts(cursor, limit, user_id=None):
+    # up to `limit` archived posts (optionally by one user) older than the cursor, newest first;
+    # walks the monthly tables from the cursor's month backwards and stops as soon as it has enough
+    rows = []
+    with engine().connect() as conn:
+        for table in tables():
+            if len(rows) >= limit:
+                break
+            year, month = map(int, TABLE_NAME.match(table.name).groups())
+            if cursor is not None and (year, month) > (cursor[0].year, cursor[0].month):
+                continue
+            query = sa.select(table.c.id, table.c.body, table.c.timestamp, table.c.user_id)
+            if user_id is not None:
+                query = query.where(table.c.user_id == user_id)
+            if cursor is not None:
+                query = query.where(table.c.timestamp <= cursor[0], sa.or_(
+                    table.c.timestamp < cursor[0], table.c.id < cursor[1]))
+                # same shape as before_cursor() in app/feed.py, so it seeks into the index
+            rows += conn.execute(query.order_by(table.c.timestamp.desc(), table.c.id.desc())
+                                 .limit(limit - len(rows))).all()
+    return _with_authors(rows)
+
+
+def user_archive(user):
+    # archived_posts() for a single author, in the form paginate(archived=...) expects; None (don't
+    # look in the archive at all) when none of their posts have been archived
+    if not user.archived_post_count:
+        return None
+    return lambda cursor, limit: archived_posts(cursor, limit, user_id=user.id)
+
+
+def load(ids):
+    # archived posts by id (used for search results that are no longer in the hot table)
+    rows = []
+    with engine().connect() as conn:
+        for table in tables():
+            rows += conn.execute(sa.select(table.c.id, table.c.body, table.c.timestamp, table.c.user_id)
+                                 .where(table.c.id.in_(ids))).all()
+    return _with_authors(rows)
+
+
+def archive_posts(older_than, batch_size, echo=print):
+    # moves every post written before `older_than` into the archive, one batch per transaction
+    moved = 0
+    while True:
+        batch = db.session.execute(
+            sa.select(Post.id, Post.body, Post.timestamp, Post.user_id)
+            .where(Post.timestamp < older_than)
+            .order_by(Post.timestamp, Post.id).limit(batch_size)).all()
+        if not batch:
+            return moved
+        with engine().begin() as conn:
+            for (year, month), rows in groupby(batch, key=lambda row: (row.timestamp.year,
+                                                                        row.timestamp.month)):
+                rows = [row._asdict() for row in rows]
+                table = table_for(year, month)
+                table.create(conn, checkfirst=True)
+                conn.execute(table.delete().where(table.c.id.in_([row['id'] for row in rows])))
+                conn.execute(table.insert(), rows)
+        ids = [row.id for row in batch]
+        db.session.execute(sa.delete(TimelineEntry).where(TimelineEntry.post_id.in_(ids)))
+        db.session.execute(sa.delete(Post).where(Post.id.in_(ids)).execution_options(
+            synchronize_session=False))
+        db.session.execute(
+            sa.update(User.__table__).where(User.id == sa.bindparam('author_id')).values(
+                archived_post_count=User.archived_post_count + sa.bindparam('moved')),
+            [{'author_id': user_id, 'moved': moved_posts}
+             for user_id, moved_posts in Counter(row.user_id for row in batch).items()])
+        # in the same transaction as the delete, so the count matches the rows that left the hot table
+        db.session.commit()
+        moved += len(batch)
+        echo(f'archived {moved} posts (up to {batch[-1].timestamp:%Y-%m-%d})')
+        tables(refresh=True)
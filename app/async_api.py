@@ -0,0 +1,194 @@
+# Async serving mode (asgi.py).
+# Under gunicorn every request holds a worker thread from start to finish, including the time spent
+# waiting for the database, so the number of requests in flight is capped at workers x threads and one
+# slow query keeps a thread from serving anyone else. Served through asgi.py instead:
+# - the read-only JSON API endpoints below run as coroutines on the event loop, with their queries on
+#   an AsyncSession (app/async_db.py); while one waits for the database the loop serves other
+#   requests, so thousands of connections can be open at once
+# - every other URL (the HTML pages, forms, login, the export) is passed to the regular Flask app,
+#   which runs on a pool of ASYNC_WSGI_THREADS threads exactly as it does under gunicorn
+# Flask's own `async def` views wouldn't help here: Flask runs each one in a fresh event loop inside
+# the worker thread that is handling the request, so the thread is still blocked for the whole request.
+# The async views produce the same responses as the ones in app/api.py (they reuse its field lists,
+# encoders and error format), with these limits:
+# - they only answer when the session cookie already holds a logged-in user; anything else (no
+#   session, a "remember me" cookie that has to log the user back in, a 401) goes to the Flask view.
+#   The user is loaded by Flask-Login itself (session protection, the user_loader in app/models.py),
+#   after an awaited query has put them in the identity cache, so the loader never blocks the loop;
+#   when session protection changes the session, the Flask view answers so the cookie is updated
+# - /users/<username>/posts goes to the Flask view too once a listing reaches the archive tables,
+#   which are read with the sync engine (see app/archive.py)
+# - they don't run Flask's before/after request hooks, apart from recording the user's presence, and
+#   they never change or re-send the session cookie
+import io
+import re
+import sys
+
+import sqlalchemy as sa
+from flask import abort, request, session
+from flask_login import current_user
+from werkzeug.exceptions import HTTPException
+
+from app import async_db, identity_cache, presence
+from app.api import (POST_FIELDS, USER_FIELDS, selected_fields, page_limit, _encoder, _listing, _post_row,
+                     stream_json, api_error, api_internal_error)
+from app.archive import tables as archive_tables
+from app.feed import (decode_cursor, fetch_statement, inbox_statement, followed_celebrities_statement,
+                      to_page, merge_newest_first, TIMELINE_KEY)
+from app.models import User, Post, followers
+
+
+async def _user_or_404(db_session, username):
+    user = await db_session.scalar(sa.select(User).where(User.username == username))
+    if user is None:
+        abort(404)
+    return user
+
+
+async def get_user(db_session, user_id, username):
+    fields = selected_fields(USER_FIELDS)
+    user = await _user_or_404(db_session, username)
+    values = {}
+    for name, get in fields:
+        if name == 'following_count':
+            # User.following_count() queries through db.session
+            values[name] = await db_session.scalar(sa.select(sa.func.count()).select_from(followers)
+                                                   .where(followers.c.follower_id == user.id))
+        else:
+            values[name] = get(user)
+    return values
+
+
+async def get_user_posts(db_session, user_id, username):
+    encode = _encoder(selected_fields(POST_FIELDS))
+    user = await _user_or_404(db_session, username)
+    per_page = page_limit()
+    posts = (await db_session.scalars(fetch_statement(
+        sa.select(Post).where(Post.user_id == user.id), decode_cursor(request.args.get('cursor')),
+        per_page + 1))).all()
+    if len(posts) <= per_page and user.archived_post_count and archive_tables():
+        return None
+    page = to_page(posts, per_page)
+    return stream_json(_listing([[_post_row(post) for post in page.items]], encode, page.next_cursor))
+
+
+async def get_feed(db_session, user_id):
+    # home_timeline() in app/feed.py, with the queries awaited
+    encode = _encoder(selected_fields(POST_FIELDS))
+    cursor = decode_cursor(request.args.get('cursor'))
+    per_page = page_limit()
+    posts = (await db_session.scalars(fetch_statement(inbox_statement(user_id), cursor, per_page + 1,
+                                                      TIMELINE_KEY))).all()
+    celebrity_ids = (await db_session.scalars(followed_celebrities_statement(user_id))).all()
+    if celebrity_ids:
+        posts = merge_newest_first([*posts, *(await db_session.scalars(fetch_statement(
+            sa.select(Post).where(Post.user_id.in_(celebrity_ids)), cursor, per_page + 1))).all()])
+    page = to_page(posts, per_page)
+    return stream_json(_listing([[_post_row(post) for post in page.items]], encode, page.next_cursor))
+
+
+# path: async view; a view returns None to hand the request to the Flask view for the same URL
+ROUTES = [
+    (re.compile(r'/api/v1/users/(?P<username>[^/]+)'), get_user),
+    (re.compile(r'/api/v1/users/(?P<username>[^/]+)/posts'), get_user_posts),
+    (re.compile(r'/api/v1/feed'), get_feed),
+]
+
+
+def _environ(scope):
+    # the parts of a WSGI environ a Flask request context needs, for a GET with no body
+    server_name, server_port = scope.get('server') or ('localhost', 80)
+    environ = {
+        'REQUEST_METHOD': scope['method'],
+        'SCRIPT_NAME': scope.get('root_path', '').encode('utf-8').decode('latin-1'),
+        'PATH_INFO': scope['path'].encode('utf-8').decode('latin-1'),
+        'QUERY_STRING': scope['query_string'].decode('latin-1'),
+        'SERVER_NAME': server_name,
+        'SERVER_PORT': str(server_port),
+        'SERVER_PROTOCOL': 'HTTP/' + scope.get('http_version', '1.1'),
+        'REMOTE_ADDR': (scope.get('client') or ('', 0))[0],
+        'wsgi.url_scheme': scope.get('scheme', 'http'),
+        'wsgi.input': io.BytesIO(),
+        'wsgi.errors': sys.stderr,
+    }
+    for name, value in scope['headers']:
+        key = 'HTTP_' + name.decode('latin-1').upper().replace('-', '_')
+        value = value.decode('latin-1')
+        environ[key] = environ[key] + ',' + value if key in environ else value
+    return environ
+
+
+class AsyncApp:
+    # the ASGI application: the async views for their URLs, the Flask app on a thread pool for the rest
+    def __init__(self, app):
+        from a2wsgi import WSGIMiddleware
+        self.app = app
+        self.wsgi = WSGIMiddleware(app, workers=app.config['ASYNC_WSGI_THREADS'])
+
+    async def __call__(self, scope, receive, send):
+        if scope['type'] == 'lifespan':
+            return await self._lifespan(receive, send)
+        if scope['type'] == 'http' and scope['method'] in ('GET', 'HEAD'):
+            for pattern, view in ROUTES:
+                match = pattern.fullmatch(scope['path'])
+                if match:
+                    response = await self._dispatch(view, scope, match.groupdict())
+                    if response is not None:
+                        return await self._send(scope, send, *response)
+                    break
+        await self.wsgi(scope, receive, send)
+
+    async def _dispatch(self, view, scope, kwargs):
+        # (status, headers, body), or None when the Flask view should answer instead
+        with self.app.request_context(_environ(scope)):
+            user_id = session.get('_user_id')
+            if user_id is None:
+                return None
+            try:
+                async with async_db.session() as db_session:
+                    if not await self._cached(db_session, int(user_id)):
+                        return None
+                    user = current_user._get_current_object()
+                    # Flask-Login's own checks, then load_user(), which finds the user in the cache
+                    if not user.is_authenticated or session.modified:
+                        return None
+                    presence.record(user.id)
+                    rv = await view(db_session, user.id, **kwargs)
+                if rv is None:
+                    return None
+            except HTTPException as error:
+                rv = api_error(error)
+            except Exception:
+                self.app.logger.exception('Exception on %s [GET]', scope['path'])
+                rv = api_internal_error(None)
+            response = self.app.make_response(rv)
+            body = b''.join(response.iter_encoded())
+            # still inside the request context: stream_json's generator needs it
+            response.headers['Content-Length'] = str(len(body))
+            return response.status_code, response.headers.to_wsgi_list(), body
+
+    async def _cached(self, db_session, user_id):
+        # makes sure the identity cache has the user (one awaited query on a miss); False when they
+        # don't exist
+        if identity_cache.get(user_id) is None:
+            user = await db_session.get(User, user_id)
+            if user is None:
+                return False
+            identity_cache.put(user)
+        return True
+
+    async def _send(self, scope, send, status, headers, body):
+        await send({'type': 'http.response.start', 'status': status,
+                    'headers': [(name.lower().encode('latin-1'), value.encode('latin-1'))
+                                for name, value in headers]})
+        await send({'type': 'http.response.body', 'body': b'' if scope['method'] == 'HEAD' else body})
+
+    async def _lifespan(self, receive, send):
+        while True:
+            message = await receive()
+            if message['type'] == 'lifespan.startup':
+                await send({'type': 'lifespan.startup.complete'})
+            elif message['type'] == 'lifespan.shutdown':
+                await async_db.dispose()
+                await send({'type': 'lifespan.shutdown.complete'})
+                return
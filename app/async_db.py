@@ -0,0 +1,62 @@
+# Async database access for the views in app/async_api.py.
+# The same User/Post mappings are used through an SQLAlchemy AsyncSession on an async driver
+# (aiosqlite for SQLite, asyncpg / aiomysql for PostgreSQL / MySQL): while a query waits for the
+# database, the event loop serves other requests instead of a worker thread sitting blocked.
+# - the engine is only created the first time a session is asked for, i.e. only when serving through
+#   asgi.py; the regular (WSGI) app never imports the async drivers
+# - lazy loading doesn't work on an AsyncSession (it would have to block), so the queries load
+#   everything they use up front, which the listing queries already do (see listing_options() in
+#   app/feed.py)
+# - never mix it with db.session in one request: they are different connections and transactions
+import sqlalchemy as sa
+
+from app.engine import tune_engine
+
+# sync driver name: its async counterpart
+ASYNC_DRIVERS = {
+    'sqlite': 'sqlite+aiosqlite',
+    'sqlite+pysqlite': 'sqlite+aiosqlite',
+    'postgresql': 'postgresql+asyncpg',
+    'postgresql+psycopg2': 'postgresql+asyncpg',
+    'mysql': 'mysql+aiomysql',
+    'mysql+pymysql': 'mysql+aiomysql',
+}
+
+
+def async_url(uri):
+    url = sa.engine.make_url(uri)
+    return url.set(drivername=ASYNC_DRIVERS.get(url.drivername, url.drivername))
+
+
+class AsyncDatabase:
+    def __init__(self, app=None):
+        self.app = None
+        self._engine = None
+        self._sessionmaker = None
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        self.app = app
+
+    @property
+    def engine(self):
+        if self._engine is None:
+            from sqlalchemy.ext.asyncio import create_async_engine, async_sessionmaker
+            config = self.app.config
+            url = config['ASYNC_DATABASE_URL'] or async_url(config['SQLALCHEMY_DATABASE_URI'])
+            self._engine = create_async_engine(url, **config['SQLALCHEMY_ENGINE_OPTIONS'])
+            tune_engine(self._engine.sync_engine, config)
+            # the same pool settings / pragmas as the sync engine (create_app() filled in the options)
+            self._sessionmaker = async_sessionmaker(self._engine, expire_on_commit=False)
+        return self._engine
+
+    def session(self):
+        # use as `async with async_db.session() as session:`
+        self.engine
+        return self._sessionmaker()
+
+    async def dispose(self):
+        if self._engine is not None:
+            await self._engine.dispose()
+            self._engine = None
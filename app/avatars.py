@@ -0,0 +1,123 @@
+# Locally rendered identicon avatars.
+# Every avatar used to be a gravatar.com URL, so each page sent the browser to a third-party server
+# once per post. We now draw the identicon ourselves from the same md5 digest of the email (stored on
+# the User row as avatar_digest, so pages never re-hash anything) and serve it from /avatar/...
+# Avatars only come in the standard AVATAR_SIZES, which keeps the number of distinct images small.
+# Rendered PNGs are kept in an in-memory LRU (AVATAR_MEMORY_CACHE entries) and on disk under
+# AVATAR_CACHE_DIR, and since an avatar can never change for a given URL browsers may cache it forever.
+# Only digests that belong to a user are drawn at all (anything else is a 404), so nobody can fill the
+# disk by asking for made-up digests; the check is one index lookup, and only on a cache miss.
+import os
+import struct
+import tempfile
+import threading
+import zlib
+from collections import OrderedDict
+from hashlib import md5
+
+import sqlalchemy as sa
+from flask import current_app
+
+BACKGROUND = (240, 240, 240)
+
+
+def email_digest(email):
+    return md5(email.lower().encode('utf-8')).hexdigest()
+
+
+def standard_size(size):
+    # the smallest standard size that is at least as big as the one asked for
+    sizes = sorted(current_app.config['AVATAR_SIZES'])
+    for standard in sizes:
+        if standard >= size:
+            return standard
+    return sizes[-1]
+
+
+def _png_chunk(kind, data):
+    return (struct.pack('>I', len(data)) + kind + data
+            + struct.pack('>I', zlib.crc32(kind + data) & 0xffffffff))
+
+
+def _encode_png(rows, size):
+    # rows: one bytes object of RGB pixels per scanline. Each scanline gets a leading 0 (no filter).
+    header = struct.pack('>IIBBBBB', size, size, 8, 2, 0, 0, 0)
+    pixels = b''.join(b'\x00' + row for row in rows)
+    return (b'\x89PNG\r\n\x1a\n' + _png_chunk(b'IHDR', header)
+            + _png_chunk(b'IDAT', zlib.compress(pixels, 9)) + _png_chunk(b'IEND', b''))
+
+
+def render_identicon(digest, size):
+    # A 5x5 grid, mirrored left to right, like gravatar's and github's identicons: the first 15 hex
+    # digits decide which cells on the left three columns are filled, the last three bytes pick the
+    # colour (kept away from very dark and very light shades).
+    data = bytes.fromhex(digest)
+    colour = tuple(64 + byte // 2 for byte in data[-3:])
+    cells = [[int(digest[row * 3 + min(col, 4 - col)], 16) % 2 == 0 for col in range(5)]
+             for row in range(5)]
+
+    margin = size // 12
+    cell = (size - 2 * margin) / 5
+
+    def grid_index(position):
+        if position < margin or position >= size - margin:
+            return None
+        return min(int((position - margin) / cell), 4)
+
+    columns = [grid_index(x) for x in range(size)]
+    blank = bytes(BACKGROUND) * size
+    grid_rows = [b''.join(bytes(colour if col is not None and filled[col] else BACKGROUND)
+                          for col in columns)
+                 for filled in cells]
+    rows = [blank if grid_index(y) is None else grid_rows[grid_index(y)] for y in range(size)]
+    return _encode_png(rows, size)
+
+
+def _belongs_to_a_user(digest):
+    from app import db
+    from app.models import User
+    # imported here because app/models.py imports this module
+    return db.session.scalar(sa.select(User.id).where(User.avatar_digest == digest).limit(1)) is not None
+
+
+class AvatarCache:
+    def __init__(self, app=None):
+        self.app = None
+        self._lock = threading.Lock()
+        self._images = OrderedDict()
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        self.app = app
+
+    def _path(self, digest, size):
+        return os.path.join(self.app.config['AVATAR_CACHE_DIR'], digest[:2], f'{digest}-{size}.png')
+
+    def get(self, digest, size):
+        # the PNG, or None when no user has this digest
+        key = (digest, size)
+        with self._lock:
+            if key in self._images:
+                self._images.move_to_end(key)
+                return self._images[key]
+        path = self._path(digest, size)
+        try:
+            with open(path, 'rb') as f:
+                image = f.read()
+        except OSError:
+            if not _belongs_to_a_user(digest):
+                return None
+            image = render_identicon(digest, size)
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            fd, tmp = tempfile.mkstemp(dir=os.path.dirname(path), suffix='.tmp')
+            with os.fdopen(fd, 'wb') as f:
+                f.write(image)
+            os.replace(tmp, path)
+            # write-then-rename so another worker never reads a half written file; every writer gets its
+            # own temporary file, so two threads drawing the same avatar can't clobber each other's
+        with self._lock:
+            self._images[key] = image
+            while len(self._images) > self.app.config['AVATAR_MEMORY_CACHE']:
+                self._images.popitem(last=False)
+        return image
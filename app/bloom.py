@@ -0,0 +1,35 @@
+# A Bloom filter: a set in a fixed, small amount of memory that can only answer "definitely not in
+# the set" or "probably in the set". Adding a key sets a few bits chosen by hashing it; a key whose
+# bits are not all set was never added. Keys can't be removed, and a key that was never added is
+# reported as "probably in" with roughly the error rate the filter was sized for (once it holds more
+# than `capacity` keys that rate climbs quickly).
+# Used by app/names.py to answer most "is this username taken?" checks without a query.
+import hashlib
+import math
+
+
+class BloomFilter:
+    def __init__(self, capacity, error_rate):
+        self.size = max(64, int(-capacity * math.log(error_rate) / math.log(2) ** 2))
+        # bits needed for `capacity` keys at `error_rate` (about 9.6 bits per key for 1%)
+        self.hashes = max(1, round(self.size / capacity * math.log(2)))
+        self.bits = bytearray((self.size + 7) // 8)
+        self.count = 0
+
+    def _positions(self, key):
+        # two 64-bit halves of one hash combined into `hashes` positions (Kirsch-Mitzenmacher), which
+        # is as good as `hashes` independent hash functions and only hashes the key once
+        digest = hashlib.blake2b(key.encode('utf-8'), digest_size=16).digest()
+        first = int.from_bytes(digest[:8], 'little')
+        step = int.from_bytes(digest[8:], 'little') | 1
+        return [(first + i * step) % self.size for i in range(self.hashes)]
+
+    def add(self, key):
+        # not thread-safe: two adds can set bits in the same byte, so callers hold a lock
+        for position in self._positions(key):
+            self.bits[position >> 3] |= 1 << (position & 7)
+        self.count += 1
+
+    def __contains__(self, key):
+        bits = self.bits
+        return all(bits[position >> 3] & (1 << (position & 7)) for position in self._positions(key))
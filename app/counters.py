@@ -0,0 +1,125 @@
+# Denormalized post counters on User.
+# A profile header showing "12345 posts" would otherwise run COUNT(*) over all of the user's posts on
+# every page view, which gets slower the more they write. User.post_count and User.last_post_at are
+# kept up to date instead:
+# - whenever a session flushes new or deleted Post objects (views, app/timeline.py, app/ingest.py),
+#   an after_flush hook adjusts the authors' counters in the same transaction, with SQL expressions
+#   (post_count = post_count + n) so concurrent writers can't lose an update; after a delete
+#   last_post_at is looked up again, in the archive tables too for authors with archived posts
+# - Core bulk inserts that bypass the ORM (app/importer.py) call add_posts() themselves
+# - `flask counters reconcile` recounts everything in bulk and repairs any drift (e.g. after rows
+#   were changed by hand); it only rewrites the users whose numbers are actually wrong. Archived posts
+#   (app/archive.py) still count, so it counts the archive tables as well, and repairs
+#   User.archived_post_count with the same numbers.
+from collections import defaultdict
+
+import sqlalchemy as sa
+
+from app import db
+from app.models import User, Post
+from app import archive
+
+
+def _newer(timestamp):
+    return sa.case((User.last_post_at.is_(None), timestamp),
+                   (User.last_post_at < timestamp, timestamp), else_=User.last_post_at)
+
+
+def add_posts(connection, authors):
+    # authors: {user_id: (number of new posts, newest timestamp among them)}
+    if authors:
+        connection.execute(
+            sa.update(User.__table__).where(User.id == sa.bindparam('author_id')).values(
+                post_count=User.post_count + sa.bindparam('added'),
+                last_post_at=_newer(sa.bindparam('newest'))),
+            [{'author_id': user_id, 'added': added, 'newest': newest}
+             for user_id, (added, newest) in authors.items()])
+
+
+def remove_posts(connection, authors):
+    # authors: {user_id: number of deleted posts}; last_post_at is looked up again in case the newest
+    # post was one of them (a single index seek on ix_post_user_id_timestamp)
+    if authors:
+        connection.execute(
+            sa.update(User.__table__).where(User.id == sa.bindparam('author_id')).values(
+                post_count=User.post_count - sa.bindparam('removed'),
+                last_post_at=sa.select(sa.func.max(Post.timestamp))
+                .where(Post.user_id == User.id).scalar_subquery()),
+            [{'author_id': user_id, 'removed': removed} for user_id, removed in authors.items()])
+        archived = connection.execute(
+            sa.select(User.id).where(User.id.in_(list(authors)), User.archived_post_count > 0)).scalars().all()
+        if archived:
+            # their newest post may be in the archive (or the archive may be all that's left), and the
+            # archive tables can be in another database, so they're read separately
+            newest = {}
+            with archive.engine().connect() as conn:
+                for table in archive.tables():
+                    _tally(conn, table, archived, newest)
+            if newest:
+                connection.execute(
+                    sa.update(User.__table__).where(User.id == sa.bindparam('author_id')).values(
+                        last_post_at=_newer(sa.bindparam('newest'))),
+                    [{'author_id': user_id, 'newest': timestamp} for user_id, (_, timestamp) in newest.items()])
+
+
+def update_post_counters(session, flush_context):
+    added = {}
+    removed = defaultdict(int)
+    for obj in session.new:
+        if isinstance(obj, Post):
+            count, newest = added.get(obj.user_id, (0, obj.timestamp))
+            added[obj.user_id] = (count + 1, max(newest, obj.timestamp))
+    for obj in session.deleted:
+        if isinstance(obj, Post):
+            removed[obj.user_id] += 1
+    connection = session.connection()
+    add_posts(connection, added)
+    remove_posts(connection, removed)
+
+
+sa.event.listen(db.session, 'after_flush', update_post_counters)
+
+
+def _tally(connection, table, user_ids, into):
+    # adds each user's (post count, newest timestamp) in `table` to `into`
+    for user_id, count, newest in connection.execute(
+            sa.select(table.c.user_id, sa.func.count(), sa.func.max(table.c.timestamp))
+            .where(table.c.user_id.in_(user_ids)).group_by(table.c.user_id)):
+        old_count, old_newest = into.get(user_id, (0, None))
+        into[user_id] = (old_count + count, max(filter(None, (old_newest, newest)), default=None))
+
+
+def reconcile_post_counters(batch_size=1000):
+    # Recounts the hot post table and every archive table (see app/archive.py), a batch of users at a
+    # time, and rewrites only the users whose stored numbers differ. Returns how many were fixed.
+    fixed = 0
+    last_id = 0
+    while True:
+        users = db.session.execute(
+            sa.select(User.id, User.post_count, User.last_post_at, User.archived_post_count)
+            .where(User.id > last_id).order_by(User.id).limit(batch_size)).all()
+        if not users:
+            return fixed
+        last_id = users[-1].id
+        user_ids = [user.id for user in users]
+        hot, archived = {}, {}
+        _tally(db.session.connection(), Post.__table__, user_ids, hot)
+        with archive.engine().connect() as conn:
+            for table in archive.tables(refresh=True):
+                _tally(conn, table, user_ids, archived)
+        drifted = []
+        for user in users:
+            hot_count, hot_newest = hot.get(user.id, (0, None))
+            archived_count, archived_newest = archived.get(user.id, (0, None))
+            actual = (hot_count + archived_count,
+                      max(filter(None, (hot_newest, archived_newest)), default=None), archived_count)
+            if (user.post_count, user.last_post_at, user.archived_post_count) != actual:
+                drifted.append({'author_id': user.id, 'count': actual[0], 'newest': actual[1],
+                                'archived': actual[2]})
+        if drifted:
+            db.session.execute(
+                sa.update(User.__table__).where(User.id == sa.bindparam('author_id')).values(
+                    post_count=sa.bindparam('count'), last_post_at=sa.bindparam('newest'),
+                    archived_post_count=sa.bindparam('archived')), drifted)
+        db.session.commit()
+        fixed += len(drifted)
@@ -0,0 +1,48 @@
+# Database engine tuning.
+# Out of the box SQLite uses a rollback journal (readers and the writer block each other) and fails
+# straight away with "database is locked" when another worker is writing. Every new SQLite connection
+# therefore gets these pragmas, all configurable in config.py:
+#   journal_mode=WAL     readers keep reading while one writer writes
+#   synchronous=NORMAL   in WAL mode this is still crash safe, it just fsyncs at checkpoints, not every commit
+#   busy_timeout         wait this many milliseconds for the write lock instead of failing immediately
+#   mmap_size            read pages through memory mapping instead of read() system calls
+# Server databases (PostgreSQL, MySQL) get a connection pool sized by DB_POOL_SIZE / DB_MAX_OVERFLOW.
+import sqlalchemy as sa
+
+
+def engine_options(config):
+    if config['SQLALCHEMY_DATABASE_URI'].startswith('sqlite'):
+        # the sqlite3 driver has its own lock timeout (in seconds) that applies before our pragma is set
+        return {'connect_args': {'timeout': config['SQLITE_BUSY_TIMEOUT'] / 1000}}
+    return {
+        'pool_size': config['DB_POOL_SIZE'],
+        'max_overflow': config['DB_MAX_OVERFLOW'],
+        'pool_recycle': config['DB_POOL_RECYCLE'],
+        'pool_pre_ping': True,
+    }
+
+
+def sqlite_pragmas(config):
+    return {
+        'journal_mode': config['SQLITE_JOURNAL_MODE'],
+        'synchronous': config['SQLITE_SYNCHRONOUS'],
+        'busy_timeout': config['SQLITE_BUSY_TIMEOUT'],
+        'mmap_size': config['SQLITE_MMAP_SIZE'],
+    }
+
+
+def tune_engine(engine, config):
+    # also works for the aiosqlite engine of app/async_db.py (pass its sync_engine): its connections
+    # aren't sqlite3.Connection objects, which is why the dialect is checked rather than the class
+    if engine.dialect.name != 'sqlite':
+        return
+    pragmas = sqlite_pragmas(config)
+
+    def on_connect(dbapi_connection, connection_record):
+        cursor = dbapi_connection.cursor()
+        for name, value in pragmas.items():
+            if value is not None:
+                cursor.execute(f'PRAGMA {name}={value}')
+        cursor.close()
+
+    sa.event.listen(engine, 'connect', on_connect)
@@ -1,11 +1,18 @@
-from flask import render_template
-from app import app,db
+from flask import render_template, Blueprint
+from app import db
 
-@app.errorhandler(404)
+bp = Blueprint('errors', __name__)
+
+@bp.app_errorhandler(404)
 def not_found_error(error):
     return render_template('404.html'), 404
 
-@app.errorhandler(500)
+@bp.app_errorhandler(429)
+def too_many_requests_error(error):
+    headers = {'Retry-After': str(error.retry_after)} if error.retry_after else {}
+    return render_template('429.html', retry_after=error.retry_after), 429, headers
+
+@bp.app_errorhandler(500)
 def internal_error(error):
     db.session.rollback()
     return render_template('500.html'), 500 
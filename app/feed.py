@@ -0,0 +1,164 @@
+# Feed query layer shared by the index and profile pages.
+# Instead of OFFSET pagination (which makes the database walk and throw away every row before the
+# requested page, so page 500 costs 500x page 1) we use keyset pagination: each page ends with a
+# cursor holding the (timestamp, id) of its last post, and the next page simply asks for posts that
+# sort strictly before that pair. With the ix_post_timestamp index the database seeks straight to the
+# cursor position, so every page costs the same no matter how deep the user has scrolled.
+import base64
+import binascii
+from collections import namedtuple
+from datetime import datetime
+
+import sqlalchemy as sa
+import sqlalchemy.orm as so
+from flask import current_app
+
+from app import db
+from app.models import User, Post, TimelineEntry, followers
+
+# items: the posts on this page, next_cursor: token for the following page (None on the last page)
+Page = namedtuple('Page', ['items', 'next_cursor'])
+
+
+def encode_cursor(post):
+    raw = '{}|{}'.format(post.timestamp.isoformat(), post.id)
+    return base64.urlsafe_b64encode(raw.encode('utf-8')).decode('ascii').rstrip('=')
+
+
+def decode_cursor(token):
+    # Cursors come straight from the query string, so anything malformed is treated as "no cursor"
+    # (i.e. the first page) rather than raising an error.
+    if not token:
+        return None
+    try:
+        raw = base64.urlsafe_b64decode(token + '=' * (-len(token) % 4)).decode('utf-8')
+        timestamp, post_id = raw.split('|')
+        return datetime.fromisoformat(timestamp), int(post_id)
+    except (ValueError, binascii.Error, UnicodeDecodeError):
+        return None
+
+
+# the (timestamp, id) pair a query is ordered and paginated by
+POST_KEY = (Post.timestamp, Post.id)
+TIMELINE_KEY = (TimelineEntry.timestamp, TimelineEntry.post_id)
+
+
+def newest_first(query, key=POST_KEY):
+    # id breaks ties between posts written in the same instant, so the ordering is total and a
+    # cursor always points at exactly one position.
+    timestamp, post_id = key
+    return query.order_by(timestamp.desc(), post_id.desc())
+
+
+def before_cursor(query, cursor, key=POST_KEY):
+    # (timestamp, id) < (cursor timestamp, cursor id), spelled out with AND/OR because row-value
+    # comparisons are not supported by every database SQLAlchemy talks to. The leading
+    # "timestamp <= cursor" is what lets the database seek into the index: with only
+    # "timestamp < c OR (timestamp = c AND id < i)" SQLite scans from the newest row and filters,
+    # so a page deep in a long listing got slower the deeper it was.
+    timestamp, post_id = key
+    cursor_timestamp, cursor_id = cursor
+    return query.where(timestamp <= cursor_timestamp, sa.or_(
+        timestamp < cursor_timestamp, post_id < cursor_id))
+
+
+def listing_options():
+    # Loader options for any list of posts shown with _post.html. Without them every post.author is
+    # loaded lazily, one query per post (a page of 50 posts by different people = 51 queries). The
+    # author is fetched in the same query with a JOIN instead, and both sides only load the columns
+    # the templates (and the fragment cache key) actually use.
+    return (so.load_only(Post.id, Post.body, Post.timestamp, Post.user_id),
+            so.joinedload(Post.author).load_only(
+                User.id, User.username, User.avatar_digest, User.profile_version))
+
+
+def fetch_statement(query, cursor, limit, key=POST_KEY):
+    # up to `limit` posts of a listing after the cursor, newest first, ready for _post.html
+    query = newest_first(query, key).options(*listing_options())
+    if cursor is not None:
+        query = before_cursor(query, cursor, key)
+    return query.limit(limit)
+
+
+def _fetch(query, cursor, limit, key=POST_KEY):
+    return db.session.scalars(fetch_statement(query, cursor, limit, key)).all()
+
+
+def to_page(posts, per_page):
+    # posts holds up to per_page + 1 posts; the extra one only tells us there is a next page
+    next_cursor = encode_cursor(posts[per_page - 1]) if len(posts) > per_page else None
+    return Page(posts[:per_page], next_cursor)
+
+
+def merge_newest_first(posts):
+    # one newest-first list from several, without duplicates
+    return sorted({post.id: post for post in posts}.values(),
+                  key=lambda post: (post.timestamp, post.id), reverse=True)
+
+
+def paginate(query, cursor=None, per_page=None, archived=None):
+    # query is any select(Post) statement (e.g. sa.select(Post) or user.posts.select()).
+    # We fetch one extra row to find out whether there is a next page without running a COUNT.
+    # archived(cursor, limit) returns the matching posts from the archive (see app/archive.py); it is
+    # only called once the hot post table has run out, so recent pages never touch the archive.
+    per_page = per_page or current_app.config['POSTS_PER_PAGE']
+    posts = _fetch(query, cursor, per_page + 1)
+    if archived is not None and len(posts) <= per_page:
+        posts += archived(cursor, per_page + 1)
+        # normally all older than the hot posts, but posts imported after the last archive run may not be
+        posts = merge_newest_first(posts)[:per_page + 1]
+    return to_page(posts, per_page)
+
+
+def followed_celebrities_statement(user_id):
+    return (sa.select(User.id)
+            .join(followers, followers.c.followed_id == User.id)
+            .where(followers.c.follower_id == user_id,
+                   User.follower_count > current_app.config['TIMELINE_CELEBRITY_THRESHOLD']))
+
+
+def inbox_statement(user_id):
+    return sa.select(Post).join(TimelineEntry, TimelineEntry.post_id == Post.id).where(
+        TimelineEntry.user_id == user_id)
+
+
+def _followed_celebrities(user):
+    return db.session.scalars(followed_celebrities_statement(user.id)).all()
+
+
+def newest_key(query, key=POST_KEY):
+    # the (timestamp, id) of the newest row of a listing, read from the index without loading the row
+    return tuple(db.session.execute(newest_first(query, key).with_only_columns(*key).limit(1)).first() or ())
+
+
+def user_posts_stamp(user):
+    # changes whenever the user's post list changes (they only ever get new posts at the top)
+    return newest_key(sa.select(Post).where(Post.user_id == user.id))
+
+
+def home_timeline_stamp(user):
+    # changes whenever home_timeline(user) could: a new post in the inbox or from a followed celebrity,
+    # or a follow/unfollow (which backfills or removes older inbox entries, hence the following count)
+    stamp = [newest_key(sa.select(TimelineEntry).where(TimelineEntry.user_id == user.id), TIMELINE_KEY),
+             user.following_count()]
+    celebrity_ids = _followed_celebrities(user)
+    if celebrity_ids:
+        stamp.append(newest_key(sa.select(Post).where(Post.user_id.in_(celebrity_ids))))
+    return stamp
+
+
+def home_timeline(user, cursor=None, per_page=None):
+    # The materialized inbox (filled by app/timeline.py) holds the user's own posts and those of
+    # every regular author they follow. Posts from followed celebrities were never fanned out, so we
+    # read those directly and merge the two newest-first lists; both sides are keyset range scans.
+    per_page = per_page or current_app.config['POSTS_PER_PAGE']
+    posts = _fetch(inbox_statement(user.id), cursor, per_page + 1, TIMELINE_KEY)
+
+    celebrity_ids = _followed_celebrities(user)
+    if celebrity_ids:
+        posts += _fetch(sa.select(Post).where(Post.user_id.in_(celebrity_ids)),
+                        cursor, per_page + 1)
+        # an author who crossed the threshold can have posts on both sides
+        posts = merge_newest_first(posts)
+
+    return to_page(posts, per_page)
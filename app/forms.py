@@ -3,10 +3,11 @@ from flask_wtf import FlaskForm
 from wtforms import StringField,PasswordField,BooleanField,SubmitField
 from wtforms.validators import ValidationError,DataRequired,Email,EqualTo
 import sqlalchemy as sa 
-from app import db
-from app.models import User
+from app import taken_names
+from flask_login import current_user
 from wtforms import TextAreaField
 from wtforms.validators import Length
+from flask import request
 
 class LoginForm(FlaskForm):
     username = StringField('Username' , validators = [DataRequired()])
@@ -27,16 +28,34 @@ class RegistrationForm(FlaskForm):
     submit  = SubmitField('Register')
 
     def validate_username(self,username) : 
-        user = db.session.scalar(sa.select(User).where(User.username == username.data))
-        if user is not None : 
+        if taken_names.username_taken(username.data):
             raise ValidationError('Please use a different username.')
         
     def validate_email(self,email):
-        user = db.session.scalar(sa.select(User).where(User.email == email.data))
-        if user is not None:
+        if taken_names.email_taken(email.data):
             raise ValidationError('Please enter a differnt email address.')
+    # Both checks ignore case ('Susan' is taken if 'susan' is) and usually don't query the database at all (see app/names.py).
     # When you add any methods that match the pattern validate_<field_name>, WTForms takes those as custom validators and invokes them in addition to the stock validators. I have added two of those methods to this class for the username and email fields.
 
+class EmptyForm(FlaskForm):
+    submit = SubmitField('Submit')
+    # a form with only a button, used for actions like follow/unfollow that need a POST (and CSRF protection) but no input fields
+
+class PostForm(FlaskForm):
+    post = TextAreaField('Say something', validators=[DataRequired(), Length(min=1, max=140)])
+    submit = SubmitField('Submit')
+
+class SearchForm(FlaskForm):
+    q = StringField('Search', validators=[DataRequired()])
+
+    def __init__(self, *args, **kwargs):
+        if 'formdata' not in kwargs:
+            kwargs['formdata'] = request.args
+        if 'meta' not in kwargs:
+            kwargs['meta'] = {'csrf': False}
+        super(SearchForm, self).__init__(*args, **kwargs)
+    # the search box sends a GET request (so results can be bookmarked), which means the text comes from request.args instead of the posted form, and there is no CSRF token to check
+
 class EditProfileForm(FlaskForm):
     username = StringField('Username', validators=[DataRequired()])
     about_me = TextAreaField('About me', validators=[Length(min=0 , max=140)])
@@ -53,9 +72,9 @@ class EditProfileForm(FlaskForm):
     # A custom validation method for the username field. Flask-WTF automatically calls methods named validate_<field_name> (e.g., validate_username) to check if the input is valid. flask wtf checks for custom validators whenever rest of the validators are being checked.
     def validate_username(self,username):
         if username.data != self.original_username:
-            user = db.session.scalar(sa.select(User).where(User.username == username.data))
-            if user is not None:
+            if taken_names.username_taken(username.data, by_other_than=current_user.id):
                 raise ValidationError('Please use a differnt username.')
+            # by_other_than: changing only the case of your own username is allowed
             # Whenever a validation error is raised by this, the html file edit_profile catches it in the 
             # {% for error in form.about_me.errors %}
             # <span style="color: red;">[{{ error }}]</span>
@@ -0,0 +1,156 @@
+# Fragment cache for rendered posts.
+# The index and profile pages render _post.html once per post on every request, even though a post's
+# HTML only changes when its author changes their profile. Templates call render_post(post) instead of
+# including _post.html; the HTML is cached under (post id, author id, author profile_version), and
+# edit_profile() bumps User.profile_version, so an edited profile simply stops matching its old
+# entries (which then age out) instead of us having to find and delete them. The key also holds a hash
+# of _post.html's source, so after a deploy that changes the template (the sqlite backend outlives
+# restarts) old entries stop matching the same way.
+# Two backends ship with the app, picked with FRAGMENT_CACHE_BACKEND:
+#   'memory' - a per-process LRU limited to FRAGMENT_CACHE_MAX_BYTES
+#   'sqlite' - a file at FRAGMENT_CACHE_PATH shared by every worker on the machine; when it grows past
+#              FRAGMENT_CACHE_MAX_BYTES the oldest written entries are dropped first
+# Any object with get(key) and set(key, html) can be used as a backend.
+import hashlib
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+
+from markupsafe import Markup
+
+from app.instrumentation import record_render
+
+
+class MemoryBackend:
+    def __init__(self, app):
+        self.max_bytes = app.config['FRAGMENT_CACHE_MAX_BYTES']
+        self.size = 0
+        self._lock = threading.Lock()
+        self._entries = OrderedDict()
+
+    def get(self, key):
+        with self._lock:
+            html = self._entries.get(key)
+            if html is not None:
+                self._entries.move_to_end(key)
+            return html
+
+    def set(self, key, html):
+        with self._lock:
+            old = self._entries.pop(key, None)
+            if old is not None:
+                self.size -= len(old)
+            self._entries[key] = html
+            self.size += len(html)
+            while self.size > self.max_bytes and self._entries:
+                _, evicted = self._entries.popitem(last=False)
+                self.size -= len(evicted)
+
+
+class SQLiteBackend:
+    # how many writes happen between checks of the total size
+    TRIM_EVERY = 256
+
+    def __init__(self, app):
+        self.path = app.config['FRAGMENT_CACHE_PATH']
+        self.max_bytes = app.config['FRAGMENT_CACHE_MAX_BYTES']
+        self._local = threading.local()
+        self._writes = 0
+
+    def _connection(self):
+        # sqlite3 connections can't be shared between threads, so each thread opens its own
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=5, isolation_level=None)
+            conn.execute('PRAGMA journal_mode=WAL')
+            conn.execute('CREATE TABLE IF NOT EXISTS fragment '
+                         '(key TEXT PRIMARY KEY, html TEXT NOT NULL, created REAL NOT NULL)')
+            conn.execute('CREATE INDEX IF NOT EXISTS ix_fragment_created ON fragment (created)')
+            self._local.conn = conn
+        return conn
+
+    def get(self, key):
+        row = self._connection().execute(
+            'SELECT html FROM fragment WHERE key = ?', (key,)).fetchone()
+        return row[0] if row else None
+
+    def set(self, key, html):
+        conn = self._connection()
+        conn.execute('INSERT OR REPLACE INTO fragment (key, html, created) VALUES (?, ?, ?)',
+                     (key, html, time.time()))
+        self._writes += 1
+        if self._writes % self.TRIM_EVERY == 0:
+            self.trim(conn)
+
+    def trim(self, conn):
+        total = conn.execute('SELECT coalesce(sum(length(html)), 0) FROM fragment').fetchone()[0]
+        while total > self.max_bytes:
+            removed = conn.execute(
+                'SELECT coalesce(sum(length(html)), 0), count(*) FROM ('
+                'SELECT html FROM fragment ORDER BY created LIMIT 100)').fetchone()
+            conn.execute('DELETE FROM fragment WHERE key IN '
+                         '(SELECT key FROM fragment ORDER BY created LIMIT 100)')
+            total -= removed[0]
+            if not removed[1]:
+                break
+
+
+BACKENDS = {'memory': MemoryBackend, 'sqlite': SQLiteBackend}
+
+
+class FragmentCache:
+    def __init__(self, app=None):
+        self.app = None
+        self.backend = None
+        self.hits = 0
+        self.misses = 0
+        self._stats_lock = threading.Lock()
+        self._template_version = None
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        self.app = app
+        backend = app.config['FRAGMENT_CACHE_BACKEND']
+        self.backend = BACKENDS[backend](app) if isinstance(backend, str) else backend
+        self._template_version = None
+        app.jinja_env.globals['render_post'] = self.render_post
+
+    def hit_ratio(self):
+        lookups = self.hits + self.misses
+        return self.hits / lookups if lookups else 0.0
+
+    def _count(self, hit):
+        # request threads count at the same time, and += is not atomic
+        with self._stats_lock:
+            if hit:
+                self.hits += 1
+            else:
+                self.misses += 1
+            hits, misses = self.hits, self.misses
+        # log the running hit ratio every so often so the cache size can be tuned from the logs
+        if (hits + misses) % self.app.config['FRAGMENT_CACHE_STATS_EVERY'] == 0:
+            self.app.logger.info('Fragment cache: %d hits, %d misses (%.1f%% hit ratio)',
+                                 hits, misses, 100 * hits / (hits + misses))
+
+    def template_version(self):
+        # a short hash of _post.html's source, worked out once per process
+        if self._template_version is None:
+            source, _, _ = self.app.jinja_env.loader.get_source(self.app.jinja_env, '_post.html')
+            self._template_version = hashlib.blake2b(source.encode('utf-8'), digest_size=4).hexdigest()
+        return self._template_version
+
+    def render_post(self, post):
+        key = f'post:{self.template_version()}:{post.id}:{post.user_id}:{post.author.profile_version}'
+        html = self.backend.get(key)
+        self._count(html is not None)
+        if html is None:
+            template = self.app.jinja_env.get_template('_post.html')
+            started = time.perf_counter()
+            html = template.render(post=post)
+            record_render(template.name, time.perf_counter() - started)
+            # rendered directly rather than with render_template(), which would run every context
+            # processor and send two signals for each post of the page; _post.html only needs `post`
+            self.backend.set(key, html)
+        return Markup(html)
@@ -0,0 +1,62 @@
+# Conditional GET for the index and profile pages.
+# A page gets a weak ETag built from a few cheap "version stamps" instead of from its HTML: e.g. for a
+# profile page the user's profile_version, follower count, last_seen and the (timestamp, id) of their
+# newest post. When the browser sends the ETag back in If-None-Match and the stamps haven't changed,
+# the view answers 304 Not Modified before loading the posts or rendering any template.
+#     etag = page_etag(user.profile_version, user_posts_stamp(user), ...)
+#     if is_fresh(etag):
+#         return not_modified(etag)
+#     return cacheable(make_response(render_template(...)), etag)
+# Every ETag also covers who is looking (the pages show the viewer's own name, follow buttons, ...),
+# the templates themselves (their newest modification time, so a deploy that changes them can't be
+# answered with 304), and the CSRF time window: the page contains a CSRF token that expires after
+# WTF_CSRF_TIME_LIMIT seconds, so a cached copy is never reused for longer than half of that.
+# The pages are only shown to logged-in users and differ per user, so they are marked
+# "Cache-Control: private, no-cache" (the browser may keep them but must ask every time) with
+# "Vary: Cookie"; a shared proxy must not store them.
+import hashlib
+import os
+import time
+
+from flask import current_app, make_response, request, session
+from flask_login import current_user
+
+_template_stamps = {}
+
+
+def template_stamp():
+    folder = os.path.join(current_app.root_path, current_app.template_folder)
+    if folder not in _template_stamps:
+        _template_stamps[folder] = max(
+            (os.path.getmtime(os.path.join(root, name))
+             for root, _, names in os.walk(folder) for name in names), default=0)
+    return _template_stamps[folder]
+
+
+def page_etag(*stamps):
+    # None when the page has to be rendered anyway: for a form submission, or when there are flashed
+    # messages (they are shown once and then removed, so such a page must never be served from cache)
+    if request.method != 'GET' or session.get('_flashes'):
+        return None
+    csrf_limit = current_app.config.get('WTF_CSRF_TIME_LIMIT', 3600)
+    csrf_window = int(time.time() // (csrf_limit / 2)) if csrf_limit else 0
+    viewer = (current_user.id, current_user.profile_version) if current_user.is_authenticated else None
+    raw = repr((request.full_path, viewer, csrf_window, template_stamp(), stamps))
+    return hashlib.blake2b(raw.encode('utf-8'), digest_size=16).hexdigest()
+
+
+def is_fresh(etag):
+    return etag is not None and request.if_none_match.contains_weak(etag)
+
+
+def cacheable(response, etag):
+    response.headers['Cache-Control'] = 'private, no-cache'
+    response.vary.add('Cookie')
+    if etag is not None:
+        response.set_etag(etag, weak=True)
+    return response
+
+
+def not_modified(etag):
+    response = make_response('', 304)
+    return cacheable(response, etag)
@@ -0,0 +1,70 @@
+# Identity cache for the logged-in user.
+# Flask-Login calls load_user() (app/models.py) on every request of a logged-in user, which would be
+# one SELECT per page view just to learn who is asking. Instead a snapshot of the user with only the
+# fields that identify them (id, username, email, avatar digest, profile version) is kept in a small
+# per-process LRU for IDENTITY_CACHE_TTL seconds, and each request gets a copy of it attached to its
+# own session with session.merge(load=False), which doesn't touch the database.
+# - anything else (about_me, counters, last_seen, ...) is loaded from the database the first time a
+#   request actually reads it, so those values are never stale
+# - edit_profile() and User.set_password() drop the user's entry; other worker processes may show the
+#   old username for at most IDENTITY_CACHE_TTL seconds
+import threading
+import time
+from collections import OrderedDict
+
+import sqlalchemy.orm as so
+
+FIELDS = ('id', 'username', 'email', 'avatar_digest', 'profile_version')
+
+
+class IdentityCache:
+    def __init__(self, app=None):
+        self.app = None
+        self._lock = threading.Lock()
+        self._entries = OrderedDict()
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        self.app = app
+
+    def get(self, user_id):
+        # a detached snapshot of the user, or None when it isn't cached (or has expired)
+        with self._lock:
+            entry = self._entries.get(user_id)
+            if entry is None:
+                return None
+            expires, snapshot = entry
+            if expires < time.monotonic():
+                del self._entries[user_id]
+                return None
+            self._entries.move_to_end(user_id)
+            return snapshot
+
+    def put(self, user):
+        from app.models import User
+        # imported here because app/models.py imports this module's instance from app/__init__.py
+        snapshot = User(**{field: getattr(user, field) for field in FIELDS})
+        so.make_transient_to_detached(snapshot)
+        # now it looks like a user that was loaded and then detached, with only FIELDS loaded
+        with self._lock:
+            self._entries[user.id] = (time.monotonic() + self.app.config['IDENTITY_CACHE_TTL'], snapshot)
+            self._entries.move_to_end(user.id)
+            while len(self._entries) > self.app.config['IDENTITY_CACHE_SIZE']:
+                self._entries.popitem(last=False)
+
+    def invalidate(self, user_id):
+        with self._lock:
+            self._entries.pop(user_id, None)
+
+    def load(self, session, user_id):
+        # the user for this request: the cached snapshot merged into `session` without a query, or
+        # loaded from the database (and cached) on a miss
+        from app.models import User
+        snapshot = self.get(user_id)
+        if snapshot is not None:
+            return session.merge(snapshot, load=False)
+        user = session.get(User, user_id)
+        if user is not None:
+            self.put(user)
+        return user
@@ -0,0 +1,121 @@
+# Bulk loading of users and posts (used by the `flask import` command in microblog.py).
+# Records are streamed from a JSONL or CSV file and written in batches with one executemany INSERT per
+# batch, instead of an add() + commit() per object. Users:  username, email, password, about_me.
+# Posts: username, body and optionally timestamp (ISO 8601). Password hashing is the slow part of
+# loading users, so it runs on a pool of worker processes.
+# Imported posts are put in their authors' own timelines (nobody follows an imported user yet, so
+# there is nothing else to fan out), counted in User.post_count and added to the search index.
+import csv
+import json
+import time
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime, timezone
+from itertools import islice, repeat
+
+import sqlalchemy as sa
+from werkzeug.security import generate_password_hash
+
+from app import db
+from app.avatars import email_digest
+from app.names import normalize
+from app.counters import add_posts
+from app.models import User, Post, TimelineEntry
+from app.passwords import password_method
+from app.search import add_to_index
+
+
+def read_records(path, fmt=None):
+    fmt = fmt or ('csv' if path.endswith('.csv') else 'jsonl')
+    with open(path, newline='', encoding='utf-8') as f:
+        if fmt == 'csv':
+            yield from csv.DictReader(f)
+        else:
+            for line in f:
+                if line.strip():
+                    yield json.loads(line)
+
+
+def batched(records, size):
+    records = iter(records)
+    while batch := list(islice(records, size)):
+        yield batch
+
+
+class Progress:
+    # prints how many rows have been written so far and the overall rows/second
+    def __init__(self, kind, echo):
+        self.kind = kind
+        self.echo = echo
+        self.rows = 0
+        self.started = time.perf_counter()
+
+    def add(self, rows):
+        self.rows += rows
+        elapsed = time.perf_counter() - self.started
+        self.echo(f'{self.kind}: {self.rows} rows in {elapsed:.1f}s '
+                  f'({self.rows / elapsed if elapsed else 0:.0f} rows/s)')
+
+
+def import_users(records, batch_size, workers, echo=print):
+    progress = Progress('users', echo)
+    method = password_method()
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        for batch in batched(records, batch_size):
+            passwords = [record.get('password') or '' for record in batch]
+            hashes = pool.map(generate_password_hash, passwords, repeat(method),
+                              chunksize=max(1, len(batch) // (workers * 4)))
+            rows = [{'username': record['username'],
+                     'email': record['email'],
+                     'password_hash': password_hash if record.get('password') else None,
+                     'about_me': record.get('about_me') or None,
+                     'avatar_digest': email_digest(record['email']),
+                     'username_key': normalize(record['username']),
+                     'email_key': normalize(record['email'])}
+                    for record, password_hash in zip(batch, hashes)]
+            db.session.execute(sa.insert(User.__table__), rows)
+            # Core insert, so ORM events (like User.validate_email) don't run; that's why avatar_digest and the normalized keys are set above
+            db.session.commit()
+            progress.add(len(rows))
+    return progress.rows
+
+
+def import_posts(records, batch_size, echo=print):
+    progress = Progress('posts', echo)
+    user_ids = {}
+    for batch in batched(records, batch_size):
+        missing = {record['username'] for record in batch} - user_ids.keys()
+        if missing:
+            user_ids.update(db.session.execute(
+                sa.select(User.username, User.id).where(User.username.in_(missing))).all())
+        rows = []
+        for record in batch:
+            if record['username'] not in user_ids:
+                raise ValueError('Unknown user {!r} in post {!r}'.format(record['username'], record))
+            timestamp = datetime.fromisoformat(record['timestamp']) if record.get('timestamp') \
+                else datetime.now(timezone.utc).replace(tzinfo=None)
+            if timestamp.tzinfo is not None:
+                timestamp = timestamp.astimezone(timezone.utc).replace(tzinfo=None)
+            # stored as naive UTC, like the app's own timestamps: one with an offset (e.g. +02:00) is
+            # converted first, one without is taken to be UTC already
+            rows.append({'user_id': user_ids[record['username']], 'body': record['body'],
+                         'timestamp': timestamp})
+            # every row needs the same keys for executemany, so the default timestamp is filled in here
+        post_ids = db.session.scalars(sa.insert(Post.__table__).returning(
+            Post.__table__.c.id, sort_by_parameter_order=True), rows).all()
+        # the ids of exactly the rows inserted here, in the order of `rows`: posts that live requests or
+        # the ingestion thread write meanwhile must not be fanned out, counted or indexed a second time
+        db.session.execute(sa.insert(TimelineEntry), [
+            {'user_id': row['user_id'], 'post_id': post_id, 'author_id': row['user_id'],
+             'timestamp': row['timestamp']} for row, post_id in zip(rows, post_ids)])
+        authors = {}
+        for row in rows:
+            count, newest = authors.get(row['user_id'], (0, row['timestamp']))
+            authors[row['user_id']] = (count + 1, max(newest, row['timestamp']))
+        add_posts(db.session.connection(), authors)
+        # the same counter update the session hook in app/counters.py does for ORM inserts, once per author per batch
+        db.session.commit()
+        add_to_index(Post.__tablename__, Post.__searchable__,
+                     [(post_id, row['body']) for row, post_id in zip(rows, post_ids)])
+        # Core inserts don't go through SearchableMixin's session events, so the new posts are indexed here
+        progress.add(len(rows))
+    return progress.rows
@@ -0,0 +1,144 @@
+# Batched post ingestion.
+# Committing every new post in its own transaction costs one fsync per post, and with SQLite every
+# one of those transactions also queues for the single database write lock. Instead, request
+# handlers hand new posts to PostIngester, which puts them on a bounded in-memory queue, and one
+# writer thread per process drains it: it waits for up to INGEST_MAX_DELAY seconds (or until it has
+# INGEST_BATCH_SIZE posts), then inserts the whole batch, fans it out (app/timeline.py) and commits
+# once - a "group commit". A thousand posts arriving within a few milliseconds cost one transaction.
+# - publish() only returns after the batch holding the post has been committed, so "Your post is
+#   now live!" means it really is in the database (with SQLITE_SYNCHRONOUS=NORMAL a commit survives
+#   an application crash but not a power cut; use FULL if that matters).
+# - if the queue already holds INGEST_QUEUE_SIZE posts, publish() waits at most INGEST_ENQUEUE_TIMEOUT
+#   seconds for room and then raises IngestBusy, so an overloaded writer slows posting down instead of
+#   piling up memory or request threads.
+# - if a batch fails, its posts are retried one by one so a single bad post can't sink the others; a
+#   post that still can't be written makes publish() raise IngestFailed (the database error is its
+#   __cause__), which the view turns into a message instead of a 500.
+import atexit
+import queue
+import threading
+import time
+import concurrent.futures
+from concurrent.futures import Future
+from datetime import datetime, timezone
+
+from app.replicas import mark_written
+
+
+class IngestBusy(Exception):
+    pass
+
+
+class IngestFailed(Exception):
+    pass
+
+
+class PostIngester:
+    def __init__(self, app=None):
+        self.app = None
+        self._queue = None
+        self._lock = threading.Lock()
+        self._thread = None
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        self.app = app
+        self._queue = queue.Queue(maxsize=app.config['INGEST_QUEUE_SIZE'])
+        atexit.register(self.close)
+
+    def submit(self, author_id, body, timestamp=None):
+        # returns a Future that gets the new post's id once it is committed
+        future = Future()
+        item = (author_id, body, timestamp or datetime.now(timezone.utc), future)
+        with self._lock:
+            if self._thread is None:
+                # started lazily so each worker process gets its own writer, even after a fork
+                self._thread = threading.Thread(target=self._run, name='post-ingest', daemon=True)
+                self._thread.start()
+        try:
+            self._queue.put(item, timeout=self.app.config['INGEST_ENQUEUE_TIMEOUT'])
+        except queue.Full:
+            raise IngestBusy('The post queue is full') from None
+        return future
+
+    def publish(self, author, body):
+        # submit and wait for the commit; a concurrent.futures.TimeoutError means the post is queued but not
+        # yet saved (before Python 3.11 that is not the builtin TimeoutError)
+        from app import db
+        future = self.submit(author.id, body)
+        mark_written()
+        # the writer thread commits it, so the request has to say it wrote (see app/replicas.py)
+        db.session.commit()
+        # ends the request's own transaction (normally there's nothing in it) so its pooled connection is
+        # returned while we wait; otherwise enough waiting requests take every connection in the pool
+        # and the writer can't get one to commit them
+        try:
+            return future.result(timeout=self.app.config['INGEST_ACK_TIMEOUT'])
+        except concurrent.futures.TimeoutError:
+            raise
+        except Exception as error:
+            raise IngestFailed('The post could not be saved') from error
+        # the writer thread already logged the error with its traceback
+
+    def _next_batch(self):
+        items = [self._queue.get()]
+        deadline = time.monotonic() + self.app.config['INGEST_MAX_DELAY']
+        while items[-1] is not None and len(items) < self.app.config['INGEST_BATCH_SIZE']:
+            remaining = deadline - time.monotonic()
+            try:
+                items.append(self._queue.get(timeout=remaining) if remaining > 0
+                             else self._queue.get_nowait())
+            except queue.Empty:
+                break
+        return items
+
+    def _run(self):
+        while True:
+            items = self._next_batch()
+            stop = items[-1] is None
+            # None is the shutdown signal sent by close(); everything before it is still written
+            items = [item for item in items if item is not None]
+            if items:
+                with self.app.app_context():
+                    self._write(items)
+            if stop:
+                return
+
+    def _write(self, items):
+        from app import db
+        # imported here rather than at the top so app/__init__.py can import this module before db exists
+        try:
+            ids = self._insert(items)
+        except Exception as error:
+            db.session.rollback()
+            if len(items) == 1:
+                items[0][3].set_exception(error)
+                self.app.logger.exception('Could not save a post')
+                return
+            for item in items:
+                self._write([item])
+            return
+        for item, post_id in zip(items, ids):
+            item[3].set_result(post_id)
+
+    def _insert(self, items):
+        from app import db
+        from app.models import Post
+        from app.timeline import fan_out
+        posts = [Post(user_id=author_id, body=body, timestamp=timestamp)
+                 for author_id, body, timestamp, _ in items]
+        # ORM objects rather than a Core insert, so session events (search indexing) see them
+        db.session.add_all(posts)
+        db.session.flush()
+        fan_out(posts)
+        ids = [post.id for post in posts]
+        # read before commit() expires the objects (afterwards each post.id would be another SELECT)
+        db.session.commit()
+        return ids
+
+    def close(self):
+        # write whatever is still queued before the process exits
+        if self._thread is not None and self._thread.is_alive():
+            self._queue.put(None)
+            self._thread.join(timeout=self.app.config['INGEST_ACK_TIMEOUT'])
@@ -0,0 +1,158 @@
+# Per-request SQL instrumentation.
+# SQLAlchemy engine events time every statement, and Flask's request_started signal gives each request
+# a fresh QueryStats in flask.g, so after a request we know how many queries it ran, how long they took
+# in total and which were the slowest. That is what catches N+1 problems (e.g. a page that loads
+# post.author once per post): query_stats() can be checked after a test-client request.
+# - statements slower than SLOW_QUERY_THRESHOLD seconds are written to app.logger as warnings, which
+#   in production ends up in logs/microblog.log through the RotatingFileHandler set up in __init__.py
+# - with SQL_DEBUG_HEADERS on, every response carries the numbers in X-DB-Queries / X-DB-Time /
+#   X-DB-Slowest headers (off by default, since it shows internals to anyone who looks)
+# Template rendering is timed the same way (TemplateInstrumentation): Flask's before_render_template /
+# template_rendered signals bracket every render_template(), and posts rendered by the fragment cache
+# report themselves with record_render(), so a request knows how long each template took.
+# - times are inclusive: index.html's time contains the _post.html renders done inside its loop
+# - renders slower than SLOW_RENDER_THRESHOLD seconds are logged as warnings
+# - with TEMPLATE_DEBUG_HEADERS on, responses carry X-Render-Time (all top-level renders) and
+#   X-Render-Templates (renders and time per template, slowest first)
+import heapq
+import time
+
+import sqlalchemy as sa
+from flask import before_render_template, current_app, g, has_request_context, request_started, template_rendered
+
+
+class QueryStats:
+    def __init__(self, keep):
+        self.count = 0
+        self.total_time = 0.0
+        self.keep = keep
+        self.slowest = []
+        # a small min-heap of (duration, statement), so only the `keep` slowest statements are remembered
+
+    def add(self, statement, duration):
+        self.count += 1
+        self.total_time += duration
+        if len(self.slowest) < self.keep:
+            heapq.heappush(self.slowest, (duration, statement))
+        elif duration > self.slowest[0][0]:
+            heapq.heapreplace(self.slowest, (duration, statement))
+
+    def slowest_first(self):
+        return sorted(self.slowest, reverse=True)
+
+
+def query_stats():
+    # the stats of the current request (None outside of a request)
+    return g.get('sql_stats')
+
+
+class SQLInstrumentation:
+    def __init__(self, app=None, db=None):
+        self.app = None
+        if app is not None:
+            self.init_app(app, db)
+
+    def init_app(self, app, db):
+        self.app = app
+        with app.app_context():
+            engines = list(db.engines.values())
+        for engine in engines:
+            # the main database and every bind (archive, read replicas)
+            sa.event.listen(engine, 'before_cursor_execute', self._before_execute)
+            sa.event.listen(engine, 'after_cursor_execute', self._after_execute)
+        request_started.connect(self._request_started, app)
+        app.after_request(self._add_headers)
+
+    def _request_started(self, sender, **extra):
+        g.sql_stats = QueryStats(self.app.config['SQL_SLOWEST_KEPT'])
+
+    def _before_execute(self, conn, cursor, statement, parameters, context, executemany):
+        context.query_started = time.perf_counter()
+        # kept on the statement's execution context rather than on the (pooled) connection: a statement
+        # that raises never reaches _after_execute, and its start time is simply dropped with it
+
+    def _after_execute(self, conn, cursor, statement, parameters, context, executemany):
+        duration = time.perf_counter() - context.query_started
+        if has_request_context() and 'sql_stats' in g:
+            g.sql_stats.add(statement, duration)
+        if duration >= self.app.config['SLOW_QUERY_THRESHOLD']:
+            self.app.logger.warning('Slow query (%.1f ms): %s', duration * 1000, statement)
+
+    def _add_headers(self, response):
+        stats = query_stats()
+        if self.app.config['SQL_DEBUG_HEADERS'] and stats is not None:
+            response.headers['X-DB-Queries'] = str(stats.count)
+            response.headers['X-DB-Time'] = f'{stats.total_time * 1000:.2f}ms'
+            if stats.slowest:
+                response.headers['X-DB-Slowest'] = f'{max(stats.slowest)[0] * 1000:.2f}ms'
+        return response
+
+
+class RenderStats:
+    def __init__(self):
+        self.total_time = 0.0
+        self.templates = {}
+        # template name -> [renders, seconds]
+        self.started = []
+        # start times of the renders in progress; more than one while a template renders another
+
+    def add(self, name, duration, nested):
+        entry = self.templates.setdefault(name, [0, 0.0])
+        entry[0] += 1
+        entry[1] += duration
+        if not nested:
+            self.total_time += duration
+
+    def slowest_first(self):
+        return sorted(((name, count, seconds) for name, (count, seconds) in self.templates.items()),
+                      key=lambda entry: entry[2], reverse=True)
+
+
+def render_stats():
+    # the template timings of the current request (None outside of a request)
+    return g.get('render_stats')
+
+
+def record_render(name, duration):
+    # for templates rendered without render_template() (and so without its signals)
+    stats = render_stats() if has_request_context() else None
+    if stats is not None:
+        stats.add(name, duration, nested=bool(stats.started))
+    if duration >= current_app.config['SLOW_RENDER_THRESHOLD']:
+        current_app.logger.warning('Slow render (%.1f ms): %s', duration * 1000, name)
+
+
+class TemplateInstrumentation:
+    def __init__(self, app=None):
+        self.app = None
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        self.app = app
+        request_started.connect(self._request_started, app)
+        before_render_template.connect(self._before_render, app)
+        template_rendered.connect(self._after_render, app)
+        app.after_request(self._add_headers)
+
+    def _request_started(self, sender, **extra):
+        g.render_stats = RenderStats()
+
+    def _before_render(self, sender, template, context, **extra):
+        stats = render_stats() if has_request_context() else None
+        if stats is not None:
+            stats.started.append(time.perf_counter())
+
+    def _after_render(self, sender, template, context, **extra):
+        stats = render_stats() if has_request_context() else None
+        if stats is not None and stats.started:
+            duration = time.perf_counter() - stats.started.pop()
+            record_render(template.name, duration)
+
+    def _add_headers(self, response):
+        stats = render_stats()
+        if self.app.config['TEMPLATE_DEBUG_HEADERS'] and stats is not None and stats.templates:
+            response.headers['X-Render-Time'] = f'{stats.total_time * 1000:.2f}ms'
+            response.headers['X-Render-Templates'] = ', '.join(
+                f'{name} {count}x {seconds * 1000:.2f}ms' for name, count, seconds in stats.slowest_first())
+        return response
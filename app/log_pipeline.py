@@ -0,0 +1,137 @@
+# Non-blocking logging.
+# A plain SMTPHandler sends its email from inside the request that failed, so a burst of 500 errors
+# keeps every worker busy talking to the mail server, and RotatingFileHandler writes to disk on the
+# request thread too. Instead app.logger only gets a QueueHandler: logging a message just puts it on an
+# in-memory queue, and a QueueListener thread hands it to the real (slow) handlers.
+# Error emails also go through DigestMailHandler: errors are grouped by a fingerprint (exception type
+# and the line that raised it), counted, and sent as one digest email at most every
+# LOG_MAIL_DIGEST_INTERVAL seconds listing at most LOG_MAIL_MAX_ERRORS different errors. A thousand
+# identical failures become one line with "x1000" instead of a thousand emails.
+# To try it locally, run a debugging SMTP server (e.g. `python -m aiosmtpd -n -c aiosmtpd.handlers.Debugging -l localhost:8025`)
+# and set MAIL_SERVER=localhost and MAIL_PORT=8025.
+import atexit
+import logging
+import os
+import queue
+import smtplib
+import threading
+import time
+import traceback
+from collections import OrderedDict
+from email.message import EmailMessage
+from logging.handlers import QueueHandler, QueueListener
+
+
+def fingerprint(record):
+    if record.exc_info and record.exc_info[0] is not None:
+        frames = traceback.extract_tb(record.exc_info[2])
+        where = f'{frames[-1].filename}:{frames[-1].lineno}' if frames else record.pathname
+        return f'{record.exc_info[0].__name__} at {where}'
+    return f'{record.msg} at {record.pathname}:{record.lineno}'
+
+
+class BackgroundQueueHandler(QueueHandler):
+    # Sends records to `handlers` on a listener thread. The thread (and its queue) is started by the
+    # first record logged in each process, so workers forked from a preloaded master get their own.
+    def __init__(self, handlers):
+        super().__init__(queue.SimpleQueue())
+        self.targets = handlers
+        self.listener = None
+        self._pid = None
+        self._lock = threading.Lock()
+
+    def _start(self):
+        with self._lock:
+            if self._pid == os.getpid():
+                return
+            self.queue = queue.SimpleQueue()
+            self.listener = QueueListener(self.queue, *self.targets, respect_handler_level=True)
+            self.listener.start()
+            self._pid = os.getpid()
+            atexit.register(self.stop)
+
+    def stop(self):
+        # called at exit: wait for the queue to drain, then send whatever digest is still pending
+        if self.listener is not None and self._pid == os.getpid():
+            self.listener.stop()
+            self.listener = None
+            for handler in self.targets:
+                handler.flush()
+
+    def prepare(self, record):
+        # the record is flattened into plain text before it crosses to the other thread, which loses the exception, so the fingerprint is worked out first
+        record.fingerprint = fingerprint(record)
+        return super().prepare(record)
+
+    def emit(self, record):
+        if self._pid != os.getpid():
+            self._start()
+        super().emit(record)
+
+
+class DigestMailHandler(logging.Handler):
+    def __init__(self, mailhost, fromaddr, toaddrs, subject, credentials=None, secure=None,
+                 interval=300, max_errors=20):
+        super().__init__()
+        self.mailhost = mailhost
+        self.fromaddr = fromaddr
+        self.toaddrs = toaddrs
+        self.subject = subject
+        self.credentials = credentials
+        self.secure = secure
+        self.interval = interval
+        self.max_errors = max_errors
+        self.pending = OrderedDict()
+        # fingerprint -> [number of times seen, the first occurrence formatted]
+        self.timer = None
+        self.last_sent = 0.0
+
+    def emit(self, record):
+        key = getattr(record, 'fingerprint', None) or fingerprint(record)
+        with self.lock:
+            if key in self.pending:
+                self.pending[key][0] += 1
+            else:
+                self.pending[key] = [1, self.format(record)]
+            if self.timer is None:
+                delay = max(0.0, self.last_sent + self.interval - time.monotonic())
+                self.timer = threading.Timer(delay, self.flush)
+                self.timer.daemon = True
+                self.timer.start()
+
+    def flush(self):
+        with self.lock:
+            if self.timer is not None:
+                self.timer.cancel()
+                self.timer = None
+            pending, self.pending = self.pending, OrderedDict()
+            if not pending:
+                return
+            self.last_sent = time.monotonic()
+        try:
+            self.send(self.digest(pending))
+        except Exception:
+            # nowhere sensible to log a logging failure; print it like logging does
+            self.handleError(logging.makeLogRecord({'msg': 'Could not send error digest'}))
+
+    def digest(self, pending):
+        total = sum(count for count, _ in pending.values())
+        parts = [f'{total} errors ({len(pending)} different) since the last report.\n']
+        for key, (count, first) in list(pending.items())[:self.max_errors]:
+            parts.append(f'=== x{count}  {key}\n{first}\n')
+        if len(pending) > self.max_errors:
+            parts.append(f'... and {len(pending) - self.max_errors} more different errors.\n')
+        return '\n'.join(parts)
+
+    def send(self, body):
+        message = EmailMessage()
+        message['From'] = self.fromaddr
+        message['To'] = ', '.join(self.toaddrs)
+        message['Subject'] = self.subject
+        message.set_content(body)
+        with smtplib.SMTP(self.mailhost[0], self.mailhost[1], timeout=10) as smtp:
+            if self.secure is not None:
+                smtp.starttls(*self.secure)
+            if self.credentials:
+                smtp.login(*self.credentials)
+            smtp.send_message(message)
@@ -7,15 +7,30 @@ import sqlalchemy.orm as so
 from app import db
 # Imports the db object from your Flask app’s app/__init__.py. This db is an instance of Flask-SQLAlchemy, a Flask extension that simplifies SQLAlchemy integration with Flask. It’s configured to connect to your database (e.g., SQLite via sqlite:///app.db) and is used to define models and interact with the database.
 from datetime import datetime,timezone
+from itertools import groupby
 from werkzeug.security import generate_password_hash, check_password_hash
 #Used to transform a password into a long encoded string through some series of cryptographic operations that have no reverse operation. And two passwords have different cryptographic salts which make them not possible to identify if two people have the same password. 
 
 from flask_login import UserMixin
 # instead of Writing All That code for each of the 4 requirement of the flask login, Flask-Login gives you a ready-made class called UserMixin, which already includes all of these, so you don’t have to write them manually. so,UserMixin is a convenient helper class provided by Flask-Login that gives your User model all the basic methods and properties Flask-Login needs.
 
-from app import login 
+from app import login, identity_cache
+from app.passwords import password_method, needs_rehash
+from app.search import add_to_index, remove_from_index, query_index, clear_index
+
+from flask import url_for
+from app.avatars import email_digest, standard_size
+from app.names import normalize
+
+followers = sa.Table(
+    'followers',
+    db.metadata,
+    sa.Column('follower_id', sa.Integer, sa.ForeignKey('user.id'), primary_key=True),
+    sa.Column('followed_id', sa.Integer, sa.ForeignKey('user.id'), primary_key=True, index=True)
+)
+# association table for the follower graph: one row per (follower, followed) pair. The primary key
+# answers "who do I follow", the followed_id index answers "who follows me" (needed for fan-out).
 
-from hashlib import md5
 # This class defines the structure of the user table, including its columns (fields) and their properties. It allows you to create, read, update, and delete (CRUD) user records in the database using Python code.
 class User(UserMixin, db.Model):
     # Why is a constructor not needed here ? 
@@ -55,29 +70,164 @@ class User(UserMixin, db.Model):
 # Purpose: Stores the user’s username, which must be unique (e.g., no two users can have the username “suraj”). The index improves performance for username-based queries.
 
     email: so.Mapped[str] = so.mapped_column(sa.String(64), index = True, unique=True)
+    username_key: so.Mapped[str] = so.mapped_column(sa.String(64), index=True, unique=True)
+    email_key: so.Mapped[str] = so.mapped_column(sa.String(64), index=True, unique=True)
+    # the username and email casefolded (see app/names.py), set by the validators below; their unique indexes stop 'Susan' and 'susan' from both existing
+    names_changed_at: so.Mapped[Optional[datetime]] = so.mapped_column(index=True)
+    # when username_key or email_key last changed, so other workers' filters of taken names pick up renames as well as new users (see app/names.py)
     password_hash : so.Mapped[Optional[str]] = so.mapped_column(sa.String(256))
     #  defines that The column can be nullable in database terms.
     posts : so.WriteOnlyMapped['Post'] = so.relationship(back_populates='author')
 
     about_me : so.Mapped[Optional[str]] = so.mapped_column(sa.String(140))
     # a bit about the user to showcase beside the user profile.
+    avatar_digest : so.Mapped[Optional[str]] = so.mapped_column(sa.String(32), index=True)
+    # md5 of the lower-cased email, worked out once when the email is set instead of every time an avatar is drawn; indexed so /avatar/ can check that a digest belongs to someone (see app/avatars.py)
     last_seen : so.Mapped[Optional[datetime]] = so.mapped_column(default=lambda: datetime.now(timezone.utc))
     # when the user was last active 
+    profile_version : so.Mapped[int] = so.mapped_column(default=0, server_default='0')
+    # bumped whenever the username or about_me changes, so anything cached from the old profile (e.g. rendered posts, see app/fragments.py) stops being used
+    follower_count : so.Mapped[int] = so.mapped_column(default=0, server_default='0')
+    # kept up to date by follow()/unfollow() so deciding whether someone is a "celebrity" (see app/timeline.py) never needs a COUNT(*)
+    post_count : so.Mapped[int] = so.mapped_column(default=0, server_default='0')
+    last_post_at : so.Mapped[Optional[datetime]] = so.mapped_column()
+    # how many posts the user has written and when the newest one was, kept current whenever posts are added or deleted (see app/counters.py), so the profile header never runs COUNT(*)
+    archived_post_count : so.Mapped[int] = so.mapped_column(default=0, server_default='0')
+    # how many of those posts `flask archive run` has moved out of the post table; while it is 0 their listings never look in the archive tables (see app/archive.py)
+
+    following: so.WriteOnlyMapped['User'] = so.relationship(
+        secondary=followers, primaryjoin=(followers.c.follower_id == id),
+        secondaryjoin=(followers.c.followed_id == id),
+        back_populates='followers')
+    followers: so.WriteOnlyMapped['User'] = so.relationship(
+        secondary=followers, primaryjoin=(followers.c.followed_id == id),
+        secondaryjoin=(followers.c.follower_id == id),
+        back_populates='following')
+
     def __repr__(self):
         return '<User {}>'.format(self.username)
     # Purpose: Provides a human-readable representation of a User object when printed or inspected, making it easier to debug or test your code.
 
     def set_password(self,password):
-        self.password_hash=generate_password_hash(password, method = 'pbkdf2:sha256')
+        self.password_hash=generate_password_hash(password, method = password_method())
+        # the algorithm and cost come from PASSWORD_HASH_ALGORITHM / PASSWORD_HASH_COST in the config (see app/passwords.py)
+        if self.id is not None:
+            identity_cache.invalidate(self.id)
+            # so this worker's next request for the user reads them from the database again (see app/identity.py)
 
     def check_password(self,password):
         return check_password_hash(self.password_hash, password )
+    # the login view doesn't call this directly, it goes through app.password_verifier so slow hash checks run on a bounded thread pool
 
-    def avatar(self,size):
-        digest = md5(self.email.lower().encode('utf-8')).hexdigest()
-        return f'https://www.gravatar.com/avatar/{digest}?d=identicon&s={size}'
+    def needs_rehash(self):
+        # True when the stored hash was made with an older algorithm or cost than the config asks for
+        return needs_rehash(self.password_hash)
+
+    def _set_key(self, attribute, value):
+        if getattr(self, attribute) != value:
+            setattr(self, attribute, value)
+            self.names_changed_at = datetime.now(timezone.utc)
+
+    @so.validates('username')
+    def validate_username(self, key, username):
+        self._set_key('username_key', normalize(username))
+        return username
 
-class Post(db.Model):
+    @so.validates('email')
+    def validate_email(self, key, email):
+        # SQLAlchemy calls this every time user.email is assigned, so the digest can never go stale
+        self.avatar_digest = email_digest(email)
+        self._set_key('email_key', normalize(email))
+        return email
+
+    def avatar(self,size):
+        digest = self.avatar_digest or email_digest(self.email)
+        return url_for('main.avatar', digest=digest, size=standard_size(size))
+        # a locally rendered identicon (see app/avatars.py) instead of a gravatar.com link
+
+    def follow(self, user):
+        if not self.is_following(user):
+            self.following.add(user)
+            user.follower_count = User.follower_count + 1
+            # an SQL expression instead of a Python +1, so two people following at once can't lose an update
+
+    def unfollow(self, user):
+        if self.is_following(user):
+            self.following.remove(user)
+            user.follower_count = User.follower_count - 1
+
+    def is_following(self, user):
+        query = self.following.select().where(User.id == user.id)
+        return db.session.scalar(query) is not None
+
+    def following_count(self):
+        query = sa.select(sa.func.count()).select_from(
+            self.following.select().subquery())
+        return db.session.scalar(query)
+
+class SearchableMixin:
+    # Models that list their text columns in __searchable__ are kept in the full-text index (see app/search.py).
+    # Changes are collected after each flush (when new rows already have their ids) and only sent to the index once the transaction commits, so a rollback never leaves half-indexed posts behind.
+
+    @classmethod
+    def search(cls, expression, page, per_page, options=()):
+        ids, has_next = query_index(cls.__tablename__, cls.__searchable__, expression, page, per_page)
+        if not ids:
+            return [], has_next
+        ranking = sa.case({id: position for position, id in enumerate(ids)}, value=cls.id)
+        # keep the index's best-match-first order when loading the rows
+        query = sa.select(cls).where(cls.id.in_(ids)).order_by(ranking).options(*options)
+        objects = db.session.scalars(query).all()
+        if len(objects) < len(ids) and hasattr(cls, 'load_archived'):
+            # some matches have been moved out of the table since they were indexed
+            found = {obj.id: obj for obj in objects}
+            found.update((obj.id, obj) for obj in cls.load_archived([id for id in ids if id not in found]))
+            objects = [found[id] for id in ids if id in found]
+        return objects, has_next
+
+    @staticmethod
+    def after_flush(session, flush_context):
+        changes = session.info.setdefault('search_changes', [])
+        for obj in session.new | session.dirty:
+            if isinstance(obj, SearchableMixin):
+                changes.append(('add', type(obj), obj.id,
+                                tuple(getattr(obj, field) for field in obj.__searchable__)))
+        for obj in session.deleted:
+            if isinstance(obj, SearchableMixin):
+                changes.append(('remove', type(obj), obj.id, None))
+
+    @staticmethod
+    def after_commit(session):
+        for (action, cls), changes in groupby(session.info.pop('search_changes', []),
+                                              key=lambda change: change[:2]):
+            if action == 'add':
+                add_to_index(cls.__tablename__, cls.__searchable__,
+                             [(id,) + values for _, _, id, values in changes])
+            else:
+                remove_from_index(cls.__tablename__, cls.__searchable__,
+                                  [id for _, _, id, _ in changes])
+
+    @staticmethod
+    def after_rollback(session):
+        session.info.pop('search_changes', None)
+
+    @classmethod
+    def reindex(cls, batch_size=1000):
+        clear_index(cls.__tablename__, cls.__searchable__)
+        columns = [getattr(cls, field) for field in cls.__searchable__]
+        rows = db.session.execute(sa.select(cls.id, *columns).execution_options(yield_per=batch_size))
+        count = 0
+        for batch in rows.partitions():
+            add_to_index(cls.__tablename__, cls.__searchable__, [tuple(row) for row in batch])
+            count += len(batch)
+        return count
+
+sa.event.listen(db.session, 'after_flush', SearchableMixin.after_flush)
+sa.event.listen(db.session, 'after_commit', SearchableMixin.after_commit)
+sa.event.listen(db.session, 'after_soft_rollback', lambda session, previous_transaction: SearchableMixin.after_rollback(session))
+
+class Post(SearchableMixin, db.Model):
+    __searchable__ = ['body']
     id: so.Mapped[int] = so.mapped_column(primary_key = True)
     body: so.Mapped[str] = so.mapped_column(sa.String(140))
     timestamp: so.Mapped[datetime] = so.mapped_column(
@@ -96,9 +246,44 @@ class Post(db.Model):
     # back_populates='posts': Specifies that this relationship is bidirectional. The User model must have a corresponding posts field (e.g., posts: so.Mapped[List[Post]] = so.relationship(back_populates='author')) that lets you access all posts by a user via user.posts. This links the two sides of the relationship.
     # Purpose: Simplifies querying related data. Instead of manually querying the User table with user_id, you can directly access the author’s details (e.g., post.author.email).
 
+    __table_args__ = (
+        sa.Index('ix_post_user_id_timestamp', 'user_id', 'timestamp'),
+    )
+    # one user's posts newest first (profile pages, last_post_at) straight from the index
+
     def __repr__(self):
         return '<Post {}>'.format(self.body)
+
+    @classmethod
+    def load_archived(cls, ids):
+        from app.archive import load
+        # imported here because app/archive.py imports this module
+        return load(ids)
+
+class TimelineEntry(db.Model):
+    # The materialized home timeline ("inbox"): one row per (reader, post). New posts are copied into
+    # the inboxes of the author's followers when they are written (see app/timeline.py), so reading a
+    # home page is a single range scan over ix_timeline_user_id_timestamp instead of a JOIN over the
+    # posts of everyone the reader follows.
+    __tablename__ = 'timeline'
+    user_id: so.Mapped[int] = so.mapped_column(sa.ForeignKey(User.id), primary_key=True)
+    post_id: so.Mapped[int] = so.mapped_column(sa.ForeignKey(Post.id), primary_key=True)
+    author_id: so.Mapped[int] = so.mapped_column(sa.ForeignKey(User.id))
+    # copied from the post so unfollow() can drop an author's entries without touching the post table
+    timestamp: so.Mapped[datetime] = so.mapped_column()
+    # copied from the post so the timeline can be ordered and paginated from its own index
+    __table_args__ = (
+        sa.Index('ix_timeline_user_id_timestamp', 'user_id', 'timestamp', 'post_id'),
+    )
     
+class ReplicaHeartbeat(db.Model):
+    # A single row that app/replicas.py touches on the primary every REPLICA_CHECK_INTERVAL seconds;
+    # how old it looks on a read replica is how far that replica lags behind.
+    __tablename__ = 'replica_heartbeat'
+    id: so.Mapped[int] = so.mapped_column(primary_key=True)
+    beat: so.Mapped[float] = so.mapped_column()
+    # time.time() of the last touch
+
 # Preparing the User Model for Flask-Login :
 
 #  But Flask-Login doesn’t know how your User class looks. So it just says:
@@ -134,7 +319,8 @@ class Post(db.Model):
 # Flask-Login sets current_user to that User.
 def load_user(id):
 # the id is always a string hence convert it into int before returning.
-    return db.session.get(User,int(id))
+    return identity_cache.load(db.session, int(id))
 # look inside User table, find the row where id matches primary key id and return the whole User object ex <User id=3, username='suraj', email='suraj@example.com'>
+# (usually not the table itself: a recently seen user comes out of the identity cache without a query, see app/identity.py)
 
 # whenever current_user is accessed, Flask-Login calls the load_user function (registered with @login.user_loader) to retrieve the User object from the database using the id stored in the session. The function converts the id (a string) to an integer and returns the User object via db.session.get(User, int(id)). This sets current_user for the request.
\ No newline at end of file
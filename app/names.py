@@ -0,0 +1,119 @@
+# Case-insensitive usernames and emails.
+# User.username_key and User.email_key hold the normalized form of each (see normalize()) and have
+# unique indexes, so 'Susan' and 'susan' can't both register, even when two registrations race (the
+# second insert fails with an IntegrityError, which the views turn into a form error).
+# The forms and the /username_available endpoint ask TakenNames first: it keeps a Bloom filter
+# (app/bloom.py) of every taken key, so a name that is free - what someone typing a new username
+# nearly always asks about - is answered from memory; only "probably taken" answers are confirmed with
+# an index lookup.
+# - the filter is filled from the user table the first time it's needed (under gunicorn, once in the
+#   master before the workers are forked, see gunicorn.conf.py), and this process adds the names it
+#   registers itself
+# - names registered or changed (edit_profile) by other worker processes are picked up every
+#   NAME_FILTER_REFRESH seconds with one query for the users added since, or whose
+#   User.names_changed_at is recent; until then another worker may call a just-taken name free, which
+#   only means the unique index rejects it at registration instead of the form. The old name of a
+#   renamed user stays in the filter (keys can't be removed) and is confirmed free by the index lookup.
+import threading
+import time
+import unicodedata
+from datetime import datetime, timedelta, timezone
+
+import sqlalchemy as sa
+
+from app.bloom import BloomFilter
+
+
+def normalize(value):
+    # NFKC then casefold: 'Susan', 'SUSAN' and full-width 'Ｓｕｓａｎ' all become 'susan'
+    return unicodedata.normalize('NFKC', value.strip()).casefold()
+
+
+CHANGE_OVERLAP = timedelta(minutes=1)
+# names_changed_at is set before its transaction commits, so a rename can become visible with a
+# timestamp a little older than the last refresh; each refresh looks back this much further (adding a
+# key twice is harmless)
+
+
+def _now():
+    return datetime.now(timezone.utc).replace(tzinfo=None)
+
+
+class TakenNames:
+    def __init__(self, app=None):
+        self.app = None
+        self._lock = threading.Lock()
+        self._filter = None
+        self._last_id = 0
+        self._changed_since = None
+        self._refreshed = 0.0
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        self.app = app
+
+    def _add_rows(self, rows):
+        for user_id, username_key, email_key in rows:
+            self._filter.add('u:' + username_key)
+            self._filter.add('e:' + email_key)
+            self._last_id = max(self._last_id, user_id)
+
+    def warm(self):
+        # (re)builds the filter from every user, sized for twice as many as there are now
+        from app import db
+        from app.models import User
+        with self._lock:
+            users = db.session.scalar(sa.select(sa.func.count()).select_from(User)) or 0
+            self._filter = BloomFilter(2 * max(users, self.app.config['NAME_FILTER_CAPACITY']),
+                                       self.app.config['NAME_FILTER_ERROR_RATE'])
+            # two keys (username and email) per user
+            self._last_id = 0
+            self._changed_since = _now() - CHANGE_OVERLAP
+            self._add_rows(db.session.execute(
+                sa.select(User.id, User.username_key, User.email_key).execution_options(yield_per=10000)))
+            self._refreshed = time.monotonic()
+
+    def _current(self):
+        from app import db
+        from app.models import User
+        if self._filter is None:
+            self.warm()
+        elif time.monotonic() - self._refreshed > self.app.config['NAME_FILTER_REFRESH']:
+            with self._lock:
+                since = _now() - CHANGE_OVERLAP
+                self._add_rows(db.session.execute(
+                    sa.select(User.id, User.username_key, User.email_key).where(sa.or_(
+                        User.id > self._last_id, User.names_changed_at >= self._changed_since))))
+                # two index range scans: new users, and users renamed since the last refresh
+                self._changed_since = since
+                self._refreshed = time.monotonic()
+        return self._filter
+
+    def add(self, user):
+        # call when adding a user or changing a username / email; before the commit is fine (and saves
+        # reloading the expired attributes) - if the commit fails the name is just a false positive
+        if self._filter is not None:
+            with self._lock:
+                self._filter.add('u:' + user.username_key)
+                self._filter.add('e:' + user.email_key)
+
+    def _owner(self, prefix, column, value):
+        # the id of the user holding this normalized value, or None; the query only runs when the
+        # filter says the value is probably taken
+        from app import db
+        from app.models import User
+        key = normalize(value)
+        if prefix + key not in self._current():
+            return None
+        return db.session.scalar(sa.select(User.id).where(column == key))
+
+    def username_taken(self, username, by_other_than=None):
+        from app.models import User
+        owner = self._owner('u:', User.username_key, username)
+        return owner is not None and owner != by_other_than
+
+    def email_taken(self, email, by_other_than=None):
+        from app.models import User
+        owner = self._owner('e:', User.email_key, email)
+        return owner is not None and owner != by_other_than
@@ -0,0 +1,71 @@
+# Password hashing policy and off-thread verification.
+# The hashing method is built from PASSWORD_HASH_ALGORITHM and PASSWORD_HASH_COST in the config, so the
+# cost can be raised later and existing users are upgraded the next time they log in (a hash that was
+# made with an older method "needs a rehash").
+# Checking a password is deliberately slow (that's the point of PBKDF2), so a burst of logins can eat
+# every worker thread. Verification therefore runs on a small dedicated thread pool, and at most
+# PASSWORD_VERIFY_WORKERS + PASSWORD_VERIFY_QUEUE logins can be verifying or waiting at once; anyone
+# beyond that waits at most PASSWORD_VERIFY_TIMEOUT seconds and is then turned away, while the rest of
+# the site keeps serving pages. (hashlib releases the GIL while hashing, so the pool really caps CPU.)
+# PASSWORD_VERIFY_WORKERS = 0 turns the pool off and checks passwords on the request threads, unbounded
+# (the benchmarks compare both, see benchmarks/micro.py).
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from flask import current_app
+from werkzeug.security import check_password_hash
+
+
+class PasswordVerifierBusy(Exception):
+    pass
+
+
+def password_method():
+    # werkzeug's method string, e.g. 'pbkdf2:sha256:1000000' or 'scrypt:32768:8:1'
+    algorithm = current_app.config['PASSWORD_HASH_ALGORITHM']
+    cost = current_app.config['PASSWORD_HASH_COST']
+    return f'{algorithm}:{cost}' if cost else algorithm
+
+
+def needs_rehash(password_hash):
+    # stored hashes look like 'pbkdf2:sha256:1000000$<salt>$<hash>'
+    method = password_hash.split('$', 1)[0]
+    if current_app.config['PASSWORD_HASH_COST']:
+        return method != password_method()
+    return not method.startswith(current_app.config['PASSWORD_HASH_ALGORITHM'])
+
+
+class PasswordVerifier:
+    def __init__(self, app=None):
+        self.app = None
+        self._lock = threading.Lock()
+        self._executor = None
+        self._slots = None
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        self.app = app
+
+    def _pool(self):
+        # created on first use so every (possibly forked) worker process gets its own threads
+        with self._lock:
+            if self._executor is None:
+                workers = self.app.config['PASSWORD_VERIFY_WORKERS']
+                self._executor = ThreadPoolExecutor(max_workers=workers,
+                                                    thread_name_prefix='password-verify')
+                self._slots = threading.BoundedSemaphore(
+                    workers + self.app.config['PASSWORD_VERIFY_QUEUE'])
+        return self._executor, self._slots
+
+    def verify(self, password_hash, password):
+        if not self.app.config['PASSWORD_VERIFY_WORKERS']:
+            # no pool: checked on the request thread, with no limit on how many run at once
+            return check_password_hash(password_hash, password)
+        executor, slots = self._pool()
+        if not slots.acquire(timeout=self.app.config['PASSWORD_VERIFY_TIMEOUT']):
+            raise PasswordVerifierBusy()
+        try:
+            return executor.submit(check_password_hash, password_hash, password).result()
+        finally:
+            slots.release()
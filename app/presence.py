@@ -0,0 +1,65 @@
+# Write-behind tracking of User.last_seen.
+# Writing last_seen on every request means one write transaction per page view, and with SQLite every
+# one of them queues behind the database write lock. Instead, requests only record the time in memory
+# (a dict keyed by user id, so repeated hits from the same user just overwrite each other), and a
+# background thread writes everything collected during the last PRESENCE_FLUSH_INTERVAL seconds in a
+# single bulk UPDATE. Whatever is still pending when the process exits is flushed by an atexit hook.
+import atexit
+import threading
+import time
+from datetime import datetime, timezone
+
+import sqlalchemy as sa
+
+
+class PresenceTracker:
+    def __init__(self, app=None):
+        self.app = None
+        self._lock = threading.Lock()
+        self._pending = {}
+        self._thread = None
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        self.app = app
+        atexit.register(self.flush)
+
+    def record(self, user_id, when=None):
+        with self._lock:
+            self._pending[user_id] = when or datetime.now(timezone.utc)
+            if self._thread is None:
+                # started lazily (not in init_app) so each worker process gets its own thread, even
+                # when the app was created in a parent process and then forked
+                self._thread = threading.Thread(target=self._run, name='presence-flush', daemon=True)
+                self._thread.start()
+
+    def _run(self):
+        while True:
+            time.sleep(self.app.config['PRESENCE_FLUSH_INTERVAL'])
+            self.flush()
+
+    def flush(self):
+        # swap the dict out under the lock so requests are never blocked by the database write
+        with self._lock:
+            pending, self._pending = self._pending, {}
+        if not pending:
+            return 0
+        from app import db
+        from app.models import User
+        # imported here rather than at the top so app/__init__.py can import this module before db exists
+        with self.app.app_context():
+            try:
+                db.session.execute(sa.update(User), [
+                    {'id': user_id, 'last_seen': seen} for user_id, seen in pending.items()])
+                # an ORM bulk UPDATE by primary key: one executemany statement for every user seen in the window
+                db.session.commit()
+            except Exception:
+                db.session.rollback()
+                self.app.logger.exception('Could not flush last_seen for %d users', len(pending))
+                with self._lock:
+                    # put the times back (unless the user has been seen again since) to retry next window
+                    for user_id, seen in pending.items():
+                        self._pending.setdefault(user_id, seen)
+                return 0
+        return len(pending)
@@ -0,0 +1,163 @@
+# Rate limiting.
+# Every login attempt costs a full PBKDF2 check, so a credential-stuffing run against /login can keep
+# the CPU busy for everybody. Views are limited with token buckets: a limit like '10/minute' is a
+# bucket that holds up to 10 tokens and refills at 10 per minute; every request takes one token, and
+# when the bucket is empty the request gets a 429 with a Retry-After header instead of reaching the view.
+#     @bp.route('/login', methods=['GET', 'POST'])
+#     @rate_limit('RATELIMIT_LOGIN_IP')
+#     @rate_limit('RATELIMIT_LOGIN_USERNAME', key=form_field('username'))
+#     def login(): ...
+# A limit is either written out ('5/minute') or the name of a config key holding one. By default the
+# bucket is per client IP (request.remote_addr; behind a proxy, use werkzeug's ProxyFix so that is the
+# real client) and only POSTs are counted, so looking at the form is free.
+# Buckets are kept by a backend, picked with RATELIMIT_BACKEND:
+#   'memory' - per process: a dict of (tokens, last update, ttl) tuples. A bucket that has been left
+#              alone long enough to refill completely is the same as no bucket, so it is dropped, and
+#              the dict never holds more than RATELIMIT_MAX_KEYS buckets. A bucket that is still
+#              refilling is never dropped to make room: otherwise someone could reset a victim's login
+#              bucket by sending requests with lots of made-up usernames. When it is full of those, new
+#              keys are refused (429) until the oldest bucket has refilled.
+#   'sqlite' - one file at RATELIMIT_STORAGE_PATH shared by every worker on the machine, so running
+#              four workers doesn't quadruple the limits.
+# Any object with hit(key, rate, burst) -> seconds to wait (0 if allowed) can be used as a backend.
+import functools
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+
+from flask import abort, current_app, request
+
+PERIODS = {'second': 1, 'minute': 60, 'hour': 3600, 'day': 86400}
+
+
+def parse_limit(limit):
+    # '10/minute' -> (rate in tokens per second, burst)
+    count, period = limit.split('/')
+    count = int(count)
+    return count / PERIODS[period.strip().rstrip('s')], count
+
+
+def take(state, now, rate, burst):
+    # one token bucket step: returns the new (tokens, last update) and how long to wait (0 if allowed)
+    tokens, last = state if state is not None else (burst, now)
+    tokens = min(burst, tokens + (now - last) * rate)
+    if tokens >= 1:
+        return (tokens - 1, now), 0.0
+    return (tokens, now), (1 - tokens) / rate
+
+
+class MemoryBuckets:
+    def __init__(self, app):
+        self.max_keys = app.config['RATELIMIT_MAX_KEYS']
+        self._lock = threading.Lock()
+        self._buckets = OrderedDict()
+        # key -> (tokens, last update, expiry); ordered by last update, so expired buckets are at the front
+
+    def _drop_expired(self, now):
+        while self._buckets and next(iter(self._buckets.values()))[2] <= now:
+            self._buckets.popitem(last=False)
+
+    def hit(self, key, rate, burst):
+        now = time.monotonic()
+        with self._lock:
+            entry = self._buckets.pop(key, None)
+            if entry is None:
+                self._drop_expired(now)
+                if len(self._buckets) >= self.max_keys:
+                    return next(iter(self._buckets.values()))[2] - now
+                    # full of buckets that are still refilling: no room for a new one until the oldest expires
+            state, wait = take(entry[:2] if entry else None, now, rate, burst)
+            self._buckets[key] = (*state, now + burst / rate)
+            self._drop_expired(now)
+            return wait
+
+    def __len__(self):
+        return len(self._buckets)
+
+
+class SQLiteBuckets:
+    # how many hits happen between deletes of fully refilled buckets
+    PURGE_EVERY = 256
+
+    def __init__(self, app):
+        self.path = app.config['RATELIMIT_STORAGE_PATH']
+        self._local = threading.local()
+        self._hits = 0
+
+    def _connection(self):
+        # sqlite3 connections can't be shared between threads, so each thread opens its own
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=5, isolation_level=None)
+            conn.execute('PRAGMA journal_mode=WAL')
+            conn.execute('CREATE TABLE IF NOT EXISTS bucket (key TEXT PRIMARY KEY, tokens REAL NOT NULL, '
+                         'updated REAL NOT NULL, expires REAL NOT NULL) WITHOUT ROWID')
+            self._local.conn = conn
+        return conn
+
+    def hit(self, key, rate, burst):
+        conn = self._connection()
+        now = time.time()
+        # BEGIN IMMEDIATE takes the write lock before reading, so two workers can't both spend the last token
+        conn.execute('BEGIN IMMEDIATE')
+        try:
+            row = conn.execute('SELECT tokens, updated FROM bucket WHERE key = ?', (key,)).fetchone()
+            state, wait = take(row, now, rate, burst)
+            conn.execute('INSERT OR REPLACE INTO bucket (key, tokens, updated, expires) VALUES (?, ?, ?, ?)',
+                         (key, *state, now + burst / rate))
+            self._hits += 1
+            if self._hits % self.PURGE_EVERY == 0:
+                conn.execute('DELETE FROM bucket WHERE expires < ?', (now,))
+            conn.execute('COMMIT')
+        except Exception:
+            conn.execute('ROLLBACK')
+            raise
+        return wait
+
+
+BACKENDS = {'memory': MemoryBuckets, 'sqlite': SQLiteBuckets}
+
+
+class RateLimiter:
+    def __init__(self, app=None):
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        backend = app.config['RATELIMIT_BACKEND']
+        app.extensions['ratelimit'] = BACKENDS[backend](app) if isinstance(backend, str) else backend
+
+
+def remote_addr():
+    return request.remote_addr or 'unknown'
+
+
+def form_field(name):
+    # a key function for per-account limits; usernames are casefolded so 'Susan' and 'susan' share a bucket
+    def key():
+        value = request.form.get(name, '').strip().casefold()
+        return value or None
+    return key
+
+
+def rate_limit(limit, key=remote_addr, methods=('POST',)):
+    # limit: '10/minute' or the name of a config key holding such a string (a false value turns it off)
+    # key: function returning the bucket key for the current request (None skips the limit)
+    def decorator(view):
+        scope = limit if '/' in limit else limit.lower()
+
+        @functools.wraps(view)
+        def wrapped(*args, **kwargs):
+            spec = limit if '/' in limit else current_app.config.get(limit)
+            if spec and current_app.config['RATELIMIT_ENABLED'] and request.method in methods:
+                value = key()
+                if value is not None:
+                    rate, burst = parse_limit(spec)
+                    wait = current_app.extensions['ratelimit'].hit(
+                        f'{view.__name__}:{scope}:{value}', rate, burst)
+                    if wait:
+                        abort(429, retry_after=int(wait) + 1)
+            return view(*args, **kwargs)
+        return wrapped
+    return decorator
@@ -0,0 +1,163 @@
+# Read replicas.
+# With REPLICA_DATABASE_URLS set, the pages that only read (the @read_replica views: index, explore,
+# user, the JSON API) send their SELECTs to a read replica, so they don't compete with the writes on
+# the primary database. Everything else - writes, SELECT ... FOR UPDATE, other views, background
+# threads - keeps using the primary. Replicas are kept up to date by the database's own replication
+# (PostgreSQL/MySQL streaming replication, litestream / a file copy for SQLite); this module only
+# decides where each query goes.
+# - routing happens in db.session itself (RoutingSession.get_bind), so the views and models don't know
+#   replicas exist; each replica is an extra bind (replica1, replica2, ...) with its own engine
+# - read-your-writes: a request that writes (a flush or an INSERT/UPDATE/DELETE through db.session, or a
+#   post handed to the post writer, see app/ingest.py) pins its user to the primary for
+#   REPLICA_PIN_SECONDS, remembered in the session cookie so it holds across worker processes; after
+#   posting, the redirect back to the home page must show the new post, even if no replica has it yet.
+#   POSTs that change nothing (a wrong password, a 429, a form that doesn't validate) don't pin.
+# - lag: every process touches a heartbeat row on the primary every REPLICA_CHECK_INTERVAL seconds and
+#   reads it back from each replica; how old it is there is how far behind that replica is. Replicas
+#   more than REPLICA_MAX_LAG seconds behind (or unreachable) get no reads until they catch up, and
+#   with none left everything is read from the primary
+# - `flask replicas status` shows the lag the current process measures
+import math
+import random
+import threading
+import time
+from functools import wraps
+
+import sqlalchemy as sa
+from flask import current_app, g, has_request_context, request, session
+from flask_sqlalchemy.session import Session
+
+PIN_KEY = '_primary_until'
+
+
+def replica_binds(config):
+    # the SQLALCHEMY_BINDS entries for the replicas
+    return {f'replica{i}': url for i, url in enumerate(config['REPLICA_DATABASE_URLS'], 1)}
+
+
+def _plain_read(clause):
+    return getattr(clause, 'is_select', False) and getattr(clause, '_for_update_arg', None) is None
+
+
+class RoutingSession(Session):
+    # the class of db.session (see app/__init__.py)
+    def get_bind(self, mapper=None, clause=None, bind=None, **kwargs):
+        engine = super().get_bind(mapper=mapper, clause=clause, bind=bind, **kwargs)
+        key = g.get('replica') if has_request_context() else None
+        if (key is not None and bind is None and not self._flushing and engine is self._db.engine
+                and _plain_read(clause)):
+            return self._db.engines[key]
+        # only queries for the main database move; other binds (e.g. the archive) stay where they are
+        return engine
+
+
+def mark_written():
+    # from the first write on, the rest of the request reads from the primary too, and so do the
+    # user's next requests (see ReplicaRouter._pin)
+    if has_request_context():
+        g.pop('replica', None)
+        g.wrote = True
+
+
+def _after_flush(db_session, flush_context):
+    mark_written()
+
+
+def _after_execute(orm_execute_state):
+    # bulk statements like sa.insert(TimelineEntry) don't flush, but they write all the same
+    if not orm_execute_state.is_select:
+        mark_written()
+
+
+class ReplicaRouter:
+    def __init__(self, app=None):
+        self.app = None
+        self.keys = []
+        self.lag = {}
+        self._lock = threading.Lock()
+        self._thread = None
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        self.app = app
+        self.keys = list(replica_binds(app.config))
+        app.extensions['replicas'] = self
+        if self.keys:
+            from app import db
+            if not sa.event.contains(db.session, 'after_flush', _after_flush):
+                sa.event.listen(db.session, 'after_flush', _after_flush)
+                sa.event.listen(db.session, 'do_orm_execute', _after_execute)
+            app.after_request(self._pin)
+
+    def _start(self):
+        with self._lock:
+            if self._thread is None:
+                # started lazily, like the presence flush thread, so every worker process gets its own
+                self._thread = threading.Thread(target=self._run, name='replica-lag', daemon=True)
+                self._thread.start()
+
+    def _run(self):
+        while True:
+            self.check()
+            time.sleep(self.app.config['REPLICA_CHECK_INTERVAL'])
+
+    def check(self):
+        # touches the heartbeat on the primary and measures how far behind each replica is
+        from app import db
+        from app.models import ReplicaHeartbeat
+        with self.app.app_context():
+            try:
+                with db.engine.begin() as conn:
+                    now = time.time()
+                    if not conn.execute(sa.update(ReplicaHeartbeat).where(ReplicaHeartbeat.id == 1)
+                                        .values(beat=now)).rowcount:
+                        conn.execute(sa.insert(ReplicaHeartbeat).values(id=1, beat=now))
+            except sa.exc.DBAPIError:
+                self.app.logger.exception('Could not write the replica heartbeat')
+            for key in self.keys:
+                try:
+                    with db.engines[key].connect() as conn:
+                        beat = conn.scalar(sa.select(ReplicaHeartbeat.beat).where(ReplicaHeartbeat.id == 1))
+                    lag = time.time() - beat if beat is not None else math.inf
+                except sa.exc.DBAPIError:
+                    lag = math.inf
+                self._record(key, lag)
+        return dict(self.lag)
+
+    def _record(self, key, lag):
+        limit = self.app.config['REPLICA_MAX_LAG']
+        previous = self.lag.get(key)
+        if lag > limit and (previous is None or previous <= limit):
+            self.app.logger.warning('Read replica %s is %s, reading from the primary instead', key,
+                                    'unreachable or has no heartbeat yet' if math.isinf(lag) else f'{lag:.1f}s behind')
+        elif lag <= limit and previous is not None and previous > limit:
+            self.app.logger.info('Read replica %s caught up (%.1fs behind)', key, lag)
+        self.lag[key] = lag
+
+    def choose(self):
+        # the bind key of a replica that's close enough behind, or None for the primary
+        if not self.keys:
+            return None
+        self._start()
+        if session.get(PIN_KEY, 0) > time.time():
+            return None
+        limit = self.app.config['REPLICA_MAX_LAG']
+        fresh = [key for key in self.keys if self.lag.get(key, math.inf) <= limit]
+        # before the first check has finished every replica counts as lagging
+        return random.choice(fresh) if fresh else None
+
+    def _pin(self, response):
+        if g.get('wrote'):
+            session[PIN_KEY] = time.time() + self.app.config['REPLICA_PIN_SECONDS']
+        return response
+
+
+def read_replica(view):
+    # lets a view's SELECTs go to a read replica on GET requests (without replicas it does nothing)
+    @wraps(view)
+    def wrapped(*args, **kwargs):
+        if request.method in ('GET', 'HEAD'):
+            g.replica = current_app.extensions['replicas'].choose()
+        return view(*args, **kwargs)
+    return wrapped
@@ -1,5 +1,8 @@
 #The routes module handle the different URLs that the application supports. 
-from app import app 
+from flask import Blueprint, current_app
+
+bp = Blueprint('main', __name__)
+# A blueprint is a group of views that gets attached to the application in create_app() (app/__init__.py). Endpoint names get the blueprint's name as a prefix, so url_for('index') becomes url_for('main.index').
 #this is a view function. 
 #A view function is just a Python function that runs when someone visits a specific URL on your Flask website.
 from flask import render_template , flash , redirect , url_for
@@ -7,21 +10,40 @@ from app.forms import LoginForm
 
 from flask_login import current_user, login_user
 import sqlalchemy as sa
-from app import db
-from app.models import User
+from app import db, presence, password_verifier, avatar_cache
+from app.passwords import PasswordVerifierBusy
+from app.ratelimit import rate_limit, form_field
+from app import post_ingester, identity_cache, taken_names
+from app.names import normalize
+from app.ingest import IngestBusy, IngestFailed
+from app.models import User, Post
+from app.feed import paginate, home_timeline, decode_cursor, listing_options
+from app.feed import home_timeline_stamp, user_posts_stamp
+from app.archive import archived_posts, user_archive
+from app.httpcache import page_etag, is_fresh, not_modified, cacheable
+from app.replicas import read_replica
+from app import timeline
 from flask_login import logout_user
 from flask_login import login_required
 from flask import request 
+from flask import abort, make_response
+import re
+import concurrent.futures
 from urllib.parse import urlsplit
-from datetime import datetime,timezone
 from app.forms import RegistrationForm
 from app.forms import EditProfileForm
-@app.route('/')
-@app.route('/index')
+from app.forms import EmptyForm
+from app.forms import SearchForm
+from app.forms import PostForm
+from flask import g
+@bp.route('/', methods=['GET', 'POST'])
+@bp.route('/index', methods=['GET', 'POST'])
 @login_required
 # When a user that is not logged in accesses a view function protected with the @login_required decorator, the decorator is going to redirect to the login page, but it is going to include some extra information in this redirect so that the application can then return to the original page. If the user navigates to /index, for example, the @login_required decorator will intercept the request and respond with a redirect to /login, but it will add a query string argument to this URL, making the complete redirect URL /login?next=/index. The next query string argument is set to the original URL, so the application can use that to redirect back after login.
 # When an unlogged-in user accesses a view protected by the @login_required decorator, it redirects to the login page with extra information to return to the original page. For example, if the user goes to /index, the decorator redirects to /login?next=/index, where ‘next’ is the original URL for post-login redirection.
-# Flask-Login uses the @login_required decorator to protect view functions from anonymous users. Placing this decorator below the @app.route decorator in Flask restricts access to authenticated users only.
+# Flask-Login uses the @login_required decorator to protect view functions from anonymous users. Placing this decorator below the @bp.route decorator in Flask restricts access to authenticated users only.
+@read_replica
+# on GET the page only reads, so its queries may go to a read replica (see app/replicas.py); posting the form uses the primary
 def index():
     # user = {'username':'Suraj'}
 #     return '''
@@ -34,17 +56,39 @@ def index():
 #     </body>
 # </html>
 # '''
-    posts = [
-      {
-          'author':{'username':'Suraj2'},
-          'body': 'Beautiful day in portland!'
-      },
-      {
-          'author':{'username':'Tanishta'},
-          'body': 'Beautiful day in portland with my banda!'
-      }
-  ]
-    return render_template("index.html",title='Home Page',posts=posts)
+    form = PostForm()
+    if form.validate_on_submit():
+        try:
+            post_ingester.publish(current_user, form.post.data)
+        except IngestBusy:
+            flash('Too many people are posting right now, please try again in a moment.')
+        except IngestFailed:
+            flash('Sorry, your post could not be saved, please try again.')
+        except concurrent.futures.TimeoutError:
+            flash('Your post has been received and will appear shortly.')
+            return redirect(url_for('main.index'))
+        else:
+            flash('Your post is now live!')
+            return redirect(url_for('main.index'))
+            # redirecting after a POST means refreshing the page doesn't send the post again
+        # New posts go through the batched writer (see app/ingest.py): publish() waits until the batch with this post has been committed. When the queue is full or the post could not be written the form is shown again with the text still in it.
+    etag = page_etag(home_timeline_stamp(current_user))
+    if is_fresh(etag):
+        return not_modified(etag)
+    # nothing new in the timeline since the browser's copy: 304 without loading posts or rendering (see app/httpcache.py)
+    page = home_timeline(current_user, decode_cursor(request.args.get('cursor')))
+    # the cursor in the query string marks where the previous page ended (see app/feed.py)
+    return cacheable(make_response(render_template("index.html",title='Home Page',form=form,
+                                                   posts=page.items, next_cursor=page.next_cursor)), etag)
+
+@bp.route('/explore')
+@login_required
+@read_replica
+def explore():
+    # the global feed: every post, newest first, not just the ones from people you follow
+    page = paginate(sa.select(Post), decode_cursor(request.args.get('cursor')), archived=archived_posts)
+    return render_template("index.html",title='Explore',posts=page.items,
+                           next_cursor=page.next_cursor)
 # The render_template() function invokes the Jinja template engine that comes bundled with the Flask framework. Jinja substitutes {{ ... }} blocks with the corresponding values, given by the arguments provided in the render_template() call.
 
 # When a user visits /login, this happens:
@@ -57,7 +101,10 @@ def index():
 # 7.You redirect or flash messages based on success/failure.
 # 8.All data goes into the DB using models.py.
 
-@app.route('/login', methods = ['GET','POST'])
+@bp.route('/login', methods = ['GET','POST'])
+@rate_limit('RATELIMIT_LOGIN_IP')
+@rate_limit('RATELIMIT_LOGIN_USERNAME', key=form_field('username'))
+# login attempts are throttled per client IP and per username before the (slow) password check runs; see app/ratelimit.py
 def login():
     if current_user.is_authenticated:
 #         current_user is a special variable provided by Flask-Login.
@@ -73,17 +120,26 @@ def login():
 
      # checking for the first property of the user login criteria which helps us to find out of a user is logged in or not. this above line handle a case where an already logged-in user mistakenly visits the `/login` page. Using `current_user` from Flask-Login, which represents the current client (either a real user object of the User table or an anonymous one), we check the `is_authenticated` property. If the user is already logged in, we redirect them to the index page.
 
-        return redirect(url_for('index'))
-    # `url_for('index')` returns `'/'`, the URL path of the `index` VIEW FUNCTION defined with `@app.route('/')` in your Flask app.
+        return redirect(url_for('main.index'))
+    # `url_for('main.index')` returns `'/'`, the URL path of the `index` VIEW FUNCTION defined with `@bp.route('/')` in your Flask app. (Before the views moved into the 'main' blueprint this was `url_for('index')` and `@app.route('/')`.)
 
     form = LoginForm()
     if form.validate_on_submit():
         user = db.session.scalar(sa.select(User).where(User.username == form.username.data))
         # User clicks "Submit" (POST request)
         # Flask-WTF reads the incoming form data from the request.Now form.username.data will contain 'suraj' You can access it in your Flask route to log the user in, etc.
-        if user is None or not user.check_password(form.password.data):
+        try:
+            valid = user is not None and password_verifier.verify(user.password_hash, form.password.data)
+        except PasswordVerifierBusy:
+            flash('Too many people are signing in right now, please try again in a moment.')
+            return redirect(url_for('main.login'))
+        if not valid:
             flash('Invalid Username or password')
-            return redirect (url_for('login'))
+            return redirect (url_for('main.login'))
+        if user.needs_rehash():
+            # the password is known to be right, so this is the one moment we can re-hash it with the current policy
+            user.set_password(form.password.data)
+            db.session.commit()
         login_user(user,remember = form.remember_me.data)
         next_page = request.args.get('next')
         # gets the value of the next argument in the query which is produced by @login_required decorator inorder to redirect to the original page to which the user intended to go in the first place(but login required stopped him so to login first) from the login page Example: if the URL is /login?next=/dashboard, next_page becomes "/dashboard".
@@ -93,13 +149,13 @@ def login():
         # checks for Case 3 mentioned below. Basically, this ensures next_page is a relative URL (like /dashboard), and not an external URL (like http://malliciousevilsite.com).netloc is only present in full URLs (like http://...), so we block those.
 
 
-            next_page = url_for('index')
+            next_page = url_for('main.index')
         return redirect(next_page) 
-        # return redirect(url_for('index'))
+        # return redirect(url_for('main.index'))
         # flash('Login requested for user {}, remember_me = {}'.format(
         #     form.username.data , form.remember_me.data
         # ))
-        # return redirect(url_for('index'))
+        # return redirect(url_for('main.index'))
 
 #         Case 1: If the `next` argument is not present in the login URL, the application redirects the user to the default index page. For example, if the login URL is `/login` and there is no `next` argument, the user is redirected to `/`.
 
@@ -109,10 +165,10 @@ def login():
 
     return render_template('login.html',title ='Sign In', form = form)
 
-@app.route('/logout')
+@bp.route('/logout')
 def logout():
     logout_user()
-    return redirect(url_for('index'))
+    return redirect(url_for('main.index'))
 
 # Example workflow when a user clicks on a link that leads to a view funciton:
 # The first time someone clicks on this link, the request is of type GET so in the edit_profile view function , the  
@@ -122,59 +178,166 @@ def logout():
 #     return render_template('edit_profile.html', title='Edit Profile', form= form)
 # is run and we get to see the form with the return render template and when someone edits the input fields and clicks on submit, since the editprofile form has <form action="" method="post">(no action),a POST request is sent back to the same view funciton  and in the view function, the first if condition is executed where the inputted data is saved to the database.
 
-@app.route('/register', methods= ['GET', 'POST'])
+@bp.route('/register', methods= ['GET', 'POST'])
 # this view function accepts both get and post requests.
+@rate_limit('RATELIMIT_REGISTER_IP')
 def register():
     if current_user.is_authenticated:
-        return redirect(url_for('index'))
+        return redirect(url_for('main.index'))
     form = RegistrationForm()
     if form.validate_on_submit():
         # validate_on_submit() is a Flask-WTF method that does two things at once:Checks if the form has been submitted (request.method == "POST")Validates the form data (i.e., runs all the validators on the form fields)
         user = User(username = form.username.data, email= form.email.data)
         user.set_password(form.password.data)
         db.session.add(user)
-        db.session.commit()
+        taken_names.add(user)
+        try:
+            db.session.commit()
+        except sa.exc.IntegrityError:
+            # the username or email was taken between the form's check and the insert (e.g. by a registration in another worker); the unique indexes on username_key / email_key caught it
+            db.session.rollback()
+            if db.session.scalar(sa.select(User.id).where(User.username_key == normalize(form.username.data))):
+                form.username.errors.append('Please use a different username.')
+            else:
+                form.email.errors.append('Please enter a differnt email address.')
+            return render_template('register.html', title = 'Register',form= form)
         flash('Congratulations , you are now a registered user!')
-        return redirect(url_for('login'))
+        return redirect(url_for('main.login'))
     return render_template('register.html', title = 'Register',form= form)
 
-@app.route('/user/<username>')
-# The @app.route decorator for this view function includes a dynamic component, <username>, which allows Flask to accept any text in that URL part and pass it as an argument to the view function. For instance, a request to /user/susan will call the view with username set to ‘susan’.
+@bp.route('/username_available')
+@rate_limit('RATELIMIT_USERNAME_CHECK_IP', methods=('GET',))
+def username_available():
+    # called by the registration page while the username is typed; answers {"username": ..., "available": true/false}, usually straight from the Bloom filter without touching the database (see app/names.py)
+    username = request.args.get('username', '').strip()
+    available = bool(username) and not taken_names.username_taken(
+        username, by_other_than=current_user.id if current_user.is_authenticated else None)
+    return {'username': username, 'available': available}
+
+@bp.route('/user/<username>')
+# The @bp.route decorator for this view function includes a dynamic component, <username>, which allows Flask to accept any text in that URL part and pass it as an argument to the view function. For instance, a request to /user/susan will call the view with username set to ‘susan’.
 # and this view funciton is only accessible to logged in users hence the @login_required decorator
 @login_required
+@read_replica
 def user(username):
     user = db.first_or_404(sa.select(User).where(User.username==username))
     # works like scalar() when there are results, but in the case that there are no results it automatically sends a 404 error back to the client.
-    posts = [
-      {'author':user,'body': 'Test Post #1'},
-      {'author':user,'body': 'Test post #2'}
-  ]
-    return render_template('user.html', user=user , posts=posts) 
+    etag = page_etag(user.id, user.profile_version, user.last_seen, user.follower_count,
+                     user.following_count(), user.post_count, user_posts_stamp(user))
+    if is_fresh(etag):
+        return not_modified(etag)
+    # everything the page shows about the user, and their newest post; follower_count also changes when the viewer follows or unfollows
+    page = paginate(user.posts.select(), decode_cursor(request.args.get('cursor')),
+                    archived=user_archive(user))
+    # once the user's recent posts run out, the older pages come from the archive (see app/archive.py)
+    form = EmptyForm()
+    # the follow/unfollow button is a one-button form so it is sent as a POST with a CSRF token
+    return cacheable(make_response(render_template('user.html', user=user , posts=page.items,
+                                                   next_cursor=page.next_cursor, form=form)), etag)
 
 # The code adds functionality to track when a user was last active (their “last visit” time) by updating a last_seen field in the User model every time they make a request to your Flask app (e.g., loading a page). Instead of adding this logic to every route (like /index or /login), Flask’s @before_request decorator lets you run this code automatically before any request is handled.
-@app.before_request
+@bp.before_app_request
 # A Flask decorator that tells your app to run the before_request() function before every request (e.g., when a user visits /index, /profile, or any other route).
 def before_request():
-    if current_user.is_authenticated:
-        current_user.last_seen = datetime.now(timezone.utc)
-        # Why no db.session.add()?: When current_user is accessed, Flask-Login loads the user from the database (via the user loader function), automatically adding it to the db.session. So, you don’t need to call db.session.add(current_user) again.
+    if request.endpoint != 'static' and current_user.is_authenticated:
+        presence.record(current_user.id)
+        g.search_form = SearchForm()
+        # every page has the search box in its navigation bar (see base.html)
+        # Instead of setting current_user.last_seen and committing (one database write per page view), the time is only remembered in memory and written together with everyone else's once per PRESENCE_FLUSH_INTERVAL. Static files (css, images) don't count as activity.
+
+@bp.route('/search')
+@login_required
+def search():
+    if not g.search_form.validate():
+        return redirect(url_for('main.explore'))
+    page = request.args.get('page', 1, type=int)
+    posts, has_next = Post.search(g.search_form.q.data, page, current_app.config['POSTS_PER_PAGE'],
+                                  options=listing_options())
+    # ranked best match first by the full-text index (see app/search.py), one page at a time
+    next_url = url_for('main.search', q=g.search_form.q.data, page=page + 1) if has_next else None
+    prev_url = url_for('main.search', q=g.search_form.q.data, page=page - 1) if page > 1 else None
+    return render_template('search.html', title='Search', posts=posts,
+                           next_url=next_url, prev_url=prev_url)
 
-        # Why no db.session.add()?: When current_user is accessed, Flask-Login loads the user from the database (via the user loader function), automatically adding it to the db.session. So, you don’t need to call db.session.add(current_user) again.
-        db.session.commit()
+@bp.route('/avatar/<digest>/<int:size>.png')
+def avatar(digest, size):
+    # only the standard sizes exist, so nobody can fill the cache by asking for every size from 1 to 10000
+    if size not in current_app.config['AVATAR_SIZES'] or not re.fullmatch('[0-9a-f]{32}', digest):
+        abort(404)
+    image = avatar_cache.get(digest, size)
+    if image is None:
+        abort(404)
+    # nobody has that email address (see app/avatars.py)
+    response = make_response(image)
+    response.mimetype = 'image/png'
+    response.set_etag(f'{digest}-{size}')
+    response.cache_control.public = True
+    response.cache_control.max_age = 31536000
+    response.cache_control.immutable = True
+    # the picture for a given URL can never change, so browsers and proxies may keep it for a year without asking again
+    return response.make_conditional(request)
 
-@app.route('/edit_profile', methods=['GET','POST'])
+@bp.route('/edit_profile', methods=['GET','POST'])
 @login_required
 def edit_profile():
     form = EditProfileForm(current_user.username)
     # if the user is adding his aboutme or editing the existing username, it is added to the databse.
     if form.validate_on_submit():
+        if (form.username.data, form.about_me.data) != (current_user.username, current_user.about_me or ''):
+            current_user.profile_version = User.profile_version + 1
+            # invalidates this user's cached post fragments (see app/fragments.py)
         current_user.username = form.username.data
         current_user.about_me = form.about_me.data
-        db.session.commit()
+        taken_names.add(current_user)
+        try:
+            db.session.commit()
+        except sa.exc.IntegrityError:
+            # someone else took the new username after the form checked it
+            db.session.rollback()
+            form.username.errors.append('Please use a differnt username.')
+            return render_template('edit_profile.html', title='Edit Profile', form= form)
+        identity_cache.invalidate(current_user.id)
+        # otherwise this worker keeps showing the old username for up to IDENTITY_CACHE_TTL seconds
         flash('Your changes have been saved.')
-        return redirect(url_for('edit_profile'))
+        return redirect(url_for('main.edit_profile'))
     # if there is no post request , i.e of the user is only viewing, then fill the fields in the placeholder with the existing thing in the database. 
     elif request.method == 'GET':
         form.username.data = current_user.username
         form.about_me.data = current_user.about_me
-    return render_template('edit_profile.html', title='Edit Profile', form= form)
\ No newline at end of file
+    return render_template('edit_profile.html', title='Edit Profile', form= form)
+
+@bp.route('/follow/<username>', methods=['POST'])
+@login_required
+def follow(username):
+    form = EmptyForm()
+    if form.validate_on_submit():
+        user = db.session.scalar(sa.select(User).where(User.username == username))
+        if user is None:
+            flash(f'User {username} not found.')
+            return redirect(url_for('main.index'))
+        if user == current_user:
+            flash('You cannot follow yourself!')
+            return redirect(url_for('main.user', username=username))
+        timeline.follow(current_user, user)
+        flash(f'You are following {username}!')
+        return redirect(url_for('main.user', username=username))
+    else:
+        return redirect(url_for('main.index'))
+
+@bp.route('/unfollow/<username>', methods=['POST'])
+@login_required
+def unfollow(username):
+    form = EmptyForm()
+    if form.validate_on_submit():
+        user = db.session.scalar(sa.select(User).where(User.username == username))
+        if user is None:
+            flash(f'User {username} not found.')
+            return redirect(url_for('main.index'))
+        if user == current_user:
+            flash('You cannot unfollow yourself!')
+            return redirect(url_for('main.user', username=username))
+        timeline.unfollow(current_user, user)
+        flash(f'You are not following {username}.')
+        return redirect(url_for('main.user', username=username))
+    else:
+        return redirect(url_for('main.index'))
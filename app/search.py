@@ -0,0 +1,108 @@
+# Full-text search.
+# A LIKE '%term%' query has to read every row of the post table, so searches go to a separate
+# inverted index instead. The default backend is an SQLite FTS5 table kept in its own file
+# (SEARCH_INDEX_PATH), which works whatever database the app itself uses; results are ranked with
+# FTS5's bm25. Models opt in with SearchableMixin (see app/models.py) and are added to / removed from
+# the index automatically when a session commits. `flask search reindex` rebuilds it from scratch.
+# A backend is any class with add(index, fields, rows), remove(index, fields, ids),
+# query(index, fields, text, offset, limit) and clear(index, fields); register it in BACKENDS and
+# select it with SEARCH_BACKEND.
+import os
+import sqlite3
+import threading
+
+from flask import current_app
+
+
+class Fts5Index:
+    def __init__(self, app):
+        self.path = app.config['SEARCH_INDEX_PATH']
+        self.fields = {}
+        self._local = threading.local()
+
+    def _connection(self):
+        # sqlite3 connections can't be shared between threads, so each thread opens its own
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            os.makedirs(os.path.dirname(self.path) or '.', exist_ok=True)
+            conn = sqlite3.connect(self.path, timeout=5)
+            conn.execute('PRAGMA journal_mode=WAL')
+            self._local.conn = conn
+        return conn
+
+    def _table(self, conn, index, fields):
+        if self.fields.get(index) != fields:
+            conn.execute('CREATE VIRTUAL TABLE IF NOT EXISTS "{}" USING fts5({}, '
+                         'tokenize=\'porter unicode61\')'.format(index, ', '.join(fields)))
+            self.fields[index] = fields
+
+    def add(self, index, fields, rows):
+        # rows: (id, value of each field) tuples; existing ids are replaced
+        conn = self._connection()
+        self._table(conn, index, fields)
+        with conn:
+            conn.executemany('INSERT OR REPLACE INTO "{}" (rowid, {}) VALUES (?{})'.format(
+                index, ', '.join(fields), ', ?' * len(fields)), rows)
+
+    def remove(self, index, fields, ids):
+        conn = self._connection()
+        self._table(conn, index, fields)
+        with conn:
+            conn.executemany('DELETE FROM "{}" WHERE rowid = ?'.format(index),
+                             [(id,) for id in ids])
+
+    def query(self, index, fields, text, offset, limit):
+        conn = self._connection()
+        self._table(conn, index, fields)
+        # every word is quoted, so what people type is always searched for literally and can't be a
+        # syntax error (FTS5 would otherwise treat AND, OR, NEAR, * and quotes as operators)
+        match = ' '.join('"{}"'.format(word.replace('"', '""')) for word in text.split())
+        if not match:
+            return []
+        rows = conn.execute('SELECT rowid FROM "{}" WHERE "{}" MATCH ? ORDER BY rank '
+                            'LIMIT ? OFFSET ?'.format(index, index), (match, limit, offset))
+        return [row[0] for row in rows]
+
+    def clear(self, index, fields):
+        conn = self._connection()
+        with conn:
+            conn.execute('DROP TABLE IF EXISTS "{}"'.format(index))
+        self.fields.pop(index, None)
+        self._table(conn, index, fields)
+
+
+BACKENDS = {'fts5': Fts5Index}
+
+
+class SearchIndex:
+    def __init__(self, app=None):
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        backend = app.config['SEARCH_BACKEND']
+        app.extensions['search'] = BACKENDS[backend](app) if isinstance(backend, str) else backend
+
+
+def _backend():
+    return current_app.extensions['search']
+
+
+def add_to_index(index, fields, rows):
+    if rows:
+        _backend().add(index, fields, rows)
+
+
+def remove_from_index(index, fields, ids):
+    if ids:
+        _backend().remove(index, fields, ids)
+
+
+def query_index(index, fields, text, page, per_page):
+    # returns the ids for one page of results (best match first) and whether there is another page
+    ids = _backend().query(index, fields, text, (page - 1) * per_page, per_page + 1)
+    return ids[:per_page], len(ids) > per_page
+
+
+def clear_index(index, fields):
+    _backend().clear(index, fields)
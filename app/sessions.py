@@ -0,0 +1,152 @@
+# Server-side sessions (optional).
+# Flask normally keeps the whole session in a signed cookie, so every request uploads it and every
+# change re-signs and re-sends it. With SESSION_BACKEND set, the cookie only holds a random session id
+# and the data lives in a local store instead:
+# - 'sqlite' is a file shared by all worker processes on the machine (SESSION_STORE_PATH), which is
+#   all a single-server deployment needs; another store can be passed in as an object with the same
+#   get / set / touch / delete methods
+# - the data is serialized the same way Flask serializes its cookie sessions (tagged JSON, no pickle)
+# - a session is only written back when it changed; for permanent sessions the expiry is pushed
+#   forward at most once per SESSION_TOUCH_INTERVAL seconds instead of on every request
+# - the session id changes when a user logs in, so an id planted before login is worthless after it
+# Leaving SESSION_BACKEND unset keeps Flask's cookie sessions.
+import secrets
+import sqlite3
+import threading
+import time
+
+from flask.json.tag import TaggedJSONSerializer
+from flask.sessions import SessionInterface, SessionMixin
+from flask_login import user_logged_in
+from werkzeug.datastructures import CallbackDict
+
+
+class SQLiteSessionStore:
+    # how many writes happen between deletes of expired sessions
+    PURGE_EVERY = 256
+
+    def __init__(self, app):
+        self.path = app.config['SESSION_STORE_PATH']
+        self._local = threading.local()
+        self._writes = 0
+
+    def _connection(self):
+        # sqlite3 connections can't be shared between threads, so each thread opens its own
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=5, isolation_level=None)
+            conn.execute('PRAGMA journal_mode=WAL')
+            conn.execute('PRAGMA synchronous=NORMAL')
+            conn.execute('CREATE TABLE IF NOT EXISTS session (sid TEXT PRIMARY KEY, data TEXT NOT NULL, '
+                         'expires REAL NOT NULL) WITHOUT ROWID')
+            self._local.conn = conn
+        return conn
+
+    def get(self, sid):
+        # (data, expiry timestamp), or None for unknown and expired sessions
+        row = self._connection().execute(
+            'SELECT data, expires FROM session WHERE sid = ? AND expires > ?', (sid, time.time())).fetchone()
+        return tuple(row) if row else None
+
+    def set(self, sid, data, expires):
+        conn = self._connection()
+        conn.execute('INSERT OR REPLACE INTO session (sid, data, expires) VALUES (?, ?, ?)', (sid, data, expires))
+        self._writes += 1
+        if self._writes % self.PURGE_EVERY == 0:
+            conn.execute('DELETE FROM session WHERE expires < ?', (time.time(),))
+
+    def touch(self, sid, expires):
+        self._connection().execute('UPDATE session SET expires = ? WHERE sid = ?', (expires, sid))
+
+    def delete(self, sid):
+        self._connection().execute('DELETE FROM session WHERE sid = ?', (sid,))
+
+
+BACKENDS = {'sqlite': SQLiteSessionStore}
+
+
+class ServerSession(CallbackDict, SessionMixin):
+    def __init__(self, initial=None, sid=None, expires=None, new=False):
+        def on_update(self):
+            self.modified = True
+        super().__init__(initial, on_update)
+        self.sid = sid
+        self.expires = expires
+        self.new = new
+        self.modified = False
+
+    def rotate(self):
+        # a fresh id for the same data; the old one is deleted when the session is saved
+        self.previous_sid = getattr(self, 'previous_sid', None) or self.sid
+        self.sid = secrets.token_urlsafe(32)
+        self.modified = True
+
+
+class ServerSessionInterface(SessionInterface):
+    serializer = TaggedJSONSerializer()
+
+    def __init__(self, store):
+        self.store = store
+
+    def open_session(self, app, request):
+        sid = request.cookies.get(self.get_cookie_name(app))
+        if sid:
+            stored = self.store.get(sid)
+            if stored is not None:
+                data, expires = stored
+                return ServerSession(self.serializer.loads(data), sid=sid, expires=expires)
+        return ServerSession(sid=secrets.token_urlsafe(32), new=True)
+
+    def save_session(self, app, session, response):
+        name = self.get_cookie_name(app)
+        domain = self.get_cookie_domain(app)
+        path = self.get_cookie_path(app)
+        previous_sid = getattr(session, 'previous_sid', None)
+        if previous_sid:
+            self.store.delete(previous_sid)
+        if not session:
+            # emptied (e.g. everything popped at logout): forget it instead of storing an empty dict
+            if not session.new:
+                self.store.delete(session.sid)
+                response.delete_cookie(name, domain=domain, path=path,
+                                       secure=self.get_cookie_secure(app),
+                                       samesite=self.get_cookie_samesite(app),
+                                       httponly=self.get_cookie_httponly(app))
+            return
+        response.vary.add('Cookie')
+        expires = self.get_expiration_time(app, session)
+        # the cookie's expiry; None means a browser-session cookie, which the store still drops after
+        # PERMANENT_SESSION_LIFETIME so abandoned sessions don't pile up
+        stored_until = (expires.timestamp() if expires else
+                        time.time() + app.permanent_session_lifetime.total_seconds())
+        if session.modified or session.new:
+            self.store.set(session.sid, self.serializer.dumps(dict(session)), stored_until)
+        elif (self.should_set_cookie(app, session) and session.expires is not None
+                and stored_until - session.expires > app.config['SESSION_TOUCH_INTERVAL']):
+            self.store.touch(session.sid, stored_until)
+        else:
+            return
+        response.set_cookie(name, session.sid, expires=expires, domain=domain, path=path,
+                            secure=self.get_cookie_secure(app),
+                            samesite=self.get_cookie_samesite(app),
+                            httponly=self.get_cookie_httponly(app))
+
+
+class ServerSessions:
+    def __init__(self, app=None):
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        backend = app.config['SESSION_BACKEND']
+        if not backend:
+            return
+        store = BACKENDS[backend](app) if isinstance(backend, str) else backend
+        app.session_interface = ServerSessionInterface(store)
+        user_logged_in.connect(_rotate_session_id, app, weak=False)
+
+
+def _rotate_session_id(app, **extra):
+    from flask import session
+    if isinstance(session._get_current_object(), ServerSession):
+        session.rotate()
@@ -0,0 +1,56 @@
+# Compiled template cache.
+# Jinja turns every template into Python code the first time a process renders it: base.html,
+# index.html, user.html, _post.html and the form templates are parsed and compiled again by every
+# gunicorn worker after every restart, and the first requests each worker serves pay for it.
+# - TEMPLATE_CACHE_DIR: Jinja's FileSystemBytecodeCache keeps the compiled bytecode of each template
+#   as a file there, keyed by template name and a checksum of its source, so other workers and later
+#   restarts load it instead of compiling. Files are written to a temporary name and renamed, so
+#   workers can share the directory; an edited template gets a new checksum and is compiled again.
+#   Bytecode only loads on the Python version that wrote it; any other version just compiles.
+# - `flask templates compile` compiles every template into the cache at deploy time, so not even the
+#   first request after a deploy compiles anything
+# - preload() loads every template into the app's in-memory template cache; gunicorn.conf.py calls it
+#   in the master process, so the workers are forked with all templates ready
+# An empty TEMPLATE_CACHE_DIR turns the file cache off.
+import os
+
+from jinja2 import FileSystemBytecodeCache
+
+
+class TemplateCache:
+    def __init__(self, app=None):
+        self.app = None
+        self.bytecode_cache = None
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        self.app = app
+        directory = app.config['TEMPLATE_CACHE_DIR']
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+            self.bytecode_cache = FileSystemBytecodeCache(directory)
+            app.jinja_env.bytecode_cache = self.bytecode_cache
+            # must be set before the first template is loaded: Jinja only consults it when compiling
+
+    def names(self):
+        # every template the app can render (its own folder and the blueprints'), without hidden files
+        # such as .DS_Store
+        return sorted(self.app.jinja_env.list_templates(
+            filter_func=lambda name: not os.path.basename(name).startswith('.')))
+
+    def preload(self):
+        names = self.names()
+        for name in names:
+            self.app.jinja_env.get_template(name)
+        return len(names)
+
+    def compile(self):
+        # fresh bytecode for every template; the files of templates that changed or were removed since
+        # the last deploy are dropped first, so they don't pile up
+        if self.bytecode_cache is None:
+            return 0
+        self.bytecode_cache.clear()
+        self.app.jinja_env.cache.clear()
+        # otherwise get_template() would return the templates already in memory without writing anything
+        return self.preload()
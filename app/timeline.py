@@ -0,0 +1,84 @@
+# Fan-out-on-write for home timelines.
+# When a post is written we copy a small (reader, post) row into the timeline table for every
+# follower of the author, so each reader's home page is already "materialized" and can be read with
+# one indexed range scan. Authors with a huge following ("celebrities", above
+# TIMELINE_CELEBRITY_THRESHOLD followers) would turn every post into millions of inserts, so for them
+# we skip the copy and merge their posts in when the timeline is read instead (fan-out-on-read, see
+# home_timeline() in app/feed.py).
+from itertools import groupby
+
+import sqlalchemy as sa
+from flask import current_app
+
+from app import db
+from app.models import User, Post, TimelineEntry, followers
+
+
+def is_celebrity(user):
+    return user.follower_count > current_app.config['TIMELINE_CELEBRITY_THRESHOLD']
+
+
+def _entry(reader_id, post):
+    return {'user_id': reader_id, 'post_id': post.id,
+            'author_id': post.user_id, 'timestamp': post.timestamp}
+
+
+def fan_out(posts):
+    # posts must already be flushed (they need their id and timestamp). Authors always get their own
+    # posts in their inbox, followers only when the author is not a celebrity. Inserts are sent in
+    # executemany batches of TIMELINE_FANOUT_BATCH rows so memory stays flat for popular authors.
+    batch_size = current_app.config['TIMELINE_FANOUT_BATCH']
+    posts = sorted(posts, key=lambda post: post.user_id)
+    for author_id, author_posts in groupby(posts, key=lambda post: post.user_id):
+        author_posts = list(author_posts)
+        db.session.execute(sa.insert(TimelineEntry),
+                           [_entry(author_id, post) for post in author_posts])
+        if is_celebrity(db.session.get(User, author_id)):
+            continue
+        follower_ids = db.session.scalars(
+            sa.select(followers.c.follower_id).where(followers.c.followed_id == author_id))
+        rows = []
+        for follower_id in follower_ids:
+            rows.extend(_entry(follower_id, post) for post in author_posts)
+            if len(rows) >= batch_size:
+                db.session.execute(sa.insert(TimelineEntry), rows)
+                rows = []
+        if rows:
+            db.session.execute(sa.insert(TimelineEntry), rows)
+
+
+def publish(author, body):
+    # the single place a new post should be created from, so it always lands in the timelines
+    post = Post(body=body, author=author)
+    db.session.add(post)
+    db.session.flush()
+    fan_out([post])
+    db.session.commit()
+    return post
+
+
+def follow(user, author):
+    # Following someone backfills their most recent TIMELINE_BACKFILL posts into the reader's inbox
+    # with one INSERT ... SELECT, so the home page isn't empty until they post again. Celebrities are
+    # read at request time, so nothing is copied for them.
+    if user.is_following(author):
+        return
+    celebrity = is_celebrity(author)
+    user.follow(author)
+    if not celebrity:
+        recent = (sa.select(sa.literal(user.id), Post.id, Post.user_id, Post.timestamp)
+                  .where(Post.user_id == author.id)
+                  .order_by(Post.timestamp.desc())
+                  .limit(current_app.config['TIMELINE_BACKFILL']))
+        db.session.execute(sa.insert(TimelineEntry).from_select(
+            ['user_id', 'post_id', 'author_id', 'timestamp'], recent))
+    db.session.commit()
+
+
+def unfollow(user, author):
+    if not user.is_following(author):
+        return
+    user.unfollow(author)
+    db.session.execute(sa.delete(TimelineEntry).where(
+        TimelineEntry.user_id == user.id, TimelineEntry.author_id == author.id))
+    db.session.commit()
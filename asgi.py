@@ -0,0 +1,13 @@
+# ASGI entry point: the same app, with the read-only JSON API served by async views (see
+# app/async_api.py). Needs uvicorn, a2wsgi, greenlet and the async database driver (aiosqlite for
+# SQLite), listed in requirements-asgi.txt. Run it with uvicorn workers under gunicorn, which uses
+# gunicorn.conf.py like the sync app:
+#   gunicorn -c gunicorn.conf.py -k uvicorn.workers.UvicornWorker asgi:application
+# (plain `uvicorn asgi:application` is fine for one process, but `uvicorn --workers` listens on a socket
+# without TCP_NODELAY, which delays every response body by ~40 ms)
+# microblog.py (gunicorn, `flask run`) keeps serving everything synchronously; both can use the same
+# database at the same time.
+from microblog import app
+from app.async_api import AsyncApp
+
+application = AsyncApp(app)
@@ -0,0 +1,17 @@
+# Benchmarks for the whole app: `python -m benchmarks` (run from the project directory).
+# 1. generates a synthetic dataset of configurable size (users, posts, a skewed follow graph; see
+#    dataset.py), once per set of parameters, cached in benchmarks/.data
+# 2. replays a mix of traffic from several logged-in virtual users (see traffic.py) through Flask's
+#    test client and through a real local WSGI server, and reports requests/second and p50/p95/p99
+#    latency per route
+# 3. times the individual pieces earlier performance work added (see micro.py) and how long a new
+#    process takes to import the app, build it and serve a first request (see startup.py)
+# 4. with --capacity, compares how the sync app and the async mode (asgi.py) cope with more and more
+#    concurrent connections (see capacity.py)
+# Save the results as a baseline with --save, and compare later runs with --baseline: the command
+# exits with status 1 when a route's p95 latency (or a component's timing) got worse by more than
+# --threshold. Baselines only mean something on the machine that made them, so they aren't committed.
+# e.g. python -m benchmarks --save benchmarks/.data/baseline.json
+#      ... change something ...
+#      python -m benchmarks --baseline benchmarks/.data/baseline.json
+# `python -m benchmarks --help` lists the dataset and traffic options.
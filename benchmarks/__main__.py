@@ -0,0 +1,116 @@
+import multiprocessing
+import os
+import platform
+import subprocess
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+import click
+
+from benchmarks import capacity, report, runner
+from benchmarks.dataset import Spec
+
+DEFAULT_WORKDIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), '.data')
+
+
+def _in_new_process(function, *args):
+    # 'spawn' rather than fork: the child imports the app from scratch, with no threads, caches or
+    # database connections inherited from an earlier phase
+    with ProcessPoolExecutor(max_workers=1, mp_context=multiprocessing.get_context('spawn')) as pool:
+        return pool.submit(function, *args).result()
+
+
+def _git_commit():
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], capture_output=True, text=True,
+                              check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+@click.command()
+@click.option('--users', type=int, default=1000, show_default=True, help='Users in the dataset.')
+@click.option('--posts', type=int, default=50000, show_default=True, help='Posts in the dataset.')
+@click.option('--follows', type=int, default=30, show_default=True, help='Average users each user follows.')
+@click.option('--skew', type=float, default=1.2, show_default=True,
+              help='Zipf exponent of popularity and activity (0 = uniform).')
+@click.option('--days', type=int, default=400, show_default=True, help='Posts are spread over this many days.')
+@click.option('--seed', type=int, default=42, show_default=True, help='Seed for the dataset and the traffic.')
+@click.option('--driver', type=click.Choice(['client', 'wsgi', 'both']), default='both', show_default=True,
+              help='Replay traffic through the test client, a local WSGI server, or both.')
+@click.option('--url', help='Replay against this running server instead (it must serve a dataset '
+                            'generated with the same options).')
+@click.option('--requests', type=int, default=2000, show_default=True, help='Timed requests per driver.')
+@click.option('--concurrency', type=int, default=4, show_default=True, help='Virtual users sending requests at once.')
+@click.option('--warmup', type=int, default=100, show_default=True, help='Untimed requests sent first.')
+@click.option('--micro/--no-micro', default=True, show_default=True, help='Also time individual components.')
+@click.option('--capacity/--no-capacity', 'with_capacity', default=False, show_default=True,
+              help='Also compare how many concurrent connections the sync and async (asgi.py) modes handle.')
+@click.option('--levels', default='1,8,32,128', show_default=True,
+              help='Concurrent clients to try in the capacity comparison.')
+@click.option('--threads', type=int, default=8, show_default=True,
+              help='Request threads of the sync server (and Flask fallback threads of the async one).')
+@click.option('--db-latency', type=float, default=2.0, show_default=True,
+              help='Milliseconds added to every SQL statement in the capacity comparison.')
+@click.option('--save', type=click.Path(dir_okay=False), help='Write the results to this JSON file.')
+@click.option('--baseline', type=click.Path(exists=True, dir_okay=False),
+              help='Compare with these saved results and fail on regressions.')
+@click.option('--threshold', type=float, default=0.25, show_default=True,
+              help='Allowed slowdown against the baseline, as a fraction.')
+@click.option('--workdir', type=click.Path(file_okay=False), default=DEFAULT_WORKDIR,
+              help='Where datasets and scratch files are kept.')
+def main(users, posts, follows, skew, days, seed, driver, url, requests, concurrency, warmup, micro,
+         with_capacity, levels, threads, db_latency, save, baseline, threshold, workdir):
+    """Generate a dataset, replay mixed traffic and report latency per route."""
+    spec = Spec(users, posts, follows, skew, days, seed)
+    workdir = os.path.abspath(workdir)
+    results = {'meta': {'spec': spec._asdict(), 'driver': url or driver, 'requests': requests,
+                        'concurrency': concurrency, 'python': platform.python_version(),
+                        'platform': platform.platform(), 'commit': _git_commit(),
+                        'time': time.strftime('%Y-%m-%dT%H:%M:%S%z')},
+               'phases': {}}
+
+    if url:
+        phases = [('url', runner.run_url, (spec, url, requests, concurrency, warmup))]
+    else:
+        click.echo(f'dataset: {users} users, {posts} posts')
+        if not _in_new_process(runner.prepare, spec, workdir):
+            click.echo('using the cached copy')
+        drivers = ['client', 'wsgi'] if driver == 'both' else [driver]
+        phases = [(name, getattr(runner, f'run_{name}'), (spec, workdir, requests, concurrency, warmup))
+                  for name in drivers]
+    for name, function, args in phases:
+        click.echo(f'replaying {requests} requests through {name} ...')
+        results['phases'][name] = _in_new_process(function, *args)
+        report.print_phase(name, results['phases'][name], echo=click.echo)
+    if with_capacity and not url:
+        click.echo(f'\ncapacity: sync vs async, {threads} threads, {db_latency} ms per statement ...')
+        levels = [int(level) for level in levels.split(',')]
+        phases = _in_new_process(capacity.run_capacity, spec, workdir, levels, requests, threads, db_latency)
+        for name, phase in phases.items():
+            results['phases'][name] = phase
+            report.print_phase(name, phase, echo=click.echo)
+    if micro and not url:
+        click.echo('\ntiming components ...')
+        results['micro'] = _in_new_process(runner.run_micro, spec, workdir)
+        report.print_micro(results['micro'], echo=click.echo)
+
+    if save:
+        report.save(results, save)
+        click.echo(f'\nsaved to {save}')
+    if baseline:
+        old = report.load(baseline)
+        if old['meta']['spec'] != results['meta']['spec']:
+            click.echo('\nwarning: the baseline was made with a different dataset', err=True)
+        found = report.regressions(old, results, threshold)
+        if found:
+            click.echo(f'\n{len(found)} regressions against {baseline} (threshold {threshold:.0%}):', err=True)
+            for line in found:
+                click.echo(f'  {line}', err=True)
+            sys.exit(1)
+        click.echo(f'\nno regressions against {baseline}')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,155 @@
+# Concurrent-connection capacity: the sync app (microblog.py) against the async mode (asgi.py).
+# The same dataset and the same number of threads for each:
+# - sync: a WSGI server handing each connection to a pool of `threads` threads, like a gunicorn worker
+#   with that many threads; a request holds its thread until it is done
+# - async: uvicorn serving app/async_api.py, the Flask fallback on a pool of `threads` threads
+# At every concurrency level that many clients send GET /api/v1/feed as fast as they get answers.
+# A local SQLite file answers in microseconds, which hides what the async mode is for, so every
+# statement can be given `latency` extra milliseconds, spent (like waiting for a database server)
+# in the thread that runs the query: a request thread in sync mode, aiosqlite's own thread in async
+# mode.
+import logging
+import socket
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import sqlalchemy as sa
+from sqlalchemy.util import await_only
+from werkzeug.serving import BaseWSGIServer
+
+from benchmarks.dataset import PASSWORD, username
+from benchmarks.traffic import HTTPSession, summarize
+from benchmarks.runner import fresh_app
+
+PATH = '/api/v1/feed?limit=20'
+
+
+class PooledWSGIServer(BaseWSGIServer):
+    # werkzeug's threaded server starts a thread per connection, i.e. has no limit at all
+    def __init__(self, host, port, app, threads):
+        super().__init__(host, port, app)
+        self.pool = ThreadPoolExecutor(max_workers=threads)
+
+    def process_request(self, request, client_address):
+        self.pool.submit(self._process, request, client_address)
+
+    def _process(self, request, client_address):
+        try:
+            self.finish_request(request, client_address)
+        except Exception:
+            self.handle_error(request, client_address)
+        finally:
+            self.shutdown_request(request)
+
+
+def _delay(latency):
+    seconds = latency / 1000
+    return lambda statement: time.sleep(seconds)
+
+
+def _add_latency(app, latency):
+    from app import db, async_db
+
+    def sync_connect(dbapi_connection, connection_record):
+        dbapi_connection.set_trace_callback(_delay(latency))
+        # the trace callback runs before each statement, in the thread executing it
+
+    def async_connect(dbapi_connection, connection_record):
+        await_only(dbapi_connection.driver_connection.set_trace_callback(_delay(latency)))
+
+    with app.app_context():
+        sa.event.listen(db.engine, 'connect', sync_connect)
+        sa.event.listen(async_db.engine.sync_engine, 'connect', async_connect)
+
+
+def _serve_sync(app, threads):
+    logging.getLogger('werkzeug').setLevel(logging.ERROR)
+    server = PooledWSGIServer('127.0.0.1', 0, app, threads)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    return f'http://127.0.0.1:{server.server_port}', server.shutdown
+
+
+def _serve_async(app, threads):
+    import uvicorn
+    from app.async_api import AsyncApp
+    app.config['ASYNC_WSGI_THREADS'] = threads
+    sock = socket.socket()
+    sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+    # inherited by the accepted connections; without it the response body waits ~40 ms behind the
+    # headers (Nagle + delayed ACK), as with `uvicorn --workers` (see asgi.py)
+    sock.bind(('127.0.0.1', 0))
+    server = uvicorn.Server(uvicorn.Config(AsyncApp(app), log_level='warning', backlog=2048))
+    thread = threading.Thread(target=server.run, kwargs={'sockets': [sock]}, daemon=True)
+    thread.start()
+    while not server.started:
+        time.sleep(0.01)
+
+    def stop():
+        server.should_exit = True
+        thread.join()
+    return f'http://127.0.0.1:{sock.getsockname()[1]}', stop
+
+
+def _logged_in_cookies(url, users):
+    # a few logged-in sessions, shared by the clients; logging every client in separately would mostly
+    # measure password hashing
+    cookies = []
+    for i in range(1, users + 1):
+        session = HTTPSession(url)
+        session.request('POST', '/login', {'username': username(i), 'password': PASSWORD})
+        cookies.append(dict(session.cookies))
+    return cookies
+
+
+def _load(url, cookies, clients, requests):
+    samples = []
+    lock = threading.Lock()
+    per_client = max(2, requests // clients)
+
+    def run(number):
+        session = HTTPSession(url)
+        session.cookies = dict(cookies[number % len(cookies)])
+        local = []
+        for _ in range(per_client):
+            started = time.perf_counter()
+            try:
+                status = session.request('GET', PATH)
+            except OSError:
+                status = None
+                session.connection = None
+            local.append((time.perf_counter() - started, status))
+        with lock:
+            samples.extend(local)
+
+    threads = [threading.Thread(target=run, args=(number,), daemon=True) for number in range(clients)]
+    started = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return samples, time.perf_counter() - started
+
+
+def run_capacity(spec, workdir, levels, requests, threads, latency):
+    # {'capacity_sync': phase, 'capacity_async': phase}, each phase's routes keyed 'feed x<clients>'
+    app = fresh_app(spec, workdir)
+    if latency:
+        _add_latency(app, latency)
+    phases = {}
+    for mode, serve in (('sync', _serve_sync), ('async', _serve_async)):
+        url, stop = serve(app, threads)
+        try:
+            cookies = _logged_in_cookies(url, min(8, spec.users))
+            _load(url, cookies, threads, 2 * threads)
+            # warm-up: connections, caches
+            routes = {}
+            for clients in levels:
+                samples, elapsed = _load(url, cookies, clients, requests)
+                routes[f'feed x{clients}'] = summarize({'feed': samples}, elapsed)['feed']
+        finally:
+            stop()
+        phases[f'capacity_{mode}'] = {'routes': routes,
+                                      'total_rps': max(stats['rps'] for stats in routes.values())}
+    return phases
@@ -0,0 +1,126 @@
+# Synthetic datasets for the benchmarks.
+# Everything is drawn from one random.Random(seed), so the same parameters always give the same
+# users, follows and posts (only the timestamps are relative to when it was generated).
+# - popularity follows a Zipf-like curve: user #1 is followed by far more people than user #1000,
+#   like real social graphs, so a few authors fan out to many timelines (and, above
+#   TIMELINE_CELEBRITY_THRESHOLD followers, become celebrities merged in at read time)
+# - how much people post is skewed the same way, but independently of how popular they are
+# - rows are written with Core bulk inserts, so counters, timelines and the search index are filled in
+#   here directly instead of by the session hooks
+import random
+from collections import namedtuple, Counter
+from datetime import datetime, timedelta, timezone
+from itertools import accumulate
+
+import sqlalchemy as sa
+from flask import current_app
+from werkzeug.security import generate_password_hash
+
+from app import db
+from app.avatars import email_digest
+from app.models import User, Post, TimelineEntry, followers
+from app.names import normalize
+from app.passwords import password_method
+
+# every generated user has this password
+PASSWORD = 'benchmark'
+WORDS = ('coffee morning python flask database index cache latency queue archive timeline follow '
+         'weekend music travel photo garden rain sunny code deploy release review bug fix test '
+         'server client cursor stream bloom filter token bucket session search').split()
+
+Spec = namedtuple('Spec', ['users', 'posts', 'follows', 'skew', 'days', 'seed'])
+
+
+def spec_key(spec):
+    # a file-name friendly summary of the parameters, used to cache generated datasets
+    return 'u{}-p{}-f{}-s{}-d{}-r{}'.format(*spec)
+
+
+def username(i):
+    return f'user{i}'
+
+
+def email(i):
+    return f'user{i}@example.com'
+
+
+def sentence(rng, words=8):
+    return ' '.join(rng.choice(WORDS) for _ in range(words))
+
+
+def _zipf_picker(rng, n, skew):
+    # returns a function picking a number in 1..n, 1 the most likely, with probability ~ 1 / rank**skew
+    cumulative = list(accumulate(1 / rank ** skew for rank in range(1, n + 1)))
+    population = range(1, n + 1)
+    return lambda: rng.choices(population, cum_weights=cumulative)[0]
+
+
+def follow_graph(spec, rng):
+    # {follower id: set of followed ids}; each user follows about spec.follows others (exponentially
+    # distributed, so some follow a handful and a few follow hundreds), chosen by popularity
+    pick = _zipf_picker(rng, spec.users, spec.skew)
+    graph = {}
+    for follower in range(1, spec.users + 1):
+        wanted = min(spec.users - 1, max(1, round(rng.expovariate(1 / spec.follows))))
+        followed = set()
+        for _ in range(wanted * 4):
+            if len(followed) >= wanted:
+                break
+            target = pick()
+            if target != follower:
+                followed.add(target)
+        graph[follower] = followed
+    return graph
+
+
+def generate(spec, echo=print):
+    # fills the (empty, already created) database of the current app
+    rng = random.Random(spec.seed)
+    now = datetime.now(timezone.utc)
+    password_hash = generate_password_hash(PASSWORD, method=password_method())
+    # one hash for everyone: logins still pay the full PASSWORD_HASH_COST, generating doesn't
+
+    graph = follow_graph(spec, rng)
+    follower_counts = Counter(followed for targets in graph.values() for followed in targets)
+
+    activity = list(range(1, spec.users + 1))
+    rng.shuffle(activity)
+    pick_rank = _zipf_picker(rng, spec.users, spec.skew)
+    posts = sorted(((now - timedelta(seconds=rng.uniform(0, spec.days * 86400)), activity[pick_rank() - 1])
+                    for _ in range(spec.posts)))
+    # oldest first, so post ids grow with time as they would in real life
+    post_counts = Counter(author for _, author in posts)
+    newest = {author: timestamp for timestamp, author in posts}
+
+    db.session.execute(sa.insert(User.__table__), [
+        {'id': i, 'username': username(i), 'email': email(i), 'username_key': normalize(username(i)),
+         'email_key': normalize(email(i)), 'password_hash': password_hash, 'about_me': sentence(rng, 6),
+         'avatar_digest': email_digest(email(i)), 'last_seen': now, 'profile_version': 0,
+         'follower_count': follower_counts[i], 'post_count': post_counts[i], 'last_post_at': newest.get(i)}
+        for i in range(1, spec.users + 1)])
+    echo(f'{spec.users} users')
+    edges = [{'follower_id': follower, 'followed_id': followed}
+             for follower, targets in graph.items() for followed in sorted(targets)]
+    for start in range(0, len(edges), 50000):
+        db.session.execute(followers.insert(), edges[start:start + 50000])
+    echo(f'{len(edges)} follows')
+    for start in range(0, len(posts), 50000):
+        db.session.execute(sa.insert(Post.__table__), [
+            {'body': sentence(rng, rng.randint(3, 14))[:140], 'timestamp': timestamp, 'user_id': author}
+            for timestamp, author in posts[start:start + 50000]])
+    echo(f'{spec.posts} posts')
+
+    # home timelines as app/timeline.py would have built them: every author gets their own posts, and
+    # the followers of every non-celebrity author get theirs
+    timeline_columns = ['user_id', 'post_id', 'author_id', 'timestamp']
+    db.session.execute(sa.insert(TimelineEntry).from_select(
+        timeline_columns, sa.select(Post.user_id, Post.id, Post.user_id, Post.timestamp)))
+    db.session.execute(sa.insert(TimelineEntry).from_select(timeline_columns, sa.select(
+        followers.c.follower_id, Post.id, Post.user_id, Post.timestamp)
+        .select_from(Post)
+        .join(followers, followers.c.followed_id == Post.user_id)
+        .join(User, User.id == Post.user_id)
+        .where(User.follower_count <= current_app.config['TIMELINE_CELEBRITY_THRESHOLD'])))
+    db.session.commit()
+    echo(f'{db.session.scalar(sa.select(sa.func.count()).select_from(TimelineEntry))} timeline entries')
+    echo(f'{Post.reindex(10000)} posts indexed for search')
@@ -0,0 +1,357 @@
+# Component benchmarks: the pieces earlier performance work added, measured on their own so a
+# regression shows up even when it's lost in the noise of whole requests.
+# Each function runs inside an app context on the generated dataset and returns
+# {metric name: {'value': ..., 'unit': ..., 'better': 'lower' or 'higher'}}.
+# They change the data (posts are written, users renamed), so they run after the traffic replay.
+import os
+import statistics
+import tempfile
+import threading
+import time
+import tracemalloc
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
+
+import sqlalchemy as sa
+from flask import current_app, render_template
+from jinja2 import FileSystemBytecodeCache
+
+from app import db, post_ingester, identity_cache, taken_names, template_cache
+from app.archive import archive_posts, user_archive
+from app.engine import engine_options, tune_engine
+from app.feed import paginate, home_timeline
+from app.models import User, Post, followers
+from app.ratelimit import MemoryBuckets, SQLiteBuckets
+from app.search import add_to_index, query_index, clear_index
+from app.timeline import publish
+
+from benchmarks.dataset import PASSWORD, username
+
+
+def _metric(value, unit, better='lower'):
+    return {'value': value, 'unit': unit, 'better': better}
+
+
+def _per_call_us(function, number):
+    started = time.perf_counter()
+    for _ in range(number):
+        function()
+    return (time.perf_counter() - started) / number * 1e6
+
+
+def _median_ms(function, runs):
+    timings = []
+    for _ in range(runs):
+        started = time.perf_counter()
+        function()
+        timings.append(time.perf_counter() - started)
+        db.session.expunge_all()
+        # so every run loads its rows again instead of finding them in the identity map
+    return statistics.median(timings) * 1000
+
+
+def rate_limiter():
+    results = {}
+    for name, backend in (('memory', MemoryBuckets), ('sqlite', SQLiteBuckets)):
+        buckets = backend(current_app)
+        keys = [f'bench:{i}' for i in range(1000)]
+        counter = iter(range(10 ** 9))
+        results[f'ratelimit_{name}_hit'] = _metric(
+            _per_call_us(lambda: buckets.hit(keys[next(counter) % 1000], 10.0, 20), 5000), 'us')
+    return results
+
+
+def ingest(posts=2000, writers=64):
+    # posts/second through the group-commit queue with many concurrent writers, and with one
+    # transaction per post (the old way) for comparison
+    author_ids = db.session.scalars(sa.select(User.id).order_by(User.id).limit(writers)).all()
+    db.session.commit()
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=writers) as pool:
+        futures = [pool.submit(lambda i: post_ingester.submit(author_ids[i % len(author_ids)],
+                                                              f'benchmark post {i}').result(timeout=60), i)
+                   for i in range(posts)]
+        for future in futures:
+            future.result()
+    queued = posts / (time.perf_counter() - started)
+    author = db.session.get(User, author_ids[0])
+    started = time.perf_counter()
+    for i in range(posts // 10):
+        publish(author, f'benchmark direct post {i}')
+    direct = (posts // 10) / (time.perf_counter() - started)
+    return {'ingest_queue_posts_per_s': _metric(queued, 'posts/s', 'higher'),
+            'ingest_direct_posts_per_s': _metric(direct, 'posts/s', 'higher')}
+
+
+def sqlite_concurrency(readers=4, seconds=2.0, rows=20000):
+    # reads and writes per second on a scratch SQLite file while `readers` threads keep reading the
+    # newest rows and one thread keeps committing single inserts: once with SQLite's defaults (rollback
+    # journal, synchronous=FULL, only the sqlite3 driver's own 5 second lock timeout) and once with the
+    # engine options and pragmas of app/engine.py (WAL, synchronous=NORMAL, busy_timeout, mmap_size)
+    config = current_app.config
+    results = {}
+    for mode in ('default', 'tuned'):
+        directory = tempfile.mkdtemp(dir=os.path.dirname(config['SEARCH_INDEX_PATH']))
+        url = 'sqlite:///' + os.path.join(directory, 'concurrency.db')
+        if mode == 'tuned':
+            engine = sa.create_engine(url, **engine_options({**config, 'SQLALCHEMY_DATABASE_URI': url}))
+            tune_engine(engine, config)
+        else:
+            engine = sa.create_engine(url)
+        table = sa.Table('item', sa.MetaData(), sa.Column('id', sa.Integer, primary_key=True),
+                         sa.Column('body', sa.String(140)), sa.Column('timestamp', sa.Float, index=True))
+        with engine.begin() as conn:
+            table.create(conn)
+            conn.execute(table.insert(), [{'body': f'row {i}', 'timestamp': i} for i in range(rows)])
+        stop, counts, errors = threading.Event(), {'read': 0, 'write': 0}, []
+
+        def work(kind):
+            while not stop.is_set():
+                try:
+                    with engine.begin() as conn:
+                        if kind == 'read':
+                            conn.execute(sa.select(table).order_by(table.c.timestamp.desc()).limit(25)).all()
+                        else:
+                            conn.execute(table.insert().values(body='new', timestamp=time.time()))
+                except sa.exc.OperationalError as error:
+                    errors.append(error)
+                    # "database is locked": counted, not retried
+                else:
+                    counts[kind] += 1
+
+        threads = [threading.Thread(target=work, args=('read',)) for _ in range(readers)]
+        threads.append(threading.Thread(target=work, args=('write',)))
+        for thread in threads:
+            thread.start()
+        time.sleep(seconds)
+        stop.set()
+        for thread in threads:
+            thread.join()
+        engine.dispose()
+        results[f'sqlite_{mode}_reads_per_s'] = _metric(counts['read'] / seconds, 'reads/s', 'higher')
+        results[f'sqlite_{mode}_writes_per_s'] = _metric(counts['write'] / seconds, 'writes/s', 'higher')
+        results[f'sqlite_{mode}_locked_errors'] = _metric(len(errors), 'errors')
+    return results
+
+
+def search(sizes=(10000, 100000), runs=50):
+    # first-page search latency against indexes of different sizes, filled with the dataset's post
+    # bodies (repeated as often as needed), for a common word and a two-word query
+    bodies = db.session.scalars(sa.select(Post.body).order_by(Post.id).limit(max(sizes))).all()
+    per_page = current_app.config['POSTS_PER_PAGE']
+    results = {}
+    for size in sizes:
+        index, fields = f'bench_search_{size}', ['body']
+        clear_index(index, fields)
+        for start in range(0, size, 10000):
+            add_to_index(index, fields, [(i + 1, bodies[i % len(bodies)])
+                                         for i in range(start, min(size, start + 10000))])
+        for name, text in (('one_word', 'coffee'), ('two_words', 'coffee morning')):
+            results[f'search_{size}_posts_{name}'] = _metric(_median_ms(
+                lambda: query_index(index, fields, text, 1, per_page), runs), 'ms')
+        clear_index(index, fields)
+    return results
+
+
+def feeds(runs=50):
+    total = db.session.scalar(sa.select(sa.func.count()).select_from(Post))
+    deep = db.session.scalars(sa.select(Post).order_by(Post.timestamp.desc(), Post.id.desc())
+                              .offset(int(total * 0.9)).limit(1)).first()
+    deep_cursor = (deep.timestamp, deep.id)
+    reader_id = db.session.scalar(sa.select(followers.c.follower_id).group_by(followers.c.follower_id)
+                                  .order_by(sa.func.count().desc()).limit(1))
+    popular_id = db.session.scalar(sa.select(User.id).order_by(User.follower_count.desc()).limit(1))
+    return {
+        'explore_first_page': _metric(_median_ms(lambda: paginate(sa.select(Post)), runs), 'ms'),
+        'explore_page_90pct_deep': _metric(_median_ms(lambda: paginate(sa.select(Post), deep_cursor), runs), 'ms'),
+        'home_timeline_top_follower': _metric(_median_ms(
+            lambda: home_timeline(db.session.get(User, reader_id)), runs), 'ms'),
+        'profile_posts_most_followed': _metric(_median_ms(
+            lambda: paginate(sa.select(Post).where(Post.user_id == popular_id)), runs), 'ms'),
+    }
+
+
+def export(client):
+    # streams every post of the most prolific user through /api/v1 (gzip) and reports MB/s of JSON
+    author = db.session.scalar(sa.select(User).order_by(User.post_count.desc()).limit(1))
+    client.post('/login', data={'username': author.username, 'password': PASSWORD})
+    started = time.perf_counter()
+    response = client.get(f'/api/v1/users/{author.username}/posts/export', headers={'Accept-Encoding': 'gzip'})
+    response.get_data()
+    seconds = time.perf_counter() - started
+    return {'api_export_posts_per_s': _metric(author.post_count / seconds, 'posts/s', 'higher')}
+
+
+def export_peak_memory(client, username):
+    # the most memory (bytes, as seen by tracemalloc) allocated at any one time while /api/v1 streams
+    # every post of `username`; each chunk is dropped once read, like a client writing it to a file
+    tracemalloc.start()
+    try:
+        response = client.get(f'/api/v1/users/{username}/posts/export', buffered=False)
+        for chunk in response.iter_encoded():
+            pass
+        response.close()
+        return tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+
+
+def add_posts_by(name, count):
+    # a new user with `count` posts, written with one Core insert (no timelines, counters or search)
+    user = User(username=name, email=f'{name}@example.com')
+    db.session.add(user)
+    db.session.flush()
+    db.session.execute(sa.insert(Post.__table__), [
+        {'user_id': user.id, 'body': f'post {i} by {name}', 'timestamp': datetime(2026, 1, 1) + timedelta(seconds=i)}
+        for i in range(count)])
+    db.session.commit()
+    return user
+
+
+def export_memory(client, sizes=(5000, 50000)):
+    # peak memory of a full export at two sizes: streamed in API_EXPORT_BATCH rows at a time, it
+    # should stay about the same however many posts the user has
+    results = {}
+    export_peak_memory(client, add_posts_by('export-warmup', 10).username)
+    # the first export imports and caches things the later ones reuse
+    for size in sizes:
+        peak = export_peak_memory(client, add_posts_by(f'export{size}', size).username)
+        results[f'api_export_peak_memory_{size}_posts'] = _metric(peak / 1024, 'KiB')
+    return results
+
+
+def identity_and_names():
+    user_id = db.session.scalar(sa.select(User.id).limit(1))
+    identity_cache.load(db.session, user_id)
+    counter = iter(range(10 ** 9))
+    return {
+        'identity_cache_hit': _metric(_per_call_us(lambda: identity_cache.load(db.session, user_id), 5000), 'us'),
+        'username_check_free': _metric(_per_call_us(
+            lambda: taken_names.username_taken(f'free-{next(counter)}'), 5000), 'us'),
+        'username_check_taken': _metric(_per_call_us(lambda: taken_names.username_taken(username(1)), 2000), 'us'),
+    }
+
+
+def templates(runs=20, posts=50):
+    # loading every template in a new process (a fresh Jinja environment) by compiling it and from the
+    # bytecode cache, and rendering a page's worth of posts with render_template() (the old way) and
+    # the way the fragment cache renders them on a miss
+    def load_all(bytecode_cache):
+        env = current_app.create_jinja_environment()
+        env.bytecode_cache = bytecode_cache
+        for name in template_cache.names():
+            env.get_template(name)
+
+    directory = tempfile.mkdtemp(dir=current_app.config['TEMPLATE_CACHE_DIR'])
+    bytecode_cache = FileSystemBytecodeCache(directory)
+    load_all(bytecode_cache)
+    page = db.session.scalars(sa.select(Post).order_by(Post.id.desc()).limit(posts)).all()
+    for post in page:
+        post.author
+        # loaded up front, so only rendering is timed
+    template = current_app.jinja_env.get_template('_post.html')
+    with current_app.test_request_context('/'):
+        per_post_old = _per_call_us(lambda: [render_template('_post.html', post=post) for post in page], runs) / posts
+        per_post_new = _per_call_us(lambda: [template.render(post=post) for post in page], runs) / posts
+    results = {'templates_compile_all': _metric(_median_ms(lambda: load_all(None), runs), 'ms'),
+               'templates_load_bytecode_all': _metric(_median_ms(lambda: load_all(bytecode_cache), runs), 'ms'),
+               'render_post_render_template': _metric(per_post_old, 'us'),
+               'render_post_direct': _metric(per_post_new, 'us')}
+    bytecode_cache.clear()
+    os.rmdir(directory)
+    return results
+
+
+def _p95_ms(timings):
+    return statistics.quantiles(timings, n=20)[-1] * 1000 if len(timings) > 1 else 0.0
+
+
+def login_burst(logins=8, readers=2):
+    # a burst of concurrent logins (each one a full PASSWORD_HASH_COST check) while other users keep
+    # loading /explore: logins/second, and the readers' p95 latency during the burst. Once with the
+    # bounded verification pool, once with the checks on the request threads (PASSWORD_VERIFY_WORKERS = 0)
+    app = current_app._get_current_object()
+    workers = app.config['PASSWORD_VERIFY_WORKERS']
+    reader_clients = []
+    for i in range(1, readers + 1):
+        reader = app.test_client()
+        reader.post('/login', data={'username': username(i), 'password': PASSWORD})
+        reader_clients.append(reader)
+
+    def log_in(i):
+        response = app.test_client().post('/login', data={'username': username(i), 'password': PASSWORD})
+        assert response.status_code == 302 and '/login' not in response.location, 'login failed'
+
+    def read(reader, stop, timings):
+        while not stop.is_set():
+            started = time.perf_counter()
+            reader.get('/explore')
+            timings.append(time.perf_counter() - started)
+
+    results = {}
+    for mode, pool_workers in (('pool', workers), ('inline', 0)):
+        app.config['PASSWORD_VERIFY_WORKERS'] = pool_workers
+        stop, timings = threading.Event(), []
+        threads = [threading.Thread(target=read, args=(reader, stop, timings)) for reader in reader_clients]
+        for thread in threads:
+            thread.start()
+        started = time.perf_counter()
+        try:
+            with ThreadPoolExecutor(max_workers=logins) as pool:
+                list(pool.map(log_in, range(readers + 1, readers + logins + 1)))
+        finally:
+            elapsed = time.perf_counter() - started
+            stop.set()
+            for thread in threads:
+                thread.join()
+            app.config['PASSWORD_VERIFY_WORKERS'] = workers
+        results[f'login_burst_{mode}_logins_per_s'] = _metric(logins / elapsed, 'logins/s', 'higher')
+        results[f'login_burst_{mode}_page_p95'] = _metric(_p95_ms(timings), 'ms')
+    return results
+
+
+def archive(runs=50):
+    # listings before and after `flask archive run` has moved the older half of the posts out of the
+    # hot table: the explore page, the profile of a quiet user (a few posts, all recent, so every view
+    # of it used to look through each monthly table too) and the older posts of the most prolific user
+    total = db.session.scalar(sa.select(sa.func.count()).select_from(Post))
+    cutoff = db.session.scalar(sa.select(Post.timestamp).order_by(Post.timestamp).offset(total // 2).limit(1))
+    per_page = current_app.config['POSTS_PER_PAGE']
+    quiet_id = db.session.scalar(
+        sa.select(Post.user_id).group_by(Post.user_id)
+        .having(sa.func.min(Post.timestamp) >= cutoff, sa.func.count() <= per_page)
+        .order_by(sa.func.count().desc()).limit(1))
+    prolific_id = db.session.scalar(sa.select(User.id).order_by(User.post_count.desc()).limit(1))
+
+    def profile(user_id, cursor=None):
+        user = db.session.get(User, user_id)
+        return paginate(sa.select(Post).where(Post.user_id == user_id), cursor, archived=user_archive(user))
+
+    def measure(mode):
+        return {f'archive_{mode}_explore_first_page': _metric(_median_ms(lambda: paginate(sa.select(Post)), runs), 'ms'),
+                f'archive_{mode}_profile_quiet_user': _metric(_median_ms(lambda: profile(quiet_id), runs), 'ms'),
+                f'archive_{mode}_profile_prolific_older': _metric(_median_ms(
+                    lambda: profile(prolific_id, (cutoff, 0)), runs), 'ms')}
+
+    results = measure('off')
+    started = time.perf_counter()
+    moved = archive_posts(cutoff, current_app.config['ARCHIVE_BATCH_SIZE'], echo=lambda message: None)
+    results['archive_run_posts_per_s'] = _metric(moved / (time.perf_counter() - started), 'posts/s', 'higher')
+    results.update(measure('on'))
+    return results
+
+
+def run_all(client, echo=print):
+    results = {}
+    for name, function in (('rate limiter', rate_limiter), ('sqlite concurrency', sqlite_concurrency),
+                           ('search', search), ('feeds', feeds),
+                           ('identity cache / names', identity_and_names), ('templates', templates),
+                           ('login burst', login_burst),
+                           ('export', lambda: export(client)),
+                           ('export memory', lambda: export_memory(client)), ('ingest', ingest),
+                           ('archive', archive)):
+        # archive last: it moves half of the posts out of the post table
+        echo(f'micro: {name}')
+        results.update(function())
+        db.session.rollback()
+    return results
@@ -0,0 +1,63 @@
+# Printing, saving and comparing benchmark results.
+# A result file is JSON: {"meta": {...}, "phases": {"client": {"routes": {...}, "total_rps": ...},
+# "wsgi": {...}}, "micro": {...}}. Save one as a baseline with --save, and later runs given
+# --baseline fail (exit status 1) when any route's p95 latency, or any component metric, got worse by
+# more than --threshold (a fraction; 0.25 = 25%). Differences smaller than MIN_DELTA_MS are ignored so
+# sub-millisecond routes don't fail on timer noise.
+import json
+import os
+
+MIN_DELTA_MS = 1.0
+
+
+def print_phase(name, phase, echo=print):
+    echo(f'\n{name}: {phase["total_rps"]:.1f} requests/s overall')
+    echo(f'{"route":<20}{"count":>7}{"errors":>7}{"req/s":>9}{"p50 ms":>10}{"p95 ms":>10}{"p99 ms":>10}')
+    for route, stats in phase['routes'].items():
+        echo(f'{route:<20}{stats["count"]:>7}{stats["errors"]:>7}{stats["rps"]:>9.1f}'
+             f'{stats["p50_ms"]:>10.2f}{stats["p95_ms"]:>10.2f}{stats["p99_ms"]:>10.2f}')
+
+
+def print_micro(micro, echo=print):
+    echo('\ncomponents:')
+    for name, metric in micro.items():
+        echo(f'  {name:<32}{metric["value"]:>12.2f} {metric["unit"]}')
+
+
+def save(results, path):
+    directory = os.path.dirname(path)
+    if directory:
+        os.makedirs(directory, exist_ok=True)
+    with open(path, 'w') as f:
+        json.dump(results, f, indent=2, sort_keys=True)
+
+
+def load(path):
+    with open(path) as f:
+        return json.load(f)
+
+
+def _worse(old, new, better, threshold, min_delta=0.0):
+    if better == 'higher':
+        return new < old * (1 - threshold)
+    return new > old * (1 + threshold) and new - old > min_delta
+
+
+def regressions(baseline, results, threshold):
+    # a list of human-readable descriptions of everything that got worse than the baseline allows
+    found = []
+    for phase_name, phase in results.get('phases', {}).items():
+        old_phase = baseline.get('phases', {}).get(phase_name)
+        if old_phase is None:
+            continue
+        for route, stats in phase['routes'].items():
+            old = old_phase['routes'].get(route)
+            if old and _worse(old['p95_ms'], stats['p95_ms'], 'lower', threshold, MIN_DELTA_MS):
+                found.append(f'{phase_name} {route}: p95 {old["p95_ms"]:.2f} -> {stats["p95_ms"]:.2f} ms')
+            if stats['errors'] > (old['errors'] if old else 0):
+                found.append(f'{phase_name} {route}: {stats["errors"]} errors')
+    for name, metric in results.get('micro', {}).items():
+        old = baseline.get('micro', {}).get(name)
+        if old and _worse(old['value'], metric['value'], metric['better'], threshold):
+            found.append(f'{name}: {old["value"]:.2f} -> {metric["value"]:.2f} {metric["unit"]}')
+    return found
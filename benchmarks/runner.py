@@ -0,0 +1,137 @@
+# The benchmark phases.
+# Each phase runs in a fresh process (see __main__.py) on a fresh copy of the generated dataset: the
+# extensions are module-level objects with their own worker threads and in-memory caches (identity
+# cache, fragment cache, Bloom filter, ingestion queue), so reusing a process would let one phase
+# warm or dirty the caches of the next, and posts written by one phase would change the next one's
+# pages.
+# Everything a phase writes - database, search index, avatar and fragment caches - lives in the work
+# directory, never in the app's own files.
+import os
+import shutil
+import sqlite3
+import threading
+import time
+
+from config import Config
+
+from benchmarks.dataset import generate, spec_key
+from benchmarks.traffic import TestClientSession, HTTPSession, replay
+
+# the files of a dataset that are copied from the template before each phase
+DATASET_FILES = ('app.db', 'search.db')
+
+
+def bench_config(workdir):
+    class BenchConfig(Config):
+        TESTING = True
+        PROPAGATE_EXCEPTIONS = False
+        # a view that raises is counted as a 500, like in production, instead of stopping the run
+        WTF_CSRF_ENABLED = False
+        RATELIMIT_ENABLED = False
+        # the virtual users all come from one address and would be throttled
+        SQLALCHEMY_DATABASE_URI = 'sqlite:///' + os.path.join(workdir, 'app.db')
+        SQLALCHEMY_BINDS = {}
+        SEARCH_INDEX_PATH = os.path.join(workdir, 'search.db')
+        FRAGMENT_CACHE_PATH = os.path.join(workdir, 'fragment_cache.db')
+        TEMPLATE_CACHE_DIR = os.path.join(workdir, 'template_cache')
+        AVATAR_CACHE_DIR = os.path.join(workdir, 'avatar_cache')
+        RATELIMIT_STORAGE_PATH = os.path.join(workdir, 'ratelimit.db')
+        SESSION_STORE_PATH = os.path.join(workdir, 'sessions.db')
+    return BenchConfig
+
+
+def _remove(path):
+    for suffix in ('', '-wal', '-shm'):
+        if os.path.exists(path + suffix):
+            os.remove(path + suffix)
+
+
+def _copy_database(source, target):
+    # the backup API copies a consistent snapshot, including whatever is still in the WAL
+    _remove(target)
+    src, dst = sqlite3.connect(source), sqlite3.connect(target)
+    src.backup(dst)
+    src.close()
+    dst.close()
+
+
+def _template(spec, workdir):
+    return os.path.join(workdir, 'datasets', spec_key(spec))
+
+
+def prepare(spec, workdir, echo=print):
+    # generates the dataset once per set of parameters and keeps it as a template; returns False when
+    # a cached one was found
+    template = _template(spec, workdir)
+    if os.path.exists(os.path.join(template, 'app.db')):
+        return False
+    from app import create_app, db
+    scratch = os.path.join(workdir, 'generate')
+    shutil.rmtree(scratch, ignore_errors=True)
+    os.makedirs(scratch)
+    app = create_app(bench_config(scratch))
+    with app.app_context():
+        db.create_all()
+        started = time.perf_counter()
+        generate(spec, echo)
+        echo(f'generated in {time.perf_counter() - started:.1f}s')
+        db.session.remove()
+        db.engine.dispose()
+    os.makedirs(template, exist_ok=True)
+    for name in DATASET_FILES:
+        _copy_database(os.path.join(scratch, name), os.path.join(template, name))
+    shutil.rmtree(scratch)
+    return True
+
+
+def fresh_app(spec, workdir):
+    live = os.path.join(workdir, 'live')
+    shutil.rmtree(live, ignore_errors=True)
+    os.makedirs(live)
+    for name in DATASET_FILES:
+        _copy_database(os.path.join(_template(spec, workdir), name), os.path.join(live, name))
+    from app import create_app
+    return create_app(bench_config(live))
+
+
+def run_client(spec, workdir, requests, concurrency, warmup):
+    app = fresh_app(spec, workdir)
+    stats, rps = replay(lambda: TestClientSession(app), spec.users, spec.skew, spec.seed,
+                        requests, concurrency, warmup)
+    return {'routes': stats, 'total_rps': rps}
+
+
+def run_wsgi(spec, workdir, requests, concurrency, warmup):
+    # a threaded werkzeug server on a free port of this machine, in a thread of this process
+    import logging
+    from werkzeug.serving import make_server
+    app = fresh_app(spec, workdir)
+    logging.getLogger('werkzeug').setLevel(logging.ERROR)
+    # one access log line per request would be most of the work
+    server = make_server('127.0.0.1', 0, app, threaded=True)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    try:
+        url = f'http://127.0.0.1:{server.server_port}'
+        stats, rps = replay(lambda: HTTPSession(url), spec.users, spec.skew, spec.seed,
+                            requests, concurrency, warmup)
+    finally:
+        server.shutdown()
+    return {'routes': stats, 'total_rps': rps}
+
+
+def run_url(spec, url, requests, concurrency, warmup):
+    # an already running server; it must be serving a database generated with the same parameters
+    stats, rps = replay(lambda: HTTPSession(url), spec.users, spec.skew, spec.seed,
+                        requests, concurrency, warmup)
+    return {'routes': stats, 'total_rps': rps}
+
+
+def run_micro(spec, workdir):
+    from benchmarks.micro import run_all
+    from benchmarks.startup import measure
+    app = fresh_app(spec, workdir)
+    with app.app_context():
+        results = run_all(app.test_client(), echo=lambda message: None)
+    results.update(measure(os.path.join(workdir, 'live')))
+    return results
@@ -0,0 +1,43 @@
+# Cold start: how long a brand-new process takes to import the app package, build the app with
+# create_app() and serve its first request - what every `flask` command, every test run and every
+# gunicorn worker without preload_app pays. Each run is a fresh interpreter, so nothing is imported or
+# compiled in memory yet (the template bytecode cache on disk does count, as it would in production).
+# BUDGET_MS is checked by tests/test_startup.py.
+import json
+import os
+import statistics
+import subprocess
+import sys
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+BUDGET_MS = {'startup_import': 1500, 'startup_create_app': 1000, 'startup_first_request': 500}
+# generous on purpose: a slow CI machine must not fail it, an eager import of everything again should
+
+SCRIPT = '''
+import json, sys, time
+started = time.perf_counter()
+import app
+imported = time.perf_counter()
+from benchmarks.runner import bench_config
+application = app.create_app(bench_config(sys.argv[1]))
+created = time.perf_counter()
+application.test_client().get('/login')
+served = time.perf_counter()
+print(json.dumps({'import': imported - started, 'create_app': created - imported,
+                  'first_request': served - created}))
+'''
+
+
+def _run(workdir):
+    output = subprocess.run([sys.executable, '-c', SCRIPT, workdir], cwd=ROOT, check=True,
+                            capture_output=True, text=True).stdout
+    return json.loads(output.splitlines()[-1])
+
+
+def measure(workdir, runs=5):
+    # median milliseconds of each step over `runs` new processes
+    from benchmarks.micro import _metric
+    timings = [_run(workdir) for _ in range(runs)]
+    return {f'startup_{step}': _metric(statistics.median(run[step] for run in timings) * 1000, 'ms')
+            for step in ('import', 'create_app', 'first_request')}
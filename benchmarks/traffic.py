@@ -0,0 +1,221 @@
+# Mixed traffic replay.
+# A number of virtual users run at the same time, each in its own thread with its own cookies: it logs
+# in as one of the generated users, then sends requests picked at random according to the MIX weights
+# (its own random.Random, seeded from the run's seed and its number, so a run is repeatable). Every
+# request is timed from sending it to having read the whole response body; redirects are not
+# followed, so each number belongs to exactly one route.
+# Two ways of sending the requests:
+# - TestClientSession calls the app in-process through Flask's test client (no network, no server:
+#   this is the app's own cost)
+# - HTTPSession talks HTTP/1.1 with keep-alive to a real server: a threaded werkzeug server started
+#   on a free local port, or any URL given with --url (e.g. gunicorn serving the same database)
+import http.client
+import random
+import threading
+import time
+from http.cookies import SimpleCookie
+from urllib.parse import urlencode, urlsplit
+
+from app.avatars import email_digest
+
+from benchmarks.dataset import PASSWORD, WORDS, username, email, sentence, _zipf_picker
+
+# route name: relative weight in the traffic mix
+MIX = {
+    'index': 25, 'explore': 10, 'user': 20, 'edit_profile': 4, 'edit_profile_save': 2, 'post': 5,
+    'follow': 3, 'search': 5, 'avatar': 8, 'api_feed': 5, 'api_user_posts': 5, 'login': 3,
+    'username_available': 5,
+}
+
+# statuses that count as a normal answer; anything else is an error
+OK_STATUSES = {200, 302, 304}
+
+
+class TestClientSession:
+    def __init__(self, app):
+        self.client = app.test_client()
+
+    def request(self, method, path, data=None):
+        response = self.client.open(path, method=method, data=data)
+        response.get_data()
+        response.close()
+        return response.status_code
+
+
+class HTTPSession:
+    def __init__(self, base_url):
+        parts = urlsplit(base_url)
+        self.host, self.port = parts.hostname, parts.port or 80
+        self.prefix = parts.path.rstrip('/')
+        self.cookies = {}
+        self.connection = None
+
+    def request(self, method, path, data=None):
+        body = urlencode(data) if data is not None else None
+        headers = {'Accept-Encoding': 'gzip'}
+        if body is not None:
+            headers['Content-Type'] = 'application/x-www-form-urlencoded'
+        if self.cookies:
+            headers['Cookie'] = '; '.join(f'{name}={value}' for name, value in self.cookies.items())
+        for attempt in (1, 2):
+            # a server may close an idle keep-alive connection; then reconnect once
+            if self.connection is None:
+                self.connection = http.client.HTTPConnection(self.host, self.port, timeout=60)
+            try:
+                self.connection.request(method, self.prefix + path, body=body, headers=headers)
+                response = self.connection.getresponse()
+                response.read()
+                break
+            except (http.client.HTTPException, ConnectionError):
+                self.connection.close()
+                self.connection = None
+                if attempt == 2:
+                    raise
+        for header in response.headers.get_all('Set-Cookie') or ():
+            for name, morsel in SimpleCookie(header).items():
+                if morsel['expires'] and morsel.value == '':
+                    self.cookies.pop(name, None)
+                else:
+                    self.cookies[name] = morsel.value
+        if response.will_close:
+            self.connection.close()
+            self.connection = None
+        return response.status
+
+
+class VirtualUser:
+    # the per-user state the actions need, and the actions themselves; each returns
+    # (route name, method, path, form data)
+    def __init__(self, number, users, skew, seed):
+        self.rng = random.Random(seed * 1000003 + number)
+        self.users = users
+        self.pick_user = _zipf_picker(self.rng, users, skew)
+        # profiles of popular users are viewed more often, like their posts are read more often
+        self.me = self.rng.randint(1, users)
+        self.followed = set()
+
+    def login(self):
+        return 'login', 'POST', '/login', {'username': username(self.me), 'password': PASSWORD}
+
+    def index(self):
+        return 'index', 'GET', '/index', None
+
+    def explore(self):
+        return 'explore', 'GET', '/explore', None
+
+    def user(self):
+        return 'user', 'GET', f'/user/{username(self.pick_user())}', None
+
+    def edit_profile(self):
+        return 'edit_profile', 'GET', '/edit_profile', None
+
+    def edit_profile_save(self):
+        return 'edit_profile_save', 'POST', '/edit_profile', {'username': username(self.me),
+                                                               'about_me': sentence(self.rng, 6)}
+
+    def post(self):
+        return 'post', 'POST', '/index', {'post': sentence(self.rng, self.rng.randint(3, 14))[:140]}
+
+    def follow(self):
+        # alternates following and unfollowing popular users, so the follow graph stays about the same
+        other = self.pick_user()
+        if other == self.me:
+            other = self.me % self.users + 1
+        if other in self.followed:
+            self.followed.discard(other)
+            return 'follow', 'POST', f'/unfollow/{username(other)}', {}
+        self.followed.add(other)
+        return 'follow', 'POST', f'/follow/{username(other)}', {}
+
+    def search(self):
+        return 'search', 'GET', f'/search?q={self.rng.choice(WORDS)}', None
+
+    def avatar(self):
+        size = self.rng.choice((36, 128))
+        return 'avatar', 'GET', f'/avatar/{email_digest(email(self.pick_user()))}/{size}.png', None
+
+    def api_feed(self):
+        return 'api_feed', 'GET', '/api/v1/feed?limit=50', None
+
+    def api_user_posts(self):
+        return 'api_user_posts', 'GET', f'/api/v1/users/{username(self.pick_user())}/posts?limit=50', None
+
+    def username_available(self):
+        name = username(self.rng.randint(1, 2 * self.users))
+        # half of these are taken, half are free
+        return 'username_available', 'GET', f'/username_available?username={name}', None
+
+
+def _percentile(ordered, fraction):
+    # nearest-rank percentile of an already sorted list
+    if not ordered:
+        return None
+    return ordered[min(len(ordered) - 1, max(0, round(fraction * len(ordered)) - 1))]
+
+
+def summarize(samples, elapsed):
+    # samples: {route: [(seconds, status), ...]} -> {route: stats}, latencies in milliseconds
+    routes = {}
+    for route, timings in sorted(samples.items()):
+        ordered = sorted(seconds for seconds, _ in timings)
+        routes[route] = {
+            'count': len(timings),
+            'errors': sum(1 for _, status in timings if status not in OK_STATUSES),
+            'rps': len(timings) / elapsed if elapsed else 0.0,
+            'mean_ms': 1000 * sum(ordered) / len(ordered),
+            'p50_ms': 1000 * _percentile(ordered, 0.50),
+            'p95_ms': 1000 * _percentile(ordered, 0.95),
+            'p99_ms': 1000 * _percentile(ordered, 0.99),
+        }
+    return routes
+
+
+def replay(new_session, users, skew, seed, requests, concurrency, warmup, mix=None):
+    # sends `requests` timed requests (plus `warmup` untimed ones) from `concurrency` virtual users and
+    # returns (per-route stats, total requests per second)
+    mix = mix or MIX
+    routes, weights = list(mix), list(mix.values())
+    samples = {}
+    lock = threading.Lock()
+    errors = []
+
+    def run(number, count, warm):
+        try:
+            session = new_session()
+            user = VirtualUser(number, users, skew, seed)
+            session.request(*user.login()[1:])
+            local = {}
+            for i in range(warm + count):
+                if i == warm:
+                    with lock:
+                        window[0] = min(window[0], time.perf_counter())
+                route = user.rng.choices(routes, weights)[0]
+                if route == 'login':
+                    session.request('GET', '/logout')
+                name, method, path, data = getattr(user, route)()
+                started = time.perf_counter()
+                status = session.request(method, path, data)
+                seconds = time.perf_counter() - started
+                if i >= warm:
+                    local.setdefault(name, []).append((seconds, status))
+            with lock:
+                window[1] = max(window[1], time.perf_counter())
+                for name, timings in local.items():
+                    samples.setdefault(name, []).extend(timings)
+        except Exception as error:
+            errors.append(error)
+
+    window = [float('inf'), 0.0]
+    # from the first timed request of any virtual user to the last one finishing (warm-up excluded)
+    threads = [threading.Thread(target=run, args=(number, requests // concurrency + (number < requests % concurrency),
+                                                  warmup // concurrency), daemon=True)
+               for number in range(concurrency)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    elapsed = window[1] - window[0]
+    if errors:
+        raise errors[0]
+    stats = summarize(samples, elapsed)
+    return stats, sum(route['count'] for route in stats.values()) / elapsed
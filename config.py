@@ -20,12 +20,112 @@ class Config:
     # A URI (Uniform Resource Identifier) is like the address of your database. It tells Flask-SQLAlchemy where to find your database and how to connect to it.
 
     # The Flask-SQLAlchemy extension takes the location of the application's database from the SQLALCHEMY_DATABASE_URI configuration variable. As you recall from Chapter 3, it is in general a good practice to set configuration from environment variables, and provide a fallback value when the environment does not define the variable. In this case I'm taking the database URL from the DATABASE_URL environment variable, and if that isn't defined, I'm configuring a database named app.db located in the main directory of the application, which is stored in the basedir variable.
+    SQLALCHEMY_ENGINE_OPTIONS = {}
+    # anything set here wins over the defaults worked out in app/engine.py
+    DB_POOL_SIZE = int(os.environ.get('DB_POOL_SIZE') or 10)
+    DB_MAX_OVERFLOW = int(os.environ.get('DB_MAX_OVERFLOW') or 20)
+    DB_POOL_RECYCLE = int(os.environ.get('DB_POOL_RECYCLE') or 1800)
+    # connection pool for server databases (PostgreSQL, MySQL): connections kept open, extra ones allowed under load, and seconds before a connection is replaced
+    SQLITE_JOURNAL_MODE = os.environ.get('SQLITE_JOURNAL_MODE') or 'WAL'
+    SQLITE_SYNCHRONOUS = os.environ.get('SQLITE_SYNCHRONOUS') or 'NORMAL'
+    SQLITE_BUSY_TIMEOUT = int(os.environ.get('SQLITE_BUSY_TIMEOUT') or 5000)
+    SQLITE_MMAP_SIZE = int(os.environ.get('SQLITE_MMAP_SIZE') or 256 * 1024 * 1024)
+    # pragmas applied to every SQLite connection; the busy timeout is in milliseconds and the mmap size in bytes (see app/engine.py)
+    SLOW_QUERY_THRESHOLD = float(os.environ.get('SLOW_QUERY_THRESHOLD') or 0.25)
+    SQL_SLOWEST_KEPT = 5
+    SQL_DEBUG_HEADERS = os.environ.get('SQL_DEBUG_HEADERS') is not None
+    # statements slower than this many seconds are logged as warnings; SQL_DEBUG_HEADERS adds X-DB-Queries / X-DB-Time / X-DB-Slowest to responses (see app/instrumentation.py)
+    SLOW_RENDER_THRESHOLD = float(os.environ.get('SLOW_RENDER_THRESHOLD') or 0.1)
+    TEMPLATE_DEBUG_HEADERS = os.environ.get('TEMPLATE_DEBUG_HEADERS') is not None
+    # template renders slower than this many seconds are logged as warnings; TEMPLATE_DEBUG_HEADERS adds X-Render-Time / X-Render-Templates to responses (see app/instrumentation.py)
     MAIL_SERVER = os.environ.get('MAIL_SERVER')
     MAIL_PORT = int(os.environ.get('MAIL_PORT') or 25)
     MAIL_USE_TLS = os.environ.get('MAIL_USE_TLS') is not None
     MAIL_USERNAME = os.environ.get('MAIL_USERNAME')
     MAIL_PASSWORD = os.environ.get('MAIL_PASSWORD')
     ADMINS = ['suraj2005jan@gmail.com']
+    LOG_MAIL_DIGEST_INTERVAL = float(os.environ.get('LOG_MAIL_DIGEST_INTERVAL') or 300)
+    LOG_MAIL_MAX_ERRORS = int(os.environ.get('LOG_MAIL_MAX_ERRORS') or 20)
+    # error emails are grouped into one digest at most every this many seconds, listing at most this many different errors (see app/log_pipeline.py)
+    POSTS_PER_PAGE = int(os.environ.get('POSTS_PER_PAGE') or 25)
+    # how many posts the index and profile pages show before the "Older posts" link (see app/feed.py)
+    TIMELINE_CELEBRITY_THRESHOLD = int(os.environ.get('TIMELINE_CELEBRITY_THRESHOLD') or 10000)
+    # authors with more followers than this are not fanned out on write; their posts are merged into home timelines when read (see app/timeline.py)
+    TIMELINE_FANOUT_BATCH = int(os.environ.get('TIMELINE_FANOUT_BATCH') or 1000)
+    # how many timeline rows are inserted per statement when a post is fanned out
+    TIMELINE_BACKFILL = int(os.environ.get('TIMELINE_BACKFILL') or 200)
+    # how many recent posts are copied into your timeline when you follow someone
+    PRESENCE_FLUSH_INTERVAL = float(os.environ.get('PRESENCE_FLUSH_INTERVAL') or 60)
+    # seconds between the batched last_seen writes (see app/presence.py); a user's "Last seen" can lag by up to this much
+    PASSWORD_HASH_ALGORITHM = os.environ.get('PASSWORD_HASH_ALGORITHM') or 'pbkdf2:sha256'
+    PASSWORD_HASH_COST = os.environ.get('PASSWORD_HASH_COST', '1000000')
+    # iterations for pbkdf2 ('n:r:p' for scrypt). Changing either one re-hashes each user's password the next time they log in.
+    PASSWORD_VERIFY_WORKERS = int(os.environ.get('PASSWORD_VERIFY_WORKERS') or 2)
+    PASSWORD_VERIFY_QUEUE = int(os.environ.get('PASSWORD_VERIFY_QUEUE') or 8)
+    PASSWORD_VERIFY_TIMEOUT = float(os.environ.get('PASSWORD_VERIFY_TIMEOUT') or 5)
+    # at most WORKERS password checks run at once and QUEUE more may wait, for up to TIMEOUT seconds; WORKERS = 0 checks them on the request threads with no limit (see app/passwords.py)
+    AVATAR_SIZES = (36, 70, 128, 256)
+    AVATAR_MEMORY_CACHE = int(os.environ.get('AVATAR_MEMORY_CACHE') or 1024)
+    AVATAR_CACHE_DIR = os.environ.get('AVATAR_CACHE_DIR') or os.path.join(basedir, 'avatar_cache')
+    # identicons are only drawn in these sizes and kept in an in-memory LRU of this many images plus this folder (see app/avatars.py)
+    FRAGMENT_CACHE_BACKEND = os.environ.get('FRAGMENT_CACHE_BACKEND') or 'memory'
+    FRAGMENT_CACHE_MAX_BYTES = int(os.environ.get('FRAGMENT_CACHE_MAX_BYTES') or 16 * 1024 * 1024)
+    FRAGMENT_CACHE_PATH = os.environ.get('FRAGMENT_CACHE_PATH') or os.path.join(basedir, 'fragment_cache.db')
+    FRAGMENT_CACHE_STATS_EVERY = int(os.environ.get('FRAGMENT_CACHE_STATS_EVERY') or 10000)
+    # rendered post cache: 'memory' (per worker) or 'sqlite' (a file shared by all workers), its size budget, and how often the hit ratio is logged (see app/fragments.py)
+    TEMPLATE_CACHE_DIR = os.environ.get('TEMPLATE_CACHE_DIR', os.path.join(basedir, 'template_cache'))
+    # compiled templates shared by every worker and kept across restarts; fill it at deploy time with `flask templates compile`, or set it to an empty string to compile in memory only (see app/templating.py)
+    IMPORT_BATCH_SIZE = int(os.environ.get('IMPORT_BATCH_SIZE') or 5000)
+    # rows per INSERT for the `flask import` command (see app/importer.py)
+    SEARCH_BACKEND = os.environ.get('SEARCH_BACKEND') or 'fts5'
+    SEARCH_INDEX_PATH = os.environ.get('SEARCH_INDEX_PATH') or os.path.join(basedir, 'search.db')
+    # where post bodies are indexed for /search (see app/search.py)
+    RATELIMIT_ENABLED = os.environ.get('RATELIMIT_DISABLED') is None
+    RATELIMIT_BACKEND = os.environ.get('RATELIMIT_BACKEND') or 'memory'
+    RATELIMIT_STORAGE_PATH = os.environ.get('RATELIMIT_STORAGE_PATH') or os.path.join(basedir, 'ratelimit.db')
+    RATELIMIT_MAX_KEYS = int(os.environ.get('RATELIMIT_MAX_KEYS') or 100000)
+    RATELIMIT_LOGIN_IP = os.environ.get('RATELIMIT_LOGIN_IP') or '20/minute'
+    RATELIMIT_LOGIN_USERNAME = os.environ.get('RATELIMIT_LOGIN_USERNAME') or '5/minute'
+    RATELIMIT_REGISTER_IP = os.environ.get('RATELIMIT_REGISTER_IP') or '5/hour'
+    # token buckets for login and registration attempts: 'memory' (per worker) or 'sqlite' (shared by all workers on the machine) (see app/ratelimit.py)
+    INGEST_QUEUE_SIZE = int(os.environ.get('INGEST_QUEUE_SIZE') or 10000)
+    INGEST_BATCH_SIZE = int(os.environ.get('INGEST_BATCH_SIZE') or 500)
+    INGEST_MAX_DELAY = float(os.environ.get('INGEST_MAX_DELAY') or 0.002)
+    INGEST_ENQUEUE_TIMEOUT = float(os.environ.get('INGEST_ENQUEUE_TIMEOUT') or 0.1)
+    INGEST_ACK_TIMEOUT = float(os.environ.get('INGEST_ACK_TIMEOUT') or 5)
+    # new posts are committed in groups of up to BATCH_SIZE posts or every MAX_DELAY seconds; at most QUEUE_SIZE may wait (see app/ingest.py)
+    ARCHIVE_AFTER_DAYS = int(os.environ.get('ARCHIVE_AFTER_DAYS') or 365)
+    ARCHIVE_BATCH_SIZE = int(os.environ.get('ARCHIVE_BATCH_SIZE') or 5000)
+    SQLALCHEMY_BINDS = {'archive': os.environ['ARCHIVE_DATABASE_URL']} if os.environ.get('ARCHIVE_DATABASE_URL') else {}
+    # `flask archive run` moves posts older than this many days into monthly archive tables, in the main database unless ARCHIVE_DATABASE_URL points elsewhere (see app/archive.py)
+    IDENTITY_CACHE_TTL = float(os.environ.get('IDENTITY_CACHE_TTL') or 30)
+    IDENTITY_CACHE_SIZE = int(os.environ.get('IDENTITY_CACHE_SIZE') or 10000)
+    # logged-in users are looked up in a per-worker cache of this many users, each kept for this many seconds, instead of the database on every request (see app/identity.py)
+    SESSION_BACKEND = os.environ.get('SESSION_BACKEND')
+    SESSION_STORE_PATH = os.environ.get('SESSION_STORE_PATH') or os.path.join(basedir, 'sessions.db')
+    SESSION_TOUCH_INTERVAL = float(os.environ.get('SESSION_TOUCH_INTERVAL') or 3600)
+    # unset keeps sessions in the signed cookie; 'sqlite' stores them in this file and the cookie only holds an id (see app/sessions.py)
+    API_PAGE_SIZE = int(os.environ.get('API_PAGE_SIZE') or 50)
+    API_MAX_PAGE_SIZE = int(os.environ.get('API_MAX_PAGE_SIZE') or 500)
+    API_EXPORT_BATCH = int(os.environ.get('API_EXPORT_BATCH') or 2000)
+    API_STREAM_CHUNK = int(os.environ.get('API_STREAM_CHUNK') or 16384)
+    API_GZIP_LEVEL = int(os.environ.get('API_GZIP_LEVEL') or 6)
+    API_BROTLI_QUALITY = int(os.environ.get('API_BROTLI_QUALITY') or 4)
+    # /api/v1 page sizes (?limit= default and maximum), rows per query when exporting, bytes per streamed chunk, and compression levels (see app/api.py)
+    NAME_FILTER_CAPACITY = int(os.environ.get('NAME_FILTER_CAPACITY') or 1000000)
+    NAME_FILTER_ERROR_RATE = float(os.environ.get('NAME_FILTER_ERROR_RATE') or 0.01)
+    NAME_FILTER_REFRESH = float(os.environ.get('NAME_FILTER_REFRESH') or 30)
+    # Bloom filter of taken usernames/emails: sized for at least this many users at this false-positive rate, and topped up with other workers' new users every REFRESH seconds (see app/names.py)
+    RATELIMIT_USERNAME_CHECK_IP = os.environ.get('RATELIMIT_USERNAME_CHECK_IP') or '120/minute'
+    # the live "is this username free?" check on the registration page runs on every keystroke, so it gets a looser limit than the forms
+    ASYNC_DATABASE_URL = os.environ.get('ASYNC_DATABASE_URL')
+    ASYNC_WSGI_THREADS = int(os.environ.get('ASYNC_WSGI_THREADS') or 10)
+    # only used when serving through asgi.py: the async engine's URL (by default SQLALCHEMY_DATABASE_URI with its async driver, e.g. sqlite+aiosqlite) and the threads running the regular Flask views (see app/async_api.py)
+    REPLICA_DATABASE_URLS = [url.strip() for url in (os.environ.get('REPLICA_DATABASE_URLS') or '').split(',') if url.strip()]
+    REPLICA_MAX_LAG = float(os.environ.get('REPLICA_MAX_LAG') or 5)
+    REPLICA_CHECK_INTERVAL = float(os.environ.get('REPLICA_CHECK_INTERVAL') or 1)
+    REPLICA_PIN_SECONDS = float(os.environ.get('REPLICA_PIN_SECONDS') or 10)
+    # comma-separated read replica URLs for the read-only views; replicas more than MAX_LAG seconds behind (measured every CHECK_INTERVAL) are skipped, and a user who just wrote something reads from the primary for PIN_SECONDS (keep it above MAX_LAG) (see app/replicas.py)
 # 1. MAIL_SERVER = os.environ.get('MAIL_SERVER')
 # What is MAIL_SERVER?
 # The email server is like the “post office” your app uses to send emails. It’s a service (like Gmail, Outlook, or SendGrid) that handles sending emails over the internet.
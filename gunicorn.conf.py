@@ -0,0 +1,37 @@
+# gunicorn settings: `gunicorn -c gunicorn.conf.py microblog:app`
+# The same file serves the ASGI entry point (asgi.py) with uvicorn workers, which needs the optional
+# packages in requirements-asgi.txt (`pip install -r requirements-asgi.txt`):
+#   gunicorn -c gunicorn.conf.py -k uvicorn.workers.UvicornWorker asgi:application
+import multiprocessing
+import os
+
+bind = os.environ.get('GUNICORN_BIND') or '127.0.0.1:8000'
+workers = int(os.environ.get('GUNICORN_WORKERS') or multiprocessing.cpu_count() * 2 + 1)
+
+preload_app = True
+# The app is imported and built once in the master process, and every worker is forked from it.
+# Workers start faster and share the imported code in copy-on-write memory instead of each one
+# importing everything again.
+
+
+def when_ready(server):
+    # Fill the Bloom filter of taken usernames/emails (see app/names.py) once, here in the master, so
+    # every worker starts with a copy of it instead of each one reading the whole user table.
+    from microblog import app
+    from app import taken_names, template_cache
+    with app.app_context():
+        taken_names.warm()
+    template_cache.preload()
+    # every template loaded (from the bytecode cache when `flask templates compile` ran at deploy time)
+    # before the workers are forked, so none of them compiles or loads one on its first requests
+
+
+def post_fork(server, worker):
+    # Database connections must never be shared between processes. Nothing should have connected in
+    # the master yet, but if something did, drop those connections (without closing them, since they
+    # still belong to the master) so each worker opens its own.
+    from microblog import app
+    from app import db
+    with app.app_context():
+        for engine in db.engines.values():
+            engine.dispose(close=False)
@@ -1,10 +1,117 @@
-from app import app
+from app import create_app
 # When I run export FLASK_APP=microblog.py, it means “Hey Flask, my main app is inside the file called microblog.py. So when I say flask run, use that file to start the web app.”
+import os
+from datetime import datetime, timedelta, timezone
+import click
 import sqlalchemy as sa
 import sqlalchemy.orm as so
-from app import app, db
+from app import db
 from app.models import User, Post
+from app import importer
+from app.counters import reconcile_post_counters
+from app import archive as post_archive
+from app import replicas as read_replicas
+from app import template_cache
+
+app = create_app()
+# the application is built by the factory in app/__init__.py; `flask run`, `flask shell` and gunicorn (microblog:app) all use this object
 
 @app.shell_context_processor
 def make_shell_context():
-    return {'sa': sa, 'so': so, 'db': db, 'User': User, 'Post': Post}
\ No newline at end of file
+    return {'sa': sa, 'so': so, 'db': db, 'User': User, 'Post': Post}
+
+@app.cli.command('import')
+@click.argument('kind', type=click.Choice(['users', 'posts']))
+@click.argument('path', type=click.Path(exists=True, dir_okay=False))
+@click.option('--format', 'fmt', type=click.Choice(['jsonl', 'csv']),
+              help='File format (default: guessed from the file extension).')
+@click.option('--batch-size', type=int, default=lambda: app.config['IMPORT_BATCH_SIZE'],
+              show_default='IMPORT_BATCH_SIZE', help='Rows per INSERT statement / transaction.')
+@click.option('--workers', type=int, default=os.cpu_count(), show_default=True,
+              help='Processes used to hash passwords.')
+def import_data(kind, path, fmt, batch_size, workers):
+    """Bulk-load users or posts from a JSONL or CSV file."""
+    records = importer.read_records(path, fmt)
+    if kind == 'users':
+        importer.import_users(records, batch_size, workers, echo=click.echo)
+    else:
+        importer.import_posts(records, batch_size, echo=click.echo)
+# e.g. flask import users users.jsonl --workers 8, then flask import posts posts.csv --batch-size 20000
+
+@app.cli.group()
+def search():
+    """Full-text search index commands."""
+    pass
+
+@search.command()
+@click.option('--batch-size', type=int, default=lambda: app.config['IMPORT_BATCH_SIZE'],
+              show_default='IMPORT_BATCH_SIZE', help='Posts sent to the index at a time.')
+def reindex(batch_size):
+    """Rebuild the search index from the post table."""
+    click.echo(f'Indexed {Post.reindex(batch_size)} posts.')
+
+@app.cli.group()
+def counters():
+    """Denormalized counter commands."""
+    pass
+
+@counters.command()
+def reconcile():
+    """Recount User.post_count / last_post_at and fix the users that drifted."""
+    click.echo(f'Fixed the post counters of {reconcile_post_counters()} users.')
+
+@app.cli.group()
+def archive():
+    """Post archive commands."""
+    pass
+
+@archive.command()
+@click.option('--days', type=int, default=lambda: app.config['ARCHIVE_AFTER_DAYS'],
+              show_default='ARCHIVE_AFTER_DAYS', help='Archive posts older than this many days.')
+@click.option('--batch-size', type=int, default=lambda: app.config['ARCHIVE_BATCH_SIZE'],
+              show_default='ARCHIVE_BATCH_SIZE', help='Posts moved per transaction.')
+def run(days, batch_size):
+    """Move old posts from the post table into the monthly archive tables."""
+    older_than = datetime.now(timezone.utc) - timedelta(days=days)
+    moved = post_archive.archive_posts(older_than, batch_size, echo=click.echo)
+    click.echo(f'Archived {moved} posts written before {older_than:%Y-%m-%d}.')
+# safe to stop and run again at any time; run it e.g. nightly from cron
+
+@archive.command()
+def status():
+    """Show the archive tables and how many posts each one holds."""
+    with post_archive.engine().connect() as conn:
+        for table in post_archive.tables(refresh=True):
+            count = conn.scalar(sa.select(sa.func.count()).select_from(table))
+            click.echo(f'{table.name}: {count} posts')
+
+@app.cli.group()
+def templates():
+    """Template commands."""
+    pass
+
+@templates.command('compile')
+def compile_templates():
+    """Compile every template into the bytecode cache (TEMPLATE_CACHE_DIR)."""
+    if template_cache.bytecode_cache is None:
+        click.echo('TEMPLATE_CACHE_DIR is empty, there is no cache to fill.')
+        return
+    click.echo(f"Compiled {template_cache.compile()} templates into {app.config['TEMPLATE_CACHE_DIR']}.")
+# run it at deploy time, after the new code is in place and before the workers start (with the same Python version they use)
+
+@app.cli.group()
+def replicas():
+    """Read replica commands."""
+    pass
+
+@replicas.command('status')
+def replica_status():
+    """Show how far behind the primary each read replica is."""
+    if not read_replicas.keys:
+        click.echo('No read replicas configured (REPLICA_DATABASE_URLS).')
+        return
+    limit = app.config['REPLICA_MAX_LAG']
+    for key, lag in read_replicas.check().items():
+        state = 'unreachable or no heartbeat yet' if lag == float('inf') else f'{lag:.1f}s behind'
+        click.echo(f"{key}: {state}{'' if lag <= limit else ', not used'}")
+# touches the heartbeat itself, so a replica only looks up to date once replication has copied that write
@@ -1,6 +1,7 @@
-from app import app, db
+from app import create_app, db
 from app.models import User, Post
 import sqlalchemy as sa
+app = create_app()
 # or Flask and its extensions to have access to the Flask application without having to pass app as an argument into every function, an application context must be created and pushed.
 app.app_context().push()
 u = User(username='john', email='john@example.com')
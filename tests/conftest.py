@@ -0,0 +1,92 @@
+# Shared fixtures: every test gets its own app on a fresh SQLite database in a temporary directory, so
+# nothing touches app.db, search.db or the caches next to the code. Run the suite with
+# `python -m pytest` from the project directory.
+import sqlalchemy as sa
+import pytest
+
+from config import Config
+from app import create_app, db, identity_cache, presence, taken_names
+from app import archive
+from app.models import User
+
+PASSWORD = 'correct horse'
+
+
+def make_config(directory, **overrides):
+    class TestConfig(Config):
+        TESTING = True
+        WTF_CSRF_ENABLED = False
+        RATELIMIT_ENABLED = False
+        SQLALCHEMY_DATABASE_URI = f'sqlite:///{directory}/app.db'
+        SQLALCHEMY_BINDS = {}
+        REPLICA_DATABASE_URLS = []
+        PASSWORD_HASH_COST = '1000'
+        # real logins, without spending a second on each password hash
+        PRESENCE_FLUSH_INTERVAL = 3600
+        # tests call presence.flush() themselves
+        SEARCH_INDEX_PATH = f'{directory}/search.db'
+        FRAGMENT_CACHE_PATH = f'{directory}/fragment_cache.db'
+        TEMPLATE_CACHE_DIR = f'{directory}/template_cache'
+        AVATAR_CACHE_DIR = f'{directory}/avatar_cache'
+        RATELIMIT_STORAGE_PATH = f'{directory}/ratelimit.db'
+        SESSION_STORE_PATH = f'{directory}/sessions.db'
+    for name, value in overrides.items():
+        setattr(TestConfig, name, value)
+    return TestConfig
+
+
+def build_app(config):
+    app = create_app(config)
+    with app.app_context():
+        db.create_all(bind_key=None)
+        # every model lives on the primary; the replica binds another test's app registered on the
+        # shared db object don't exist in this app
+    return app
+
+
+def teardown_app(app):
+    # the extensions are module-level objects shared by every app of the test run: write out (or drop)
+    # what this app's requests left in them, so the next test starts clean
+    with app.app_context():
+        presence.flush()
+        for user_id in db.session.scalars(sa.select(User.id)):
+            identity_cache.invalidate(user_id)
+        db.session.remove()
+        for engine in db.engines.values():
+            engine.dispose()
+    archive._known['names'] = None
+    # the list of archive tables is remembered for a minute; the next test's database has none
+    taken_names._filter = None
+    # and the filter of taken names is rebuilt from the next test's users
+
+
+@pytest.fixture
+def config(tmp_path):
+    return make_config(tmp_path)
+
+
+@pytest.fixture
+def app(config):
+    app = build_app(config)
+    yield app
+    teardown_app(app)
+
+
+@pytest.fixture
+def client(app):
+    return app.test_client()
+
+
+def add_user(username, password=PASSWORD):
+    # inside an app context
+    user = User(username=username, email=f'{username}@example.com')
+    user.set_password(password)
+    db.session.add(user)
+    db.session.commit()
+    return user
+
+
+def login(client, username, password=PASSWORD):
+    response = client.post('/login', data={'username': username, 'password': password})
+    assert response.status_code == 302
+    return response
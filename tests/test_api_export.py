@@ -0,0 +1,23 @@
+import pytest
+
+from benchmarks.micro import export_peak_memory, add_posts_by
+
+from tests.conftest import add_user, login
+
+
+@pytest.fixture
+def config(config):
+    config.API_EXPORT_BATCH = 50
+    return config
+
+
+def test_export_memory_does_not_grow_with_the_number_of_posts(app, client):
+    with app.app_context():
+        add_user('reader')
+        login(client, 'reader')
+        export_peak_memory(client, add_posts_by('warmup', 10).username)
+        # the first export imports and caches things the later ones reuse
+        small = export_peak_memory(client, add_posts_by('small', 500).username)
+        large = export_peak_memory(client, add_posts_by('large', 5000).username)
+    assert large < small * 1.25, (small, large)
+    # ten times the posts, about the same peak: only one batch of rows is held at a time
@@ -0,0 +1,63 @@
+from datetime import datetime, timedelta, timezone
+
+import sqlalchemy as sa
+
+from app import db
+from app.archive import archive_posts
+from app.counters import reconcile_post_counters
+from app.models import User, Post
+
+from tests.conftest import add_user, login
+
+
+def _archive_queries(app):
+    # the statements that read an archive table, as they reach the database
+    statements = []
+
+    def before_execute(conn, cursor, statement, parameters, context, executemany):
+        if 'post_archive_' in statement and statement.startswith('SELECT'):
+            statements.append(statement)
+    with app.app_context():
+        sa.event.listen(db.engine, 'before_cursor_execute', before_execute)
+    return statements
+
+
+def _setup(app):
+    # 'old' has three posts from last year and one from today; 'quiet' only has one from today
+    now = datetime.now(timezone.utc).replace(tzinfo=None)
+    with app.app_context():
+        old, quiet = add_user('old'), add_user('quiet')
+        for days in (400, 430, 460):
+            db.session.add(Post(body=f'{days} days ago', author=old, timestamp=now - timedelta(days=days)))
+        db.session.add(Post(body='today', author=old, timestamp=now))
+        db.session.add(Post(body='only today', author=quiet, timestamp=now))
+        db.session.commit()
+        assert archive_posts(now - timedelta(days=365), 100, echo=lambda message: None) == 3
+        return old.id, quiet.id
+
+
+def test_archive_run_counts_each_authors_archived_posts(app):
+    old_id, quiet_id = _setup(app)
+    with app.app_context():
+        counts = dict(db.session.execute(sa.select(User.id, User.archived_post_count)).all())
+        assert counts == {old_id: 3, quiet_id: 0}
+
+        db.session.execute(sa.update(User).values(archived_post_count=0))
+        db.session.commit()
+        assert reconcile_post_counters() == 1
+        assert db.session.get(User, old_id).archived_post_count == 3
+        # and reconcile puts a wrong count right from the archive tables
+
+
+def test_profiles_only_read_the_archive_when_the_user_has_archived_posts(app, client):
+    _setup(app)
+    login(client, 'quiet')
+    queries = _archive_queries(app)
+
+    response = client.get('/user/quiet')
+    assert response.status_code == 200 and 'only today' in response.get_data(as_text=True)
+    assert queries == []
+
+    response = client.get('/user/old')
+    assert response.status_code == 200 and '460 days ago' in response.get_data(as_text=True)
+    assert queries
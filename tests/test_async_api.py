@@ -0,0 +1,100 @@
+import asyncio
+
+import pytest
+
+from app import async_db, db
+from app.models import User
+from app.timeline import follow, publish
+
+from tests.conftest import add_user, login
+
+pytest.importorskip('a2wsgi')
+pytest.importorskip('aiosqlite')
+# the optional packages from requirements-asgi.txt
+
+USER_AGENT = 'Werkzeug/test'
+
+URLS = ['/api/v1/users/john', '/api/v1/users/john/posts', '/api/v1/users/john/posts?limit=1&fields=id,body',
+        '/api/v1/feed', '/api/v1/feed?limit=2', '/api/v1/users/nobody']
+
+
+@pytest.fixture
+def client(app, client):
+    with app.app_context():
+        susan, john = add_user('susan'), add_user('john')
+        for i in range(3):
+            publish(db.session.get(User, john.id), f'post {i} by john')
+        follow(db.session.get(User, susan.id), db.session.get(User, john.id))
+        db.session.commit()
+    client.environ_base['HTTP_USER_AGENT'] = USER_AGENT
+    login(client, 'susan')
+    return client
+
+
+async def _asgi_get(asgi, url, cookie, user_agent=USER_AGENT):
+    path, _, query = url.partition('?')
+    scope = {'type': 'http', 'method': 'GET', 'path': path, 'query_string': query.encode('latin-1'),
+             'headers': [(b'cookie', f'session={cookie}'.encode('latin-1')),
+                         (b'user-agent', user_agent.encode('latin-1'))],
+             'client': ('127.0.0.1', 50000), 'server': ('localhost', 80), 'http_version': '1.1',
+             'scheme': 'http', 'root_path': ''}
+    messages = []
+
+    async def receive():
+        return {'type': 'http.request', 'body': b'', 'more_body': False}
+
+    async def send(message):
+        messages.append(message)
+    await asgi(scope, receive, send)
+    headers = dict(messages[0]['headers'])
+    return messages[0]['status'], headers[b'content-type'].decode('latin-1'), messages[1]['body']
+
+
+def _asgi_app(app):
+    from app.async_api import AsyncApp
+    asgi = AsyncApp(app)
+    passed_on = []
+
+    async def wsgi(scope, receive, send):
+        passed_on.append(scope['path'])
+        await send({'type': 'http.response.start', 'status': 599, 'headers': [(b'content-type', b'x')]})
+        await send({'type': 'http.response.body', 'body': b''})
+    asgi.wsgi = wsgi
+    # records what the async views hand over to the Flask app instead of answering themselves
+    return asgi, passed_on
+
+
+def _run(scenario):
+    async def run():
+        try:
+            return await scenario()
+        finally:
+            await async_db.dispose()
+            # the engine belongs to this event loop (and this test's database)
+    return asyncio.run(run())
+
+
+def test_async_and_flask_views_answer_the_same(app, client):
+    asgi, passed_on = _asgi_app(app)
+    cookie = client.get_cookie('session').value
+
+    async def scenario():
+        return [await _asgi_get(asgi, url, cookie) for url in URLS]
+    answers = _run(scenario)
+    assert passed_on == []
+    for url, (status, content_type, body) in zip(URLS, answers):
+        response = client.get(url)
+        assert (status, content_type, body) == (response.status_code, response.content_type, response.data), url
+
+
+def test_session_protection_sends_the_request_to_flask(app, client):
+    asgi, passed_on = _asgi_app(app)
+    cookie = client.get_cookie('session').value
+
+    async def scenario():
+        await _asgi_get(asgi, '/api/v1/feed', cookie, user_agent='someone else')
+        await _asgi_get(asgi, '/api/v1/feed', 'not a session')
+    _run(scenario)
+    assert passed_on == ['/api/v1/feed', '/api/v1/feed']
+    # a cookie used from another browser (Flask-Login marks the session as not fresh, which has to be
+    # saved) and a cookie that isn't a session: the Flask views deal with both
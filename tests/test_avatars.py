@@ -0,0 +1,53 @@
+import os
+
+import pytest
+
+from app import avatar_cache
+from app import avatars
+from app.avatars import email_digest
+
+from tests.conftest import add_user
+
+
+@pytest.fixture
+def digest(app):
+    with app.app_context():
+        add_user('susan')
+    avatar_cache._images.clear()
+    # the in-memory LRU is shared by every app of the test run
+    return email_digest('susan@example.com')
+
+
+def _files(app):
+    return sorted(name for _, _, names in os.walk(app.config['AVATAR_CACHE_DIR']) for name in names)
+
+
+def test_a_users_digest_is_drawn_as_a_png(app, client, digest):
+    response = client.get(f'/avatar/{digest}/70.png')
+    assert response.status_code == 200
+    assert response.mimetype == 'image/png'
+    assert response.data.startswith(b'\x89PNG\r\n\x1a\n')
+    assert response.cache_control.max_age == 31536000
+    assert _files(app) == [f'{digest}-70.png']
+
+
+def test_sizes_other_than_the_standard_ones_are_404(app, client, digest):
+    assert client.get(f'/avatar/{digest}/71.png').status_code == 404
+    assert client.get(f'/avatar/{digest}/10000.png').status_code == 404
+    assert _files(app) == []
+
+
+def test_unknown_digests_are_404_and_never_written(app, client, digest):
+    assert client.get(f'/avatar/{"0" * 32}/70.png').status_code == 404
+    assert client.get(f'/avatar/{email_digest("nobody@example.com")}/70.png').status_code == 404
+    assert _files(app) == []
+
+
+def test_the_disk_cache_is_used_once_the_memory_cache_forgets(app, client, digest, monkeypatch):
+    first = client.get(f'/avatar/{digest}/128.png').data
+    avatar_cache._images.clear()
+
+    def render(digest, size):
+        raise AssertionError('drawn again instead of read from AVATAR_CACHE_DIR')
+    monkeypatch.setattr(avatars, 'render_identicon', render)
+    assert client.get(f'/avatar/{digest}/128.png').data == first
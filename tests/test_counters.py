@@ -0,0 +1,58 @@
+from datetime import datetime, timedelta, timezone
+
+import sqlalchemy as sa
+
+from app import db
+from app.archive import archive_posts
+from app.models import User, Post
+
+from tests.conftest import add_user
+
+NOW = datetime.now(timezone.utc).replace(tzinfo=None)
+
+
+def _counters(username):
+    user = db.session.scalar(sa.select(User).where(User.username == username))
+    db.session.refresh(user)
+    return user.post_count, user.last_post_at
+
+
+def _post(author, body, days_ago):
+    post = Post(body=body, author=author, timestamp=NOW - timedelta(days=days_ago))
+    db.session.add(post)
+    return post
+
+
+def test_adding_and_deleting_posts_updates_the_counters(app):
+    with app.app_context():
+        susan = add_user('susan')
+        _post(susan, 'older', 2)
+        newest = _post(susan, 'newest', 1)
+        db.session.commit()
+        assert _counters('susan') == (2, NOW - timedelta(days=1))
+
+        db.session.delete(newest)
+        db.session.commit()
+        # through the after_flush hook, like every ORM delete
+        assert _counters('susan') == (1, NOW - timedelta(days=2))
+
+        db.session.delete(db.session.scalar(sa.select(Post)))
+        db.session.commit()
+        assert _counters('susan') == (0, None)
+
+
+def test_last_post_at_falls_back_to_the_archive(app):
+    with app.app_context():
+        susan, john = add_user('susan'), add_user('john')
+        for days in (400, 430):
+            _post(susan, f'{days} days ago', days)
+        hot = _post(susan, 'today', 0)
+        _post(john, 'john today', 0)
+        db.session.commit()
+        assert archive_posts(NOW - timedelta(days=365), 100, echo=lambda message: None) == 2
+
+        db.session.delete(hot)
+        db.session.commit()
+        assert _counters('susan') == (2, NOW - timedelta(days=400))
+        # the only posts left are archived ones, which still count
+        assert _counters('john') == (1, NOW)
@@ -0,0 +1,45 @@
+import pytest
+
+from app import db
+from app.timeline import follow, publish
+
+from tests.conftest import add_user, login
+
+
+@pytest.fixture
+def config(config):
+    config.SQL_DEBUG_HEADERS = True
+    return config
+
+
+@pytest.fixture
+def client(app, client):
+    # 'reader' follows 30 authors; author0 has 30 posts and everyone else one, so every page below is
+    # full and every post on it has a different author from the one next to it
+    with app.app_context():
+        reader = add_user('reader')
+        authors = [add_user(f'author{i}') for i in range(30)]
+        for author in authors:
+            follow(reader, author)
+        for i in range(30):
+            publish(authors[0], f'post {i} by author0')
+        for author in authors[1:]:
+            publish(author, f'a post by {author.username}')
+        db.session.remove()
+    login(client, 'reader')
+    return client
+
+
+def _queries(app, client, url, per_page):
+    app.config['POSTS_PER_PAGE'] = per_page
+    response = client.get(url)
+    assert response.status_code == 200
+    return int(response.headers['X-DB-Queries'])
+
+
+@pytest.mark.parametrize('url', ['/explore', '/index', '/user/author0'])
+def test_query_count_does_not_grow_with_the_page_size(app, client, url):
+    client.get(url)
+    # the first request also loads things that are cached afterwards (the logged-in user, ...)
+    counts = {per_page: _queries(app, client, url, per_page) for per_page in (3, 10, 25)}
+    assert len(set(counts.values())) == 1, counts
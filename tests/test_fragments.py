@@ -0,0 +1,80 @@
+import pytest
+from jinja2 import ChoiceLoader, DictLoader
+
+from app import db, fragment_cache
+from app.models import Post, User
+from app.timeline import publish
+
+from tests.conftest import add_user, build_app, login, make_config, teardown_app
+
+
+@pytest.fixture(params=['memory', 'sqlite'])
+def config(config, request):
+    config.FRAGMENT_CACHE_BACKEND = request.param
+    return config
+
+
+@pytest.fixture
+def post(app):
+    with app.app_context():
+        return publish(add_user('susan'), 'hello from susan').id
+
+
+def _render(app, post_id):
+    # the post's HTML and whether it came from the cache
+    with app.test_request_context():
+        hits = fragment_cache.hits
+        html = fragment_cache.render_post(db.session.get(Post, post_id))
+        return str(html), fragment_cache.hits > hits
+
+
+def test_a_post_is_rendered_once(app, post):
+    hits, misses = fragment_cache.hits, fragment_cache.misses
+    first, cached = _render(app, post)
+    assert not cached and 'susan says:' in first and 'hello from susan' in first
+    assert _render(app, post) == (first, True)
+    assert (fragment_cache.hits - hits, fragment_cache.misses - misses) == (1, 1)
+
+
+def test_the_counters_add_up_over_page_views(app, client, post):
+    login(client, 'susan')
+    client.get('/user/susan')
+    hits, misses = fragment_cache.hits, fragment_cache.misses
+    client.get('/user/susan')
+    client.get('/index')
+    assert (fragment_cache.hits - hits, fragment_cache.misses - misses) == (2, 0)
+    assert 0 < fragment_cache.hit_ratio() <= 1
+
+
+def test_editing_the_profile_renders_the_authors_posts_again(app, client, post):
+    _render(app, post)
+    login(client, 'susan')
+    client.post('/edit_profile', data={'username': 'susannah', 'about_me': ''})
+    with app.app_context():
+        assert db.session.get(User, 1).profile_version == 1
+    html, cached = _render(app, post)
+    assert not cached and 'susannah says:' in html
+
+
+def test_a_changed_post_template_is_not_served_from_the_cache(tmp_path):
+    config = make_config(tmp_path, FRAGMENT_CACHE_BACKEND='sqlite')
+    # the backend that outlives a restart; the memory one starts empty anyway
+    app = build_app(config)
+    try:
+        with app.app_context():
+            post = publish(add_user('susan'), 'hello from susan').id
+        before, _ = _render(app, post)
+    finally:
+        teardown_app(app)
+
+    redeployed = build_app(config)
+    # the same database and FRAGMENT_CACHE_PATH, and an edited _post.html
+    redeployed.jinja_loader = ChoiceLoader([
+        DictLoader({'_post.html': '<p class="post">{{ post.author.username }}: {{ post.body }}</p>'}),
+        redeployed.jinja_loader])
+    try:
+        html, cached = _render(redeployed, post)
+        assert not cached and html == '<p class="post">susan: hello from susan</p>' != before
+        assert _render(redeployed, post) == (html, True)
+    finally:
+        teardown_app(redeployed)
@@ -0,0 +1,76 @@
+import pytest
+
+from app import db
+from app.models import User
+from app.timeline import publish
+
+from tests.conftest import add_user, login
+
+
+@pytest.fixture
+def users(app):
+    with app.app_context():
+        add_user('susan')
+        add_user('john')
+
+
+def _etag(client, url):
+    response = client.get(url)
+    assert response.status_code == 200
+    return response.headers.get('ETag')
+
+
+def _publish(app, username, body):
+    with app.app_context():
+        publish(db.session.scalar(db.select(User).where(User.username == username)), body)
+
+
+@pytest.mark.parametrize('url', ['/index', '/user/susan'])
+def test_an_unchanged_page_is_answered_with_304(app, client, users, url):
+    login(client, 'susan')
+    etag = _etag(client, url)
+    assert etag
+    response = client.get(url, headers={'If-None-Match': etag})
+    assert response.status_code == 304
+    assert response.data == b''
+    assert response.headers['ETag'] == etag
+
+
+def test_a_new_post_changes_the_etag(app, client, users):
+    login(client, 'susan')
+    before = {url: _etag(client, url) for url in ('/index', '/user/susan')}
+    _publish(app, 'susan', 'something new')
+    for url, etag in before.items():
+        response = client.get(url, headers={'If-None-Match': etag})
+        assert response.status_code == 200 and 'something new' in response.get_data(as_text=True)
+        assert response.headers['ETag'] != etag
+
+
+def test_a_follow_changes_the_etag(app, client, users):
+    login(client, 'susan')
+    before = {url: _etag(client, url) for url in ('/index', '/user/john')}
+    assert client.post('/follow/john').status_code == 302
+    client.get('/index')
+    # shows (and so removes) the "You are following john!" message
+    for url, etag in before.items():
+        assert client.get(url, headers={'If-None-Match': etag}).status_code == 200
+
+
+def test_pages_with_a_flashed_message_are_never_cached(app, client, users):
+    login(client, 'susan')
+    etag = _etag(client, '/index')
+    with client.session_transaction() as session:
+        session['_flashes'] = [('message', 'Your changes have been saved.')]
+    response = client.get('/index', headers={'If-None-Match': etag})
+    assert response.status_code == 200 and 'Your changes have been saved.' in response.get_data(as_text=True)
+    assert 'ETag' not in response.headers
+
+
+def test_each_viewer_gets_their_own_etag(app, client, users):
+    login(client, 'susan')
+    etag = _etag(client, '/user/susan')
+    other = app.test_client()
+    login(other, 'john')
+    response = other.get('/user/susan', headers={'If-None-Match': etag})
+    assert response.status_code == 200
+    assert response.headers['ETag'] != etag
@@ -0,0 +1,75 @@
+import sqlalchemy as sa
+import pytest
+
+from app import db, identity_cache
+from app.models import User, load_user
+
+from tests.conftest import add_user, login
+
+
+@pytest.fixture
+def susan(app):
+    with app.app_context():
+        return add_user('susan').id
+
+
+@pytest.fixture
+def statements(app):
+    # every SQL statement sent to the primary database while the test runs
+    sent = []
+
+    def record(conn, cursor, statement, parameters, context, executemany):
+        sent.append(statement)
+    with app.app_context():
+        engine = db.engine
+    sa.event.listen(engine, 'before_cursor_execute', record)
+    yield sent
+    sa.event.remove(engine, 'before_cursor_execute', record)
+
+
+def test_a_cached_user_is_loaded_without_a_query(app, susan, statements):
+    with app.test_request_context():
+        assert load_user(str(susan)).username == 'susan'
+        assert statements
+        # the first request of the user reads them from the database
+    statements.clear()
+    with app.test_request_context():
+        user = load_user(str(susan))
+        assert (user.id, user.username, user.email) == (susan, 'susan', 'susan@example.com')
+        assert user in db.session
+    assert statements == []
+
+
+def test_the_merged_user_loads_the_rest_in_each_request(app, susan):
+    with app.test_request_context():
+        load_user(str(susan))
+    with app.app_context():
+        db.session.get(User, susan).about_me = 'first'
+        db.session.commit()
+    for about_me in ('first', 'second'):
+        with app.test_request_context():
+            user = load_user(str(susan))
+            assert user.about_me == about_me
+            # not cached, so read from the database instead of raising DetachedInstanceError
+            user.about_me = 'second'
+            db.session.commit()
+        assert sa.inspect(identity_cache.get(susan)).detached
+        # the cached snapshot itself never joins a request's session
+
+
+def test_set_password_drops_the_cached_user(app, susan):
+    with app.test_request_context():
+        load_user(str(susan))
+        assert identity_cache.get(susan) is not None
+        db.session.get(User, susan).set_password('battery staple')
+        assert identity_cache.get(susan) is None
+
+
+def test_edit_profile_drops_the_cached_user(app, client, susan):
+    login(client, 'susan')
+    assert 'value="susan"' in client.get('/edit_profile').get_data(as_text=True)
+    assert identity_cache.get(susan) is not None
+    response = client.post('/edit_profile', data={'username': 'susannah', 'about_me': ''})
+    assert response.status_code == 302
+    assert identity_cache.get(susan) is None
+    assert 'value="susannah"' in client.get('/edit_profile').get_data(as_text=True)
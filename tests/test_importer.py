@@ -0,0 +1,42 @@
+from datetime import datetime
+
+import sqlalchemy as sa
+
+from app import db
+from app.importer import import_posts
+from app.models import User, Post, TimelineEntry
+from app.search import query_index
+
+from tests.conftest import add_user
+
+
+def test_timestamps_are_stored_as_naive_utc(app):
+    with app.app_context():
+        add_user('susan')
+        import_posts([
+            {'username': 'susan', 'body': 'with offset', 'timestamp': '2026-03-01T12:00:00+02:00'},
+            {'username': 'susan', 'body': 'utc', 'timestamp': '2026-03-01T12:00:00+00:00'},
+            {'username': 'susan', 'body': 'naive', 'timestamp': '2026-03-01T12:00:00'},
+        ], batch_size=10, echo=lambda message: None)
+        stamps = dict(db.session.execute(sa.select(Post.body, Post.timestamp)).all())
+    assert stamps == {'with offset': datetime(2026, 3, 1, 10, 0), 'utc': datetime(2026, 3, 1, 12, 0),
+                      'naive': datetime(2026, 3, 1, 12, 0)}
+
+
+def test_only_imported_posts_are_backfilled(app):
+    with app.app_context():
+        susan = add_user('susan')
+        db.session.add(Post(body='written live', author=susan))
+        db.session.commit()
+        live_entries = db.session.scalar(sa.select(sa.func.count()).select_from(TimelineEntry))
+
+        import_posts([{'username': 'susan', 'body': f'imported {i}'} for i in range(5)],
+                     batch_size=2, echo=lambda message: None)
+        imported = db.session.scalars(sa.select(Post.id).where(Post.body.like('imported%'))).all()
+        timeline = db.session.scalars(sa.select(TimelineEntry.post_id).where(
+            TimelineEntry.post_id.in_(imported))).all()
+        assert sorted(timeline) == sorted(imported)
+        assert db.session.scalar(sa.select(sa.func.count()).select_from(TimelineEntry)) == live_entries + 5
+        assert db.session.get(User, susan.id).post_count == 6
+        found, _ = query_index(Post.__tablename__, Post.__searchable__, 'imported', 1, 10)
+        assert sorted(found) == sorted(imported)
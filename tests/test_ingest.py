@@ -0,0 +1,71 @@
+import threading
+
+import pytest
+import sqlalchemy as sa
+
+from app import db
+from app.ingest import PostIngester, IngestFailed
+from app.models import Post
+
+from tests.conftest import add_user, login
+
+
+@pytest.fixture
+def failing_ingester(app, monkeypatch):
+    # a writer of its own (the shared post_ingester's thread belongs to the first app of the test run)
+    # whose inserts always fail, the way a locked or full database makes them fail
+    ingester = PostIngester(app)
+
+    def insert(items):
+        raise sa.exc.OperationalError('INSERT INTO post', {}, Exception('database is locked'))
+    monkeypatch.setattr(ingester, '_insert', insert)
+    monkeypatch.setattr('app.routes.post_ingester', ingester)
+    yield ingester
+    ingester.close()
+
+
+def test_a_post_that_cannot_be_written_raises_ingest_failed(app, failing_ingester):
+    with app.app_context():
+        susan = add_user('susan')
+        with pytest.raises(IngestFailed) as raised:
+            failing_ingester.publish(susan, 'hello')
+    assert isinstance(raised.value.__cause__, sa.exc.OperationalError)
+
+
+def test_the_form_is_shown_again_when_the_post_fails(app, client, failing_ingester):
+    with app.app_context():
+        add_user('susan')
+    login(client, 'susan')
+    response = client.post('/index', data={'post': 'hello'})
+    assert response.status_code == 200
+    page = response.get_data(as_text=True)
+    assert 'could not be saved' in page
+    assert 'hello' in page
+    # the text is still in the form
+    with app.app_context():
+        assert db.session.scalar(sa.select(sa.func.count()).select_from(Post)) == 0
+
+
+def test_a_slow_commit_redirects_with_a_notice(app, client, monkeypatch):
+    app.config['INGEST_ACK_TIMEOUT'] = 0.1
+    release = threading.Event()
+    ingester = PostIngester(app)
+    insert = ingester._insert
+
+    def slow_insert(items):
+        release.wait(5)
+        return insert(items)
+    monkeypatch.setattr(ingester, '_insert', slow_insert)
+    monkeypatch.setattr('app.routes.post_ingester', ingester)
+    with app.app_context():
+        add_user('susan')
+    login(client, 'susan')
+    try:
+        response = client.post('/index', data={'post': 'hello'}, follow_redirects=True)
+        assert 'will appear shortly' in response.get_data(as_text=True)
+        # concurrent.futures.TimeoutError, which before Python 3.11 is not the builtin TimeoutError
+    finally:
+        release.set()
+        ingester.close()
+    with app.app_context():
+        assert db.session.scalar(sa.select(Post.body)) == 'hello'
@@ -0,0 +1,21 @@
+import pytest
+import sqlalchemy as sa
+
+from flask import request_started
+
+from app import db
+from app.instrumentation import query_stats
+
+
+def test_a_failed_statement_does_not_skew_later_timings(app):
+    app.config['SLOW_QUERY_THRESHOLD'] = 0.05
+    with app.test_request_context('/'):
+        request_started.send(app)
+        # what Flask does when a real request starts: a fresh QueryStats in g
+        with db.engine.connect() as conn:
+            with pytest.raises(sa.exc.OperationalError):
+                conn.exec_driver_sql('SELECT * FROM no_such_table')
+            conn.exec_driver_sql('SELECT 1')
+            stats = query_stats()
+            assert stats.count == 1
+            assert stats.total_time < 0.05
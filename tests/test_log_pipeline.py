@@ -0,0 +1,109 @@
+import logging
+import socket
+import threading
+import time
+
+import pytest
+
+from app.log_pipeline import BackgroundQueueHandler, DigestMailHandler
+
+
+class Inbox:
+    # an aiosmtpd handler that keeps every message it receives
+    def __init__(self):
+        self.messages = []
+
+    async def handle_DATA(self, server, session, envelope):
+        self.messages.append(envelope.content.decode('utf-8'))
+        return '250 OK'
+
+
+@pytest.fixture
+def smtp():
+    # a real SMTP server on a free local port (the aiosmtpd package, as suggested in app/log_pipeline.py)
+    Controller = pytest.importorskip('aiosmtpd.controller').Controller
+    with socket.socket() as s:
+        s.bind(('127.0.0.1', 0))
+        port = s.getsockname()[1]
+    inbox = Inbox()
+    controller = Controller(inbox, hostname='127.0.0.1', port=port)
+    controller.start()
+    inbox.address = ('127.0.0.1', port)
+    yield inbox
+    controller.stop()
+
+
+def _logger(handler):
+    logger = logging.getLogger(f'test.{id(handler)}')
+    logger.propagate = False
+    logger.addHandler(handler)
+    return logger
+
+
+def _wait_for(condition, timeout=5):
+    deadline = time.monotonic() + timeout
+    while not condition():
+        if time.monotonic() > deadline:
+            raise AssertionError('timed out')
+        time.sleep(0.01)
+
+
+def _fail(logger, error):
+    try:
+        raise error
+    except Exception:
+        logger.exception('Exception on /index [GET]')
+
+
+def test_identical_errors_are_sent_as_one_rate_limited_digest(smtp):
+    mail = DigestMailHandler(smtp.address, 'no-reply@example.com', ['admin@example.com'],
+                             'Microblog Failure', interval=3600)
+    queue_handler = BackgroundQueueHandler([mail])
+    logger = _logger(queue_handler)
+
+    _fail(logger, KeyError('first'))
+    _wait_for(lambda: len(smtp.messages) == 1)
+    # the first error of a quiet period is reported straight away
+
+    for _ in range(5):
+        _fail(logger, ValueError('same'))
+    _fail(logger, ZeroDivisionError('different'))
+    time.sleep(0.3)
+    assert len(smtp.messages) == 1
+    # the next digest waits for the interval
+
+    queue_handler.stop()
+    # drains the queue and sends what is pending, like the timer does when the interval is over
+    assert len(smtp.messages) == 2
+    digest = smtp.messages[1]
+    assert '6 errors (2 different) since the last report.' in digest
+    assert '=== x5  ValueError at ' in digest
+    assert '=== x1  ZeroDivisionError at ' in digest
+    assert 'Subject: Microblog Failure' in digest
+
+
+def test_logging_does_not_wait_for_the_handlers():
+    release = threading.Event()
+
+    class SlowHandler(logging.Handler):
+        # a mail server or disk that doesn't answer
+        def __init__(self):
+            super().__init__()
+            self.records = []
+
+        def emit(self, record):
+            release.wait(5)
+            self.records.append(record)
+
+    slow = SlowHandler()
+    queue_handler = BackgroundQueueHandler([slow])
+    logger = _logger(queue_handler)
+    started = time.perf_counter()
+    for i in range(20):
+        logger.error('error %d', i)
+    assert time.perf_counter() - started < 0.5
+    assert slow.records == []
+
+    release.set()
+    queue_handler.stop()
+    assert [record.getMessage() for record in slow.records] == [f'error {i}' for i in range(20)]
@@ -0,0 +1,72 @@
+import pytest
+import sqlalchemy as sa
+
+from app import db, taken_names
+from app.models import User
+
+from tests.conftest import add_user, PASSWORD
+
+
+@pytest.fixture
+def config(config):
+    config.NAME_FILTER_REFRESH = 0
+    # every check looks for users added or renamed since the last one
+    return config
+
+
+def _register(client, username, email):
+    return client.post('/register', data={'username': username, 'email': email,
+                                          'password': PASSWORD, 'password2': PASSWORD})
+
+
+def _user_count(app):
+    with app.app_context():
+        return db.session.scalar(sa.select(sa.func.count()).select_from(User))
+
+
+def test_usernames_and_emails_are_case_insensitive(app, client):
+    assert _register(client, 'susan', 'susan@example.com').status_code == 302
+    response = _register(client, 'Susan', 'other@example.com')
+    assert response.status_code == 200 and 'Please use a different username.' in response.get_data(as_text=True)
+    response = _register(client, 'someone', 'SUSAN@Example.com')
+    assert response.status_code == 200 and 'Please enter a differnt email address.' in response.get_data(as_text=True)
+    assert _user_count(app) == 1
+
+
+def test_a_race_lost_to_another_registration_is_a_form_error(app, client, monkeypatch):
+    with app.app_context():
+        add_user('susan')
+    monkeypatch.setattr(taken_names, 'username_taken', lambda *args, **kwargs: False)
+    monkeypatch.setattr(taken_names, 'email_taken', lambda *args, **kwargs: False)
+    # the form's checks ran before the other registration committed
+    response = _register(client, 'SUSAN', 'other@example.com')
+    assert response.status_code == 200 and 'Please use a different username.' in response.get_data(as_text=True)
+    assert _user_count(app) == 1
+    # the unique index on username_key caught it
+
+
+def _available(client, username):
+    return client.get('/username_available', query_string={'username': username}).get_json()['available']
+
+
+def test_username_available(app, client):
+    with app.app_context():
+        add_user('susan')
+    assert _available(client, 'john') is True
+    assert _available(client, 'susan') is False
+    assert _available(client, 'SUSAN') is False
+    assert _available(client, '') is False
+
+
+def test_a_rename_in_another_worker_is_picked_up(app, client):
+    with app.app_context():
+        add_user('susan')
+    assert _available(client, 'susannah') is True
+    # the filter is built now, without 'susannah'
+    with app.app_context():
+        user = db.session.scalar(sa.select(User).where(User.username == 'susan'))
+        user.username = 'Susannah'
+        db.session.commit()
+        # like edit_profile in another process: this process's filter isn't told
+    assert _available(client, 'susannah') is False
+    assert _available(client, 'susan') is True
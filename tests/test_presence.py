@@ -0,0 +1,61 @@
+from datetime import datetime, timezone
+
+import sqlalchemy as sa
+
+from app import db, presence
+from app.models import User
+
+from tests.conftest import add_user, login
+
+
+def _last_seen_updates(app):
+    # the UPDATE statements that write user.last_seen, as they reach the database
+    statements = []
+
+    def before_execute(conn, cursor, statement, parameters, context, executemany):
+        if statement.startswith('UPDATE user') and 'last_seen' in statement:
+            statements.append(parameters)
+    with app.app_context():
+        sa.event.listen(db.engine, 'before_cursor_execute', before_execute)
+    return statements
+
+
+def test_requests_within_one_window_write_last_seen_once(app, client):
+    with app.app_context():
+        user_id = add_user('susan').id
+    login(client, 'susan')
+    presence.flush()
+    updates = _last_seen_updates(app)
+
+    for _ in range(20):
+        assert client.get('/explore').status_code == 200
+    last_request = datetime.now(timezone.utc).replace(tzinfo=None)
+    assert updates == []
+    # nothing is written while the window is open
+
+    assert presence.flush() == 1
+    assert len(updates) == 1
+    assert presence.flush() == 0
+    assert len(updates) == 1
+    # one statement for the whole window, and nothing left for the next one
+
+    with app.app_context():
+        last_seen = db.session.get(User, user_id).last_seen
+    assert abs((last_seen - last_request).total_seconds()) < 1
+
+
+def test_one_statement_covers_every_user_seen_in_the_window(app):
+    with app.app_context():
+        user_ids = [add_user(f'user{i}').id for i in range(5)]
+    updates = _last_seen_updates(app)
+    seen = datetime(2026, 1, 2, 3, 4, 5, tzinfo=timezone.utc)
+    for user_id in user_ids:
+        for offset in range(3):
+            presence.record(user_id, seen.replace(second=offset))
+
+    assert presence.flush() == len(user_ids)
+    assert len(updates) == 1
+    with app.app_context():
+        stored = db.session.scalars(sa.select(User.last_seen).where(User.id.in_(user_ids))).all()
+    assert stored == [seen.replace(second=2, tzinfo=None)] * len(user_ids)
+    # the latest time recorded for each user wins
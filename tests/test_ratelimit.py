@@ -0,0 +1,65 @@
+import time
+from types import SimpleNamespace
+
+import pytest
+
+from app.ratelimit import MemoryBuckets
+
+from tests.conftest import add_user
+
+
+@pytest.fixture(params=['memory', 'sqlite'])
+def config(config, request):
+    config.RATELIMIT_ENABLED = True
+    config.RATELIMIT_BACKEND = request.param
+    config.RATELIMIT_LOGIN_IP = '100/minute'
+    config.RATELIMIT_LOGIN_USERNAME = '2/second'
+    # a burst of two per username, refilled after half a second
+    return config
+
+
+def _login(client, username):
+    return client.post('/login', data={'username': username, 'password': 'wrong'})
+
+
+def test_login_posts_get_429_after_the_burst(app, client):
+    with app.app_context():
+        add_user('susan')
+    assert [_login(client, 'susan').status_code == 429 for _ in range(2)] == [False, False]
+    response = _login(client, 'susan')
+    assert response.status_code == 429
+    assert response.headers['Retry-After'] == '1'
+
+
+def test_showing_the_form_is_not_limited(app, client):
+    for _ in range(10):
+        assert client.get('/login').status_code == 200
+
+
+def test_the_bucket_refills(app, client):
+    for _ in range(2):
+        _login(client, 'susan')
+    assert _login(client, 'susan').status_code == 429
+    time.sleep(0.6)
+    assert _login(client, 'susan').status_code != 429
+
+
+def test_buckets_are_per_username(app, client):
+    for _ in range(3):
+        _login(client, 'susan')
+    assert _login(client, 'SUSAN').status_code == 429
+    # usernames are casefolded, so that's the same bucket
+    assert _login(client, 'john').status_code != 429
+
+
+def test_new_keys_cannot_push_out_a_bucket_that_is_still_refilling():
+    buckets = MemoryBuckets(SimpleNamespace(config={'RATELIMIT_MAX_KEYS': 3}))
+    rate, burst = 1 / 60, 2
+    assert buckets.hit('login:victim', rate, burst) == 0
+    assert buckets.hit('login:victim', rate, burst) == 0
+    assert buckets.hit('login:victim', rate, burst) > 0
+    sprayed = [buckets.hit(f'login:made-up-{i}', rate, burst) for i in range(10)]
+    assert sprayed[:2] == [0, 0] and all(wait > 0 for wait in sprayed[2:])
+    # the table is full: new keys are turned away instead of evicting anyone
+    assert len(buckets) == 3
+    assert buckets.hit('login:victim', rate, burst) > 0
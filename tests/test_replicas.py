@@ -0,0 +1,135 @@
+import sqlite3
+import time
+
+import pytest
+
+from app import db, replicas
+from app.ingest import PostIngester
+from app.models import User
+from app.replicas import PIN_KEY
+from app.timeline import publish
+
+from tests.conftest import add_user, login
+
+
+@pytest.fixture
+def config(config, tmp_path):
+    config.REPLICA_DATABASE_URLS = [f'sqlite:///{tmp_path}/replica.db']
+    config.REPLICA_MAX_LAG = 5
+    config.RATELIMIT_ENABLED = True
+    config.RATELIMIT_LOGIN_USERNAME = '2/minute'
+    return config
+
+
+def _replicate(app, tmp_path):
+    # "replication" is a copy of the whole primary file, taken with SQLite's backup API
+    with app.app_context():
+        db.session.remove()
+        source, target = sqlite3.connect(tmp_path / 'app.db'), sqlite3.connect(tmp_path / 'replica.db')
+        source.backup(target)
+        source.close()
+        target.close()
+        db.engines['replica1'].dispose()
+
+
+REPLICA_ONLY_POST = ("INSERT INTO post (id, body, timestamp, user_id) "
+                     "VALUES (1000, 'only on the replica', '2026-01-01 00:00:00', 1)")
+# an id the primary never uses, or the fragment cache (app/fragments.py) would show one post for the other
+
+
+def _replica_execute(tmp_path, statement, parameters=()):
+    conn = sqlite3.connect(tmp_path / 'replica.db')
+    with conn:
+        conn.execute(statement, parameters)
+    conn.close()
+
+
+@pytest.fixture
+def client(app, client, tmp_path, monkeypatch):
+    # two users and one copy of the primary; afterwards one post only reaches the primary and one only
+    # the replica, so each page shows which database it was read from
+    monkeypatch.setattr(replicas, '_start', lambda: None)
+    # no lag-checking thread: the tests call replicas.check() themselves
+    with app.app_context():
+        susan = add_user('susan')
+        add_user('john')
+        replicas.check()
+        _replicate(app, tmp_path)
+        publish(db.session.get(User, susan.id), 'only on the primary')
+        db.session.remove()
+    _replica_execute(tmp_path, REPLICA_ONLY_POST)
+    with app.app_context():
+        assert replicas.check()['replica1'] < 5
+    login(client, 'susan')
+    with client.session_transaction() as session:
+        assert PIN_KEY not in session
+    # logging in doesn't write anything, so each test starts unpinned
+    return client
+
+
+def _read_from(client):
+    page = client.get('/explore').get_data(as_text=True)
+    return {'primary': 'only on the primary' in page, 'replica': 'only on the replica' in page}
+
+
+def test_read_only_views_read_from_the_replica(client):
+    assert _read_from(client) == {'primary': False, 'replica': True}
+
+
+def test_a_write_pins_the_user_to_the_primary(app, client):
+    response = client.post('/follow/john')
+    assert response.status_code == 302
+    with client.session_transaction() as session:
+        pinned_until = session[PIN_KEY]
+    assert pinned_until == pytest.approx(time.time() + app.config['REPLICA_PIN_SECONDS'], abs=2)
+    assert _read_from(client) == {'primary': True, 'replica': False}
+
+    with client.session_transaction() as session:
+        session[PIN_KEY] = time.time() - 1
+    assert _read_from(client) == {'primary': False, 'replica': True}
+    # once the pin runs out the replica is used again
+
+
+def test_a_lagging_replica_gets_no_reads(app, client, tmp_path):
+    _replica_execute(tmp_path, 'UPDATE replica_heartbeat SET beat = ?', (time.time() - 60,))
+    # replication stopped a minute ago
+    with app.app_context():
+        assert replicas.check()['replica1'] > app.config['REPLICA_MAX_LAG']
+    assert _read_from(client) == {'primary': True, 'replica': False}
+
+    _replicate(app, tmp_path)
+    _replica_execute(tmp_path, REPLICA_ONLY_POST)
+    with app.app_context():
+        assert replicas.check()['replica1'] < app.config['REPLICA_MAX_LAG']
+    assert _read_from(client) == {'primary': True, 'replica': True}
+    # caught up again: reads go back to the replica, which now has the primary's post as well
+
+
+def _pinned(client):
+    with client.session_transaction() as session:
+        return PIN_KEY in session
+
+
+def test_posts_that_write_nothing_do_not_pin(app, client):
+    assert client.post('/index', data={'post': ''}).status_code == 200
+    # the form didn't validate
+    other = app.test_client()
+    for status in (302, 302, 429):
+        assert other.post('/login', data={'username': 'john', 'password': 'wrong'}).status_code == status
+        # back to the form with "Invalid username or password", then rate limited
+        assert not _pinned(other)
+    assert not _pinned(client)
+    assert _read_from(client) == {'primary': False, 'replica': True}
+
+
+def test_a_new_post_pins_the_user_to_the_primary(app, client, monkeypatch):
+    ingester = PostIngester(app)
+    monkeypatch.setattr('app.routes.post_ingester', ingester)
+    # a writer of this app's own (the shared post_ingester's thread belongs to the first app of the run)
+    try:
+        response = client.post('/index', data={'post': 'read your own writes'}, follow_redirects=True)
+    finally:
+        ingester.close()
+    assert 'read your own writes' in response.get_data(as_text=True)
+    # the writer thread committed it, and the redirect read it from the primary
+    assert _pinned(client)
@@ -0,0 +1,84 @@
+import pytest
+
+from app import db
+from app.models import Post, User
+
+from tests.conftest import add_user, login
+
+
+@pytest.fixture
+def posts(app):
+    with app.app_context():
+        susan = add_user('susan')
+        bodies = ['nothing to see here',
+                  'my cat likes to sleep all day long in the sun and then eats dinner',
+                  'cats cats cats',
+                  'the cat sat on the mat']
+        for body in bodies:
+            db.session.add(Post(body=body, author=susan))
+        db.session.commit()
+        # indexed by SearchableMixin's after_flush / after_commit hooks, not by the test
+    return bodies
+
+
+def _search(app, text, page=1, per_page=10):
+    with app.app_context():
+        found, has_next = Post.search(text, page, per_page)
+        return [post.body for post in found], has_next
+
+
+def test_matches_come_back_best_first(app, posts):
+    assert _search(app, 'cat') == (['cats cats cats', 'the cat sat on the mat',
+                                    'my cat likes to sleep all day long in the sun and then eats dinner'], False)
+    # "cats" matches too (porter stemming); more mentions in a shorter post rank higher
+    assert _search(app, 'cat', page=1, per_page=2) == (['cats cats cats', 'the cat sat on the mat'], True)
+    assert _search(app, 'cat sun') == (['my cat likes to sleep all day long in the sun and then eats dinner'],
+                                       False)
+    assert _search(app, 'dog') == ([], False)
+
+
+def test_edits_and_deletes_reach_the_index_on_commit(app, posts):
+    with app.app_context():
+        post = db.session.scalar(db.select(Post).where(Post.body == 'the cat sat on the mat'))
+        post.body = 'the dog sat on the mat'
+        db.session.flush()
+        assert 'the dog sat on the mat' not in _search(app, 'dog')[0]
+        # not before the transaction commits
+        db.session.commit()
+    assert _search(app, 'dog') == (['the dog sat on the mat'], False)
+    assert 'the dog sat on the mat' not in _search(app, 'cat')[0]
+
+    with app.app_context():
+        db.session.delete(db.session.scalar(db.select(Post).where(Post.body == 'cats cats cats')))
+        db.session.commit()
+    assert _search(app, 'cats')[0] == ['my cat likes to sleep all day long in the sun and then eats dinner']
+
+
+def test_a_rollback_leaves_the_index_alone(app, posts):
+    with app.app_context():
+        post = db.session.scalar(db.select(Post).where(Post.body == 'nothing to see here'))
+        post.body = 'a cat after all'
+        db.session.flush()
+        db.session.rollback()
+        db.session.add(Post(body='another cat', author=db.session.get(User, 1)))
+        db.session.commit()
+        # the next commit doesn't pick up what the rolled back flush collected
+    assert _search(app, 'after') == ([], False)
+    assert _search(app, 'nothing') == (['nothing to see here'], False)
+
+
+@pytest.mark.parametrize('text', ['"', 'cat"', '"cat', 'cat AND', 'OR', 'NOT cat', 'NEAR(cat sun)', 'cat*',
+                                  '*', 'body:cat', '-cat', '(cat', '^cat', "cat's", 'cat + sun', '   '])
+def test_quotes_and_operators_are_searched_literally(app, client, posts, text):
+    found, _ = _search(app, text)
+    assert set(found) <= set(posts)
+    login(client, 'susan')
+    assert client.get('/search', query_string={'q': text}).status_code in (200, 302)
+    # 302 back to explore for a blank query
+
+
+def test_operators_are_not_interpreted(app, posts):
+    assert _search(app, 'cat OR nothing') == ([], False)
+    assert _search(app, 'cat*') == _search(app, 'cat')
+    # the * is dropped by the tokenizer; it isn't a prefix search for "category", "catalogue", ...
+    assert _search(app, 'NOT cat') == ([], False)
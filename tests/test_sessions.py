@@ -0,0 +1,54 @@
+import pytest
+
+from tests.conftest import add_user, login
+
+
+@pytest.fixture
+def config(config):
+    config.SESSION_BACKEND = 'sqlite'
+    return config
+
+
+def _sid(client):
+    cookie = client.get_cookie('session')
+    return cookie.value if cookie else None
+
+
+def test_the_session_is_kept_on_the_server(app, client):
+    with app.app_context():
+        add_user('susan')
+    login(client, 'susan')
+    sid = _sid(client)
+    store = app.session_interface.store
+    assert sid and '_user_id' not in sid
+    # the cookie is only an id; the data is in SESSION_STORE_PATH
+    assert store.get(sid) is not None
+
+    assert client.get('/index').status_code == 200
+    # still logged in on the next request
+    with client.session_transaction() as session:
+        assert session['_user_id'] == '1'
+        session['theme'] = 'dark'
+    with client.session_transaction() as session:
+        assert session['theme'] == 'dark'
+    assert _sid(client) == sid
+
+    client.get('/logout')
+    assert '_user_id' not in store.get(sid)[0]
+
+
+def test_logging_in_changes_the_session_id(app, client):
+    with app.app_context():
+        add_user('susan')
+    with client.session_transaction() as session:
+        session['planted'] = True
+    planted = _sid(client)
+    assert planted
+
+    login(client, 'susan')
+    sid = _sid(client)
+    assert sid != planted
+    assert app.session_interface.store.get(planted) is None
+    # the id from before the login no longer opens any session
+    with client.session_transaction() as session:
+        assert session['planted'] and session['_user_id'] == '1'
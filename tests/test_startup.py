@@ -0,0 +1,21 @@
+import subprocess
+import sys
+
+from benchmarks.startup import BUDGET_MS, ROOT, measure
+
+
+def test_importing_the_package_leaves_the_features_unloaded():
+    # `import app` must stay cheap: the feature modules, Alembic and the async driver are only loaded
+    # by create_app() (see app/__init__.py)
+    script = ('import sys, app; print(" ".join(sorted(name for name in sys.modules if name.startswith("app.") '
+              'or name.split(".")[0] in ("flask_migrate", "alembic", "aiosqlite"))))')
+    loaded = subprocess.run([sys.executable, '-c', script], cwd=ROOT, check=True, capture_output=True,
+                            text=True).stdout.split()
+    assert set(loaded) <= {'app.engine', 'app.replicas'}, loaded
+
+
+def test_startup_stays_within_budget(tmp_path):
+    timings = measure(str(tmp_path), runs=3)
+    over = {name: round(timings[name]['value']) for name, budget in BUDGET_MS.items()
+            if timings[name]['value'] > budget}
+    assert not over, f'over the startup budget {BUDGET_MS}: {over}'
@@ -0,0 +1,74 @@
+import os
+import subprocess
+import sys
+
+from jinja2 import ChoiceLoader, FileSystemLoader
+
+from app import template_cache
+
+from tests.conftest import build_app, make_config, teardown_app
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def _bytecode_files(directory):
+    return sorted(name for name in os.listdir(directory) if name.endswith('.cache'))
+
+
+def test_flask_templates_compile_fills_the_cache_dir(tmp_path):
+    directory = tmp_path / 'template_cache'
+    env = dict(os.environ, FLASK_APP='microblog.py', FLASK_DEBUG='1', TEMPLATE_CACHE_DIR=str(directory),
+               DATABASE_URL=f'sqlite:///{tmp_path}/app.db')
+    # debug, so the app doesn't append to logs/microblog.log
+    output = subprocess.run([sys.executable, '-m', 'flask', 'templates', 'compile'], cwd=ROOT, env=env,
+                            check=True, capture_output=True, text=True).stdout
+    assert f'into {directory}.' in output
+    compiled = int(output.split()[1])
+    # "Compiled 17 templates into ..."
+    assert compiled > 5 and len(_bytecode_files(directory)) == compiled
+
+
+def _app(tmp_path):
+    # an app with one extra template, hello.html, whose source the test can change
+    app = build_app(make_config(tmp_path))
+    app.jinja_loader = ChoiceLoader([FileSystemLoader(str(tmp_path / 'templates')), app.jinja_loader])
+    return app
+
+
+def _compiled(app):
+    # the names of the templates the app's Jinja environment compiles from source from now on
+    names = []
+    compile_source = app.jinja_env.compile
+
+    def compile(source, name=None, filename=None, raw=False, defer_init=False):
+        names.append(name)
+        return compile_source(source, name, filename, raw, defer_init)
+    app.jinja_env.compile = compile
+    return names
+
+
+def test_a_changed_template_is_compiled_again(tmp_path):
+    (tmp_path / 'templates').mkdir()
+    (tmp_path / 'templates' / 'hello.html').write_text('version 1')
+    app = _app(tmp_path)
+    try:
+        with app.app_context():
+            count = template_cache.compile()
+        assert 'hello.html' in template_cache.names()
+        assert len(_bytecode_files(tmp_path / 'template_cache')) == count
+    finally:
+        teardown_app(app)
+
+    (tmp_path / 'templates' / 'hello.html').write_text('version 2')
+    restarted = _app(tmp_path)
+    # a new process after a deploy that edited hello.html
+    compiled = _compiled(restarted)
+    try:
+        env = restarted.jinja_env
+        assert env.get_template('hello.html').render() == 'version 2'
+        assert env.get_template('_post.html') is not None
+        assert compiled == ['hello.html']
+        # the unchanged template came from TEMPLATE_CACHE_DIR; the edited one was compiled, not served stale
+        assert len(_bytecode_files(tmp_path / 'template_cache')) == count
+    finally:
+        teardown_app(restarted)